@@ -0,0 +1,63 @@
+"""
+最小生成树的Numba内核
+在结构数组 (u, v, weights) 上运行Kruskal算法，避免逐边的Python方法调用
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _find(parent, x):
+        """查找根节点（迭代路径减半：每一步把节点指向祖父节点）"""
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    @njit(cache=True)
+    def _kruskal(u, v, order, parent, rank):
+        """
+        按order给出的边顺序执行Kruskal算法
+
+        Args:
+            u: 边起点数组 (E,)
+            v: 边终点数组 (E,)
+            order: 按权重升序排列的边下标 (E,)
+            parent: 并查集父节点数组，初始为 arange(N)，原地修改
+            rank: 并查集秩数组，初始为0，原地修改
+
+        Returns:
+            被选入MST的边下标 (M,) int32，M <= N - 1
+        """
+        target = max(parent.shape[0] - 1, 0)  # MST有n-1条边，达到后提前结束
+        mst_idx = np.empty(target, dtype=np.int32)
+        count = 0
+
+        for i in range(order.shape[0]):
+            if count == target:
+                break
+
+            e = order[i]
+            root_u = _find(parent, u[e])
+            root_v = _find(parent, v[e])
+            if root_u == root_v:
+                continue
+
+            # 按秩合并
+            if rank[root_u] < rank[root_v]:
+                root_u, root_v = root_v, root_u
+            parent[root_v] = root_u
+            if rank[root_u] == rank[root_v]:
+                rank[root_u] += 1
+
+            mst_idx[count] = e
+            count += 1
+
+        return mst_idx[:count]
@@ -4,13 +4,76 @@
 """
 
 import numpy as np
-from typing import Tuple, Union
+from typing import List, Optional, Tuple, Union
 import cv2
 
+from utils.memory_utils import aligned_empty
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # 模块级定义只编译一次，cache=True 将编译结果缓存到 __pycache__
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _texture_edge_weights(mean_map, std_map, range_map, src, dst):
+        """按边计算纹理特征 (均值, 标准差, 动态范围) 的欧氏距离"""
+        weights = np.empty(src.shape[0], dtype=np.float32)
+        for i in prange(src.shape[0]):
+            a = src[i]
+            b = dst[i]
+            d_mean = mean_map[a] - mean_map[b]
+            d_std = std_map[a] - std_map[b]
+            d_range = range_map[a] - range_map[b]
+            weights[i] = np.sqrt(d_mean * d_mean + d_std * d_std + d_range * d_range)
+        return weights
+else:
+    def _texture_edge_weights(mean_map, std_map, range_map, src, dst):
+        """按边计算纹理特征 (均值, 标准差, 动态范围) 的欧氏距离"""
+        d_mean = mean_map[src] - mean_map[dst]
+        d_std = std_map[src] - std_map[dst]
+        d_range = range_map[src] - range_map[dst]
+        return np.sqrt(d_mean * d_mean + d_std * d_std + d_range * d_range).astype(np.float32)
+
+
+def offset_slices(height: int, width: int, dr: int, dc: int) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+    """
+    计算偏移 (dr, dc) 下源像素区域与邻居像素区域的切片
+    
+    Args:
+        height: 图像高度
+        width: 图像宽度
+        dr: 行偏移
+        dc: 列偏移
+        
+    Returns:
+        (源区域切片, 邻居区域切片)，每项为 (行切片, 列切片)
+    """
+    src = (slice(max(0, -dr), height - max(0, dr)),
+           slice(max(0, -dc), width - max(0, dc)))
+    dst = (slice(max(0, dr), height - max(0, -dr)),
+           slice(max(0, dc), width - max(0, -dc)))
+    return src, dst
+
 
 class EdgeWeightCalculator:
     """边权重计算器"""
     
+    # 对三个颜色通道求和的变换矩阵 (cv2.transform)
+    _CHANNEL_SUM = np.ones((1, 3), dtype=np.float32)
+    
+    # 8位灰度值对应的LAB亮度（灰色像素的a、b恒为128，只有L参与颜色差异）
+    _GRAY_TO_LAB_L = cv2.cvtColor(
+        cv2.cvtColor(np.arange(256, dtype=np.uint8).reshape(1, 256), cv2.COLOR_GRAY2RGB),
+        cv2.COLOR_RGB2LAB
+    )[0, :, 0]
+    
+    # 逐边纹理距离内核（Numba可用时为编译后的函数）
+    _texture_kernel = staticmethod(_texture_edge_weights)
+    
     def __init__(self, alpha: float = 1.0, beta: float = 0.1, color_space: str = 'RGB'):
         """
         初始化边权重计算器
@@ -54,6 +117,148 @@ class EdgeWeightCalculator:
         
         return weight
     
+    def prepare_image(self, image: np.ndarray) -> np.ndarray:
+        """
+        将整幅图像一次性转换到当前颜色空间，供批量权重计算复用
+        
+        灰度图像保持单通道，转换为与“三通道复制成RGB”等价的单通道量，
+        颜色差异与复制后的结果一致，但不分配三倍大小的图像：
+        RGB下为 sqrt(3) * 灰度，HSV下为亮度V（即灰度），LAB下为亮度L。
+        
+        Args:
+            image: 输入RGB图像 (H, W, 3) 或灰度图像 (H, W)
+            
+        Returns:
+            转换后的float32图像
+        """
+        if self.color_space not in ('RGB', 'HSV', 'LAB'):
+            raise ValueError(f"不支持的颜色空间: {self.color_space}")
+        
+        scale = None
+        if image.ndim == 3 and self.color_space == 'HSV':
+            converted = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+        elif image.ndim == 3 and self.color_space == 'LAB':
+            converted = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
+        elif image.ndim == 2 and self.color_space == 'LAB':
+            if image.dtype == np.uint8:
+                converted = self._GRAY_TO_LAB_L[image]
+            else:
+                # 非8位灰度的a、b不严格为常数，按RGB转换以保持结果一致
+                converted = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB),
+                                         cv2.COLOR_RGB2LAB)
+        else:
+            converted = image
+            if image.ndim == 2 and self.color_space == 'RGB':
+                scale = np.float32(np.sqrt(3.0))
+        
+        if converted.dtype == np.float32 and scale is None:
+            return converted
+        
+        # 转换结果写入64字节对齐的缓冲区，便于后续OpenCV的SIMD运算
+        aligned = aligned_empty(converted.shape, np.float32)
+        aligned[...] = converted
+        if scale is not None:
+            aligned *= scale
+        return aligned
+    
+    def calculate_weights_batch(self,
+                                image: np.ndarray,
+                                offsets: List[Tuple[int, int]],
+                                converted: Optional[np.ndarray] = None) -> List[np.ndarray]:
+        """
+        批量计算各偏移方向上所有像素对的边权重
+        
+        对每个偏移 (dr, dc)，像素 (row, col) 与 (row+dr, col+dc) 之间的权重
+        位于返回数组的 (row - max(0, -dr), col - max(0, -dc)) 处。
+        
+        Args:
+            image: 输入图像 (H, W) 或 (H, W, C)
+            offsets: 邻接偏移量列表 [(dr, dc), ...]
+            converted: prepare_image的结果，None表示在此转换
+            
+        Returns:
+            权重图列表，与offsets一一对应
+        """
+        if converted is None:
+            converted = self.prepare_image(image)
+        
+        height, width = converted.shape[:2]
+        weight_maps = []
+        
+        for dr, dc in offsets:
+            # 有效区域：源像素及其偏移后的邻居都在图像内
+            src, dst = offset_slices(height, width, dr, dc)
+            color_diff = self._color_difference_batch(converted[src], converted[dst])
+            
+            # 同一偏移方向上的空间距离为常数
+            spatial_dist = np.sqrt(dr * dr + dc * dc)
+            weight_maps.append(
+                (self.alpha * color_diff + self.beta * spatial_dist).astype(np.float32, copy=False)
+            )
+        
+        return weight_maps
+    
+    def calculate_edge_weights(self,
+                               converted: np.ndarray,
+                               src: np.ndarray,
+                               dst: np.ndarray) -> np.ndarray:
+        """
+        按扁平像素索引批量计算任意像素对之间的边权重
+        
+        Args:
+            converted: prepare_image的结果 (H, W) 或 (H, W, C)
+            src: 第一个像素的扁平索引 (E,)
+            dst: 第二个像素的扁平索引 (E,)
+            
+        Returns:
+            边权重数组 (E,)
+        """
+        height, width = converted.shape[:2]
+        
+        # 视为 (N, 1) 的图像块，复用逐元素颜色差异计算
+        pixels = converted.reshape((height * width, 1) + converted.shape[2:])
+        color_diff = self._color_difference_batch(pixels[src], pixels[dst])[:, 0]
+        
+        src_row, src_col = np.divmod(src, width)
+        dst_row, dst_col = np.divmod(dst, width)
+        spatial_dist = np.hypot(src_row - dst_row, src_col - dst_col)
+        
+        return (self.alpha * color_diff + self.beta * spatial_dist).astype(np.float32, copy=False)
+    
+    def _color_difference_batch(self, block1: np.ndarray, block2: np.ndarray) -> np.ndarray:
+        """
+        逐元素计算两个已转换图像块之间的颜色差异
+        
+        Args:
+            block1: 第一个图像块（prepare_image的输出）
+            block2: 与block1形状相同的图像块
+            
+        Returns:
+            颜色差异图 (h, w)
+        """
+        if block1.size == 0:
+            # 空图像块（如单行/单列图像），OpenCV不接受空矩阵
+            return np.zeros(block1.shape[:2], dtype=np.float32)
+        
+        if block1.ndim == 2:
+            return cv2.absdiff(block1, block2)
+        
+        if self.color_space != 'HSV' and block1.shape[-1] == 3:
+            # OpenCV的SIMD算术直接写入输出缓冲区：|a-b|，逐元素平方，
+            # 通道求和（1x3全1矩阵的transform），原地开方
+            diff = cv2.absdiff(block1, block2)
+            cv2.multiply(diff, diff, dst=diff)
+            dist = cv2.transform(diff, self._CHANNEL_SUM)
+            return cv2.sqrt(dist, dst=dist).reshape(block1.shape[:-1])
+        
+        diff = block1 - block2
+        if self.color_space == 'HSV':
+            # 色调是周期量 (OpenCV中取值0-179)
+            hue_diff = np.abs(diff[..., 0])
+            diff[..., 0] = np.minimum(hue_diff, 180 - hue_diff)
+        
+        return np.sqrt(np.einsum('...c,...c->...', diff, diff))
+    
     def _color_difference(self, color1: np.ndarray, color2: np.ndarray) -> float:
         """
         计算颜色差异
@@ -76,7 +281,7 @@ class EdgeWeightCalculator:
     
     def _rgb_difference(self, color1: np.ndarray, color2: np.ndarray) -> float:
         """RGB颜色空间差异"""
-        return np.linalg.norm(color1.astype(float) - color2.astype(float))
+        return np.linalg.norm(color1.astype(np.float32, copy=False) - color2.astype(np.float32, copy=False))
     
     def _hsv_difference(self, color1: np.ndarray, color2: np.ndarray) -> float:
         """HSV颜色空间差异"""
@@ -84,6 +289,9 @@ class EdgeWeightCalculator:
         hsv1 = cv2.cvtColor(color1.reshape(1, 1, 3), cv2.COLOR_RGB2HSV)[0, 0]
         hsv2 = cv2.cvtColor(color2.reshape(1, 1, 3), cv2.COLOR_RGB2HSV)[0, 0]
         
+        hsv1 = hsv1.astype(np.float32)
+        hsv2 = hsv2.astype(np.float32)
+        
         # HSV差异计算（考虑色调的周期性）
         h_diff = min(abs(hsv1[0] - hsv2[0]), 180 - abs(hsv1[0] - hsv2[0]))
         s_diff = abs(hsv1[1] - hsv2[1])
@@ -98,7 +306,7 @@ class EdgeWeightCalculator:
         lab2 = cv2.cvtColor(color2.reshape(1, 1, 3), cv2.COLOR_RGB2LAB)[0, 0]
         
         # Delta E计算
-        return np.linalg.norm(lab1.astype(float) - lab2.astype(float))
+        return np.linalg.norm(lab1.astype(np.float32) - lab2.astype(np.float32))
     
     def _spatial_distance(self, pixel1: Tuple[int, int], pixel2: Tuple[int, int]) -> float:
         """
@@ -158,6 +366,88 @@ class EdgeWeightCalculator:
         # 计算纹理差异
         return np.linalg.norm(texture1 - texture2)
     
+    def calculate_gradient_weights_batch(self,
+                                         gradient: np.ndarray,
+                                         src: np.ndarray,
+                                         dst: np.ndarray) -> np.ndarray:
+        """
+        批量计算基于梯度的边权重
+        
+        Args:
+            gradient: 梯度图像 (H, W)
+            src: 边起点的扁平像素索引 (E,)
+            dst: 边终点的扁平像素索引 (E,)
+            
+        Returns:
+            边权重数组 (E,)
+        """
+        grad_flat = gradient.reshape(-1).astype(np.float32, copy=False)
+        return (grad_flat[src] + grad_flat[dst]) * np.float32(0.5)
+    
+    def calculate_texture_weights_batch(self,
+                                        image: np.ndarray,
+                                        src: np.ndarray,
+                                        dst: np.ndarray,
+                                        window_size: int = 3) -> np.ndarray:
+        """
+        批量计算基于纹理的边权重，与逐边调用calculate_texture_weight结果一致
+        
+        Args:
+            image: 输入图像
+            src: 边起点的扁平像素索引 (E,)
+            dst: 边终点的扁平像素索引 (E,)
+            window_size: 纹理窗口大小
+            
+        Returns:
+            边权重数组 (E,)
+        """
+        mean_map, std_map, range_map = self._precompute_texture_maps(image, window_size)
+        return self._texture_kernel(mean_map.ravel(), std_map.ravel(), range_map.ravel(),
+                                    np.ascontiguousarray(src), np.ascontiguousarray(dst))
+    
+    def _precompute_texture_maps(self,
+                                 image: np.ndarray,
+                                 window_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次性计算整幅图像的局部纹理特征图
+        
+        窗口在图像边界处截断，与_extract_texture_feature的取窗方式相同。
+        
+        Args:
+            image: 输入图像
+            window_size: 窗口大小
+            
+        Returns:
+            (均值图, 标准差图, 动态范围图)，均为float32 (H, W)
+        """
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = image
+        
+        ksize = (window_size, window_size)
+        # 平方和相减求方差时用float64累加，避免float32的精度抵消
+        gray_f = gray.astype(np.float64)
+        
+        # 零填充求和再除以窗口内的有效像素数，等价于截断窗口
+        window_sum = cv2.boxFilter(gray_f, -1, ksize, normalize=False,
+                                   borderType=cv2.BORDER_CONSTANT)
+        window_sqr_sum = cv2.sqrBoxFilter(gray_f, -1, ksize, normalize=False,
+                                          borderType=cv2.BORDER_CONSTANT)
+        window_count = cv2.boxFilter(np.ones_like(gray_f), -1, ksize, normalize=False,
+                                     borderType=cv2.BORDER_CONSTANT)
+        
+        mean_map = window_sum / window_count
+        variance = np.maximum(window_sqr_sum / window_count - mean_map ** 2, 0.0)
+        std_map = np.sqrt(variance)
+        
+        # 膨胀/腐蚀的默认边界值不参与极值计算
+        kernel = np.ones(ksize, np.uint8)
+        range_map = (cv2.dilate(gray, kernel).astype(np.float32) -
+                     cv2.erode(gray, kernel).astype(np.float32))
+        
+        return mean_map.astype(np.float32), std_map.astype(np.float32), range_map
+    
     def _extract_texture_feature(self, 
                                pixel: Tuple[int, int], 
                                image: np.ndarray, 
@@ -208,6 +498,54 @@ class AdaptiveWeightCalculator(EdgeWeightCalculator):
         super().__init__(alpha, beta, color_space)
         self.adaptive = adaptive
         
+        # prepare()缓存的整幅图像数据
+        self._converted = None
+        self._var = None
+        
+    def prepare(self,
+                image: np.ndarray,
+                local_variance: Optional[np.ndarray] = None,
+                window_size: int = 3):
+        """
+        预先计算颜色空间转换结果和局部方差图，供批量权重计算使用
+        
+        Args:
+            image: 输入图像
+            local_variance: 局部方差图，None表示由窗口内灰度方差计算
+            window_size: 计算局部方差的窗口大小
+        """
+        self._converted = self.prepare_image(image)
+        
+        if local_variance is None:
+            _, std_map, _ = self._precompute_texture_maps(image, window_size)
+            local_variance = std_map ** 2
+        
+        self._var = np.asarray(local_variance, dtype=np.float32).ravel()
+    
+    def calculate_adaptive_weights_batch(self,
+                                         src: np.ndarray,
+                                         dst: np.ndarray) -> np.ndarray:
+        """
+        批量计算自适应权重，结果与逐边调用calculate_adaptive_weight一致
+        
+        Args:
+            src: 第一个像素的扁平索引 (E,)
+            dst: 第二个像素的扁平索引 (E,)
+            
+        Returns:
+            自适应权重数组 (E,)
+        """
+        if self._converted is None:
+            raise RuntimeError("请先调用prepare(image)预计算图像数据")
+        
+        base_weights = self.calculate_edge_weights(self._converted, src, dst)
+        
+        if not self.adaptive:
+            return base_weights
+        
+        var = self._var
+        return base_weights * (1.0 + 0.5 * (var[src] + var[dst]) / 255.0)
+    
     def calculate_adaptive_weight(self, 
                                 pixel1: Tuple[int, int], 
                                 pixel2: Tuple[int, int], 
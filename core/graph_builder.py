@@ -6,11 +6,40 @@
 import numpy as np
 from typing import List, Tuple, Dict, Optional
 import cv2
-from .edge_weights import EdgeWeightCalculator
+import scipy.sparse as sp
+from .edge_weights import EdgeWeightCalculator, offset_slices
+
+
+def edge_line_points(src: np.ndarray, dst: np.ndarray, width: int) -> np.ndarray:
+    """
+    将扁平索引表示的边转换为cv2.polylines可直接绘制的线段端点
+    
+    Args:
+        src: 边起点的扁平像素索引 (E,)
+        dst: 边终点的扁平像素索引 (E,)
+        width: 图像宽度
+        
+    Returns:
+        线段端点数组 (E, 2, 2) int32，每个端点为 (col, row)
+    """
+    points = np.empty((len(src), 2, 2), dtype=np.int32)
+    points[:, 0, 1], points[:, 0, 0] = np.divmod(src, width)
+    points[:, 1, 1], points[:, 1, 0] = np.divmod(dst, width)
+    return points
 
 
 class PixelGraphBuilder:
-    """像素图构建器"""
+    """
+    像素图构建器
+    
+    图结构约定（MST等下游算法直接在这些数组上运行）：
+        edges: (E, 2) int32 ndarray，节点为像素扁平索引 row * width + col
+        edges_src / edges_dst: edges两列的视图 (E,)
+        weights: (E,) float32 ndarray，与edges逐行对应
+        csr: 带权对称邻接矩阵（边集合变化后通过get_adjacency重建），
+             indptr (N+1,) / indices (2E,) 为int32，节点i的邻居为
+             indices[indptr[i]:indptr[i + 1]]，data为对应边的权重
+    """
     
     def __init__(self, 
                  connectivity: int = 4,
@@ -39,71 +68,91 @@ class PixelGraphBuilder:
         """
         构建像素图
         
+        节点索引即像素的扁平索引 row * width + col，不再单独存储节点列表。
+        
         Args:
             image: 输入图像 (H, W, C)
             
         Returns:
-            图结构字典，包含节点、边和权重信息
+            图结构字典，包含边数组、权重数组和图像尺寸
         """
         height, width = image.shape[:2]
+        node_ids = np.arange(height * width, dtype=np.int32).reshape(height, width)
+        
+        # 只保留正向偏移，保证每条无向边只生成一次且 src < dst
+        forward_offsets = [(dr, dc) for dr, dc in self.offsets
+                           if dr > 0 or (dr == 0 and dc > 0)]
+        converted = self.weight_calculator.prepare_image(image)
+        weight_maps = self.weight_calculator.calculate_weights_batch(
+            image, forward_offsets, converted
+        )
+        
+        src_blocks, dst_blocks = [], []
+        for dr, dc in forward_offsets:
+            src, dst = offset_slices(height, width, dr, dc)
+            src_blocks.append(node_ids[src].ravel())
+            dst_blocks.append(node_ids[dst].ravel())
+        
+        num_edges = sum(block.size for block in src_blocks)
+        edges = np.empty((num_edges, 2), dtype=np.int32)
+        if num_edges > 0:
+            edges[:, 0] = np.concatenate(src_blocks)
+            edges[:, 1] = np.concatenate(dst_blocks)
+            weights = np.concatenate([w.ravel() for w in weight_maps]).astype(np.float32, copy=False)
+        else:
+            weights = np.empty(0, dtype=np.float32)
         
-        # 初始化图结构
         graph = {
-            'nodes': [],           # 节点列表 [(row, col), ...]
-            'edges': [],           # 边列表 [(node1_idx, node2_idx), ...]
-            'weights': [],         # 权重列表 [weight, ...]
-            'adjacency': {},       # 邻接表 {node_idx: [neighbor_idx, ...]}
-            'node_to_idx': {},     # 节点到索引的映射
+            'edges': edges,               # 边数组 (E, 2) int32
+            'edges_src': edges[:, 0],     # 边起点视图 (E,)
+            'edges_dst': edges[:, 1],     # 边终点视图 (E,)
+            'weights': weights,           # 权重数组 (E,) float32
+            'num_nodes': height * width,
             'image_shape': (height, width)
         }
-        
-        # 创建节点
-        node_idx = 0
-        for row in range(height):
-            for col in range(width):
-                node = (row, col)
-                graph['nodes'].append(node)
-                graph['node_to_idx'][node] = node_idx
-                graph['adjacency'][node_idx] = []
-                node_idx += 1
-        
-        # 创建边
-        edge_idx = 0
-        for row in range(height):
-            for col in range(width):
-                current_node = (row, col)
-                current_idx = graph['node_to_idx'][current_node]
-                
-                # 检查所有邻居
-                for dr, dc in self.offsets:
-                    neighbor_row, neighbor_col = row + dr, col + dc
-                    
-                    # 检查边界
-                    if (0 <= neighbor_row < height and 
-                        0 <= neighbor_col < width):
-                        
-                        neighbor_node = (neighbor_row, neighbor_col)
-                        neighbor_idx = graph['node_to_idx'][neighbor_node]
-                        
-                        # 避免重复边（只添加一个方向）
-                        if current_idx < neighbor_idx:
-                            # 计算边权重
-                            weight = self.weight_calculator.calculate_weight(
-                                current_node, neighbor_node, image
-                            )
-                            
-                            # 添加边
-                            graph['edges'].append((current_idx, neighbor_idx))
-                            graph['weights'].append(weight)
-                            
-                            # 更新邻接表
-                            graph['adjacency'][current_idx].append(neighbor_idx)
-                            graph['adjacency'][neighbor_idx].append(current_idx)
-                            
-                            edge_idx += 1
+        graph['csr'] = self._build_csr(graph)  # 带权对称邻接矩阵 (N, N)
         
         return graph
     
+    @staticmethod
+    def _build_csr(graph: Dict) -> sp.csr_matrix:
+        """由边数组构建带权的对称CSR邻接矩阵"""
+        num_nodes = graph['num_nodes']
+        src, dst = graph['edges_src'], graph['edges_dst']
+        weights = graph['weights']
+        coo = sp.coo_matrix(
+            (np.concatenate([weights, weights]),
+             (np.concatenate([src, dst]), np.concatenate([dst, src]))),
+            shape=(num_nodes, num_nodes)
+        )
+        return coo.tocsr()
+    
+    @staticmethod
+    def get_adjacency(graph: Dict) -> sp.csr_matrix:
+        """
+        获取图的CSR邻接矩阵（边集合变化后首次调用时重新构建）
+        
+        Args:
+            graph: 图结构
+            
+        Returns:
+            对称的CSR邻接矩阵，第i行的列索引即节点i的邻居，数据为边权重
+        """
+        csr = graph.get('csr')
+        if csr is None:
+            csr = PixelGraphBuilder._build_csr(graph)
+            graph['csr'] = csr
+        return csr
+    
+    @staticmethod
+    def _set_edges(graph: Dict, edges: np.ndarray, weights: np.ndarray):
+        """替换图的边集合并使缓存的邻接矩阵失效"""
+        graph['edges'] = edges
+        graph['edges_src'] = edges[:, 0]
+        graph['edges_dst'] = edges[:, 1]
+        graph['weights'] = weights
+        graph.pop('csr', None)
+    
     def build_sparse_graph(self, image: np.ndarray, 
                           threshold: float = None) -> Dict:
         """
@@ -120,28 +169,12 @@ class PixelGraphBuilder:
         graph = self.build_graph(image)
         
         if threshold is None:
-            # 自动计算阈值（使用权重的中位数）
+            # 自动计算阈值（使用权重的中位数，np.median内部基于partition，O(E)）
             threshold = np.median(graph['weights'])
         
-        # 过滤边
-        filtered_edges = []
-        filtered_weights = []
-        new_adjacency = {idx: [] for idx in range(len(graph['nodes']))}
-        
-        for i, (edge, weight) in enumerate(zip(graph['edges'], graph['weights'])):
-            if weight <= threshold:
-                filtered_edges.append(edge)
-                filtered_weights.append(weight)
-                
-                # 更新邻接表
-                node1_idx, node2_idx = edge
-                new_adjacency[node1_idx].append(node2_idx)
-                new_adjacency[node2_idx].append(node1_idx)
-        
-        # 更新图结构
-        graph['edges'] = filtered_edges
-        graph['weights'] = filtered_weights
-        graph['adjacency'] = new_adjacency
+        # 过滤边：先取保留边的下标，再用take按行收集，比二维布尔索引快
+        keep = np.flatnonzero(graph['weights'] <= threshold)
+        self._set_edges(graph, graph['edges'].take(keep, axis=0), graph['weights'].take(keep))
         graph['threshold'] = threshold
         
         return graph
@@ -163,48 +196,50 @@ class PixelGraphBuilder:
             增强的图结构
         """
         height, width = graph['image_shape']
+        total_pixels = height * width
         
         # 随机采样一些像素进行长距离连接
         sample_ratio = 0.1  # 采样10%的像素
-        total_pixels = height * width
         sample_size = int(total_pixels * sample_ratio)
         
         # 随机选择像素
         sampled_pixels = np.random.choice(total_pixels, sample_size, replace=False)
         
-        for pixel_idx in sampled_pixels:
-            row = pixel_idx // width
-            col = pixel_idx % width
-            current_node = (row, col)
-            current_idx = graph['node_to_idx'][current_node]
-            
-            # 在一定范围内寻找相似像素
-            for dr in range(-max_distance, max_distance + 1):
-                for dc in range(-max_distance, max_distance + 1):
-                    if dr == 0 and dc == 0:
-                        continue
-                        
-                    neighbor_row, neighbor_col = row + dr, col + dc
-                    
-                    if (0 <= neighbor_row < height and 
-                        0 <= neighbor_col < width):
-                        
-                        neighbor_node = (neighbor_row, neighbor_col)
-                        neighbor_idx = graph['node_to_idx'][neighbor_node]
-                        
-                        # 检查是否已经连接
-                        if neighbor_idx not in graph['adjacency'][current_idx]:
-                            # 计算相似性
-                            weight = self.weight_calculator.calculate_weight(
-                                current_node, neighbor_node, image
-                            )
-                            
-                            # 如果足够相似，添加连接
-                            if weight <= similarity_threshold:
-                                graph['edges'].append((current_idx, neighbor_idx))
-                                graph['weights'].append(weight)
-                                graph['adjacency'][current_idx].append(neighbor_idx)
-                                graph['adjacency'][neighbor_idx].append(current_idx)
+        # 窗口内的所有候选偏移（不含自身）
+        dr, dc = np.mgrid[-max_distance:max_distance + 1, -max_distance:max_distance + 1]
+        dr, dc = dr.ravel(), dc.ravel()
+        not_center = (dr != 0) | (dc != 0)
+        dr, dc = dr[not_center], dc[not_center]
+        
+        # 广播得到所有候选像素对，并去掉越界的邻居
+        rows, cols = np.divmod(sampled_pixels, width)
+        neighbor_rows = rows[:, None] + dr
+        neighbor_cols = cols[:, None] + dc
+        valid = ((neighbor_rows >= 0) & (neighbor_rows < height) &
+                 (neighbor_cols >= 0) & (neighbor_cols < width))
+        
+        src = np.broadcast_to(sampled_pixels[:, None], valid.shape)[valid].astype(np.int64)
+        dst = (neighbor_rows * width + neighbor_cols)[valid].astype(np.int64)
+        
+        # 用 (较小索引, 较大索引) 编码无向边，去掉已存在的连接和重复候选
+        low, high = np.minimum(src, dst), np.maximum(src, dst)
+        candidate_keys = low * total_pixels + high
+        existing_keys = (graph['edges_src'].astype(np.int64) * total_pixels +
+                         graph['edges_dst'].astype(np.int64))
+        candidate_keys, first = np.unique(candidate_keys, return_index=True)
+        is_new = ~np.isin(candidate_keys, existing_keys)
+        low, high = low[first][is_new], high[first][is_new]
+        
+        # 计算相似性，足够相似的像素对添加连接
+        converted = self.weight_calculator.prepare_image(image)
+        weights = self.weight_calculator.calculate_edge_weights(converted, low, high)
+        similar = weights <= similarity_threshold
+        
+        if np.any(similar):
+            new_edges = np.stack([low[similar], high[similar]], axis=1).astype(np.int32)
+            edges = np.concatenate([graph['edges'], new_edges])
+            weights = np.concatenate([graph['weights'], weights[similar]])
+            self._set_edges(graph, edges, weights)
         
         return graph
     
@@ -218,19 +253,25 @@ class PixelGraphBuilder:
         Returns:
             统计信息字典
         """
-        num_nodes = len(graph['nodes'])
+        num_nodes = graph['num_nodes']
         num_edges = len(graph['edges'])
-        weights = np.array(graph['weights'])
+        weights = graph['weights']
         
-        # 计算度分布
-        degrees = [len(neighbors) for neighbors in graph['adjacency'].values()]
+        # 计算度分布：有CSR时取每行的非零元个数，否则直接按边端点计数，
+        # 不必为统计重新构建CSR
+        csr = graph.get('csr')
+        if csr is not None:
+            degrees = np.diff(csr.indptr)
+        else:
+            degrees = (np.bincount(graph['edges_src'], minlength=num_nodes) +
+                       np.bincount(graph['edges_dst'], minlength=num_nodes))
         
         stats = {
             'num_nodes': num_nodes,
             'num_edges': num_edges,
-            'avg_degree': np.mean(degrees),
-            'max_degree': np.max(degrees),
-            'min_degree': np.min(degrees),
+            'avg_degree': degrees.mean(),
+            'max_degree': degrees.max(),
+            'min_degree': degrees.min(),
             'weight_mean': np.mean(weights),
             'weight_std': np.std(weights),
             'weight_min': np.min(weights),
@@ -260,16 +301,14 @@ class PixelGraphBuilder:
         height, width = graph['image_shape']
         
         if show_edges:
-            for i, (edge, weight) in enumerate(zip(graph['edges'], graph['weights'])):
-                if edge_threshold is None or weight <= edge_threshold:
-                    node1_idx, node2_idx = edge
-                    node1 = graph['nodes'][node1_idx]
-                    node2 = graph['nodes'][node2_idx]
-                    
-                    # 绘制边
-                    cv2.line(vis_image, 
-                            (node1[1], node1[0]),  # (col, row)
-                            (node2[1], node2[0]),  # (col, row)
-                            (0, 255, 0), 1)
+            src, dst = graph['edges_src'], graph['edges_dst']
+            if edge_threshold is not None:
+                keep = np.flatnonzero(graph['weights'] <= edge_threshold)
+                src, dst = src.take(keep), dst.take(keep)
+            
+            # 所有边一次性交给polylines绘制
+            if len(src) > 0:
+                cv2.polylines(vis_image, edge_line_points(src, dst, width),
+                              False, (0, 255, 0), 1)
         
         return vis_image
@@ -5,19 +5,57 @@ K-Means聚类图像分割算法
 
 import numpy as np
 import cv2
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.mixture import GaussianMixture
 import time
 from typing import Dict, Any, Optional, Tuple
 
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 from utils.logger import LoggerMixin, log_performance
+from utils.memory_utils import aligned_empty
 from utils.exceptions import AlgorithmError, ParameterError, validate_algorithm_parameters
 from data_structures.segmentation_result import SegmentationResult
 
 
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _assign_uint8(pixels, centers):
+        """按整数平方距离把uint8像素分配到最近的uint8聚类中心"""
+        n, c = pixels.shape
+        k = centers.shape[0]
+        labels = np.empty(n, dtype=np.int32)
+        for i in prange(n):
+            best = 0
+            best_dist = 1 << 30
+            for j in range(k):
+                dist = 0
+                for ch in range(c):
+                    d = np.int32(pixels[i, ch]) - np.int32(centers[j, ch])
+                    dist += d * d
+                if dist < best_dist:
+                    best_dist = dist
+                    best = j
+            labels[i] = best
+        return labels
+
+
 class KMeansSegmentation(LoggerMixin):
     """K-Means聚类分割算法"""
     
+    # 超过该像素数的图像使用面向大数据量的聚类实现
+    LARGE_IMAGE_PIXELS = 200_000
+    
     def __init__(self):
         super().__init__()
         self.algorithm_name = "K-Means"
@@ -30,6 +68,9 @@ class KMeansSegmentation(LoggerMixin):
                 color_space: str = 'RGB',
                 spatial_weight: float = 0.0,
                 random_state: int = 42,
+                use_sklearn: bool = False,
+                use_quantized: bool = False,
+                post_process: bool = True,
                 **kwargs) -> Dict[str, Any]:
         """
         执行K-Means分割
@@ -41,6 +82,10 @@ class KMeansSegmentation(LoggerMixin):
             color_space: 颜色空间 ('RGB', 'LAB', 'HSV')
             spatial_weight: 空间信息权重 (0.0-1.0)
             random_state: 随机种子
+            use_sklearn: 是否使用sklearn的KMeans（多次初始化，结果与旧版本一致）
+            use_quantized: 是否直接在uint8像素上做整数距离聚类（需要Numba，仅在RGB、
+                无空间权重的uint8图像上生效，中心取整，结果与浮点实现略有差异）
+            post_process: 是否对标签图做形态学平滑
             
         Returns:
             分割结果字典
@@ -51,21 +96,33 @@ class KMeansSegmentation(LoggerMixin):
             
             start_time = time.time()
             
-            # 预处理图像
-            processed_image = self._preprocess_image(image, color_space)
+            if (use_quantized and NUMBA_AVAILABLE and not use_sklearn and color_space == 'RGB'
+                    and spatial_weight <= 0 and image.dtype == np.uint8):
+                # 纯RGB颜色特征：直接在uint8像素上做整数距离聚类，跳过归一化
+                labels, centers = self._perform_quantized_clustering(
+                    image.reshape(-1, image.shape[2]), k, max_iter, random_state
+                )
+            else:
+                # 预处理图像
+                processed_image = self._preprocess_image(image, color_space)
+                
+                # 准备特征向量
+                features = self._prepare_features(processed_image, spatial_weight)
+                
+                # 执行K-Means聚类
+                labels, centers = self._perform_clustering(
+                    features, k, max_iter, random_state, use_sklearn
+                )
             
-            # 准备特征向量
-            features = self._prepare_features(processed_image, spatial_weight)
+            labels = labels.reshape(image.shape[:2])
             
-            # 执行K-Means聚类
-            labels, centers = self._perform_clustering(features, k, max_iter, random_state)
+            # 后处理（在单通道标签图上进行）
+            if post_process:
+                labels = self._post_process(labels)
             
             # 生成分割结果
             segmented_image = self._generate_segmented_image(labels, centers, image.shape)
             
-            # 后处理
-            segmented_image = self._post_process(segmented_image)
-            
             execution_time = time.time() - start_time
             
             # 创建结果对象
@@ -78,7 +135,10 @@ class KMeansSegmentation(LoggerMixin):
                     'max_iter': max_iter,
                     'color_space': color_space,
                     'spatial_weight': spatial_weight,
-                    'random_state': random_state
+                    'random_state': random_state,
+                    'use_sklearn': use_sklearn,
+                    'use_quantized': use_quantized,
+                    'post_process': post_process
                 },
                 execution_time=execution_time,
                 image_shape=image.shape
@@ -89,7 +149,7 @@ class KMeansSegmentation(LoggerMixin):
             return {
                 'segmented_image': segmented_image,
                 'num_segments': k,
-                'labels': labels.reshape(image.shape[:2]),
+                'labels': labels,
                 'centers': centers,
                 'execution_time': execution_time,
                 'algorithm': 'K-Means',
@@ -126,11 +186,12 @@ class KMeansSegmentation(LoggerMixin):
             # 转换到HSV颜色空间
             processed = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
         else:
-            # 保持RGB
-            processed = image.copy()
+            # 保持RGB（下面的astype会复制，无需先copy）
+            processed = image
         
-        # 归一化到0-1范围
-        processed = processed.astype(np.float32) / 255.0
+        # 归一化到0-1范围，float32上原地缩放，避免额外的临时数组
+        processed = processed.astype(np.float32)
+        processed *= 1.0 / 255.0
         
         return processed
     
@@ -138,76 +199,164 @@ class KMeansSegmentation(LoggerMixin):
         """准备特征向量"""
         h, w, c = image.shape
         
-        # 颜色特征
-        color_features = image.reshape(-1, c)
+        if spatial_weight <= 0:
+            # 颜色特征（reshape视图，不复制）
+            return image.reshape(-1, c)
         
-        if spatial_weight > 0:
-            # 添加空间特征
-            y_coords, x_coords = np.mgrid[0:h, 0:w]
-            
-            # 归一化空间坐标
-            x_coords = x_coords.astype(np.float32) / w
-            y_coords = y_coords.astype(np.float32) / h
-            
-            spatial_features = np.column_stack([
-                x_coords.ravel(),
-                y_coords.ravel()
-            ])
-            
-            # 组合颜色和空间特征
-            features = np.column_stack([
-                color_features,
-                spatial_features * spatial_weight
-            ])
-        else:
-            features = color_features
+        # 一次性分配（64字节对齐的）颜色+空间特征矩阵，避免column_stack产生的中间副本
+        features = aligned_empty((h * w, c + 2), np.float32)
+        features[:, :c] = image.reshape(-1, c)
+        
+        # 归一化空间坐标，通过广播直接写入
+        xs = np.arange(w, dtype=np.float32) * np.float32(spatial_weight / w)
+        ys = np.arange(h, dtype=np.float32) * np.float32(spatial_weight / h)
+        grid = features.reshape(h, w, c + 2)
+        grid[:, :, c] = xs[None, :]
+        grid[:, :, c + 1] = ys[:, None]
         
         return features
     
     def _perform_clustering(self, features: np.ndarray, k: int, 
-                          max_iter: int, random_state: int) -> Tuple[np.ndarray, np.ndarray]:
+                          max_iter: int, random_state: int,
+                          use_sklearn: bool = False) -> Tuple[np.ndarray, np.ndarray]:
         """执行K-Means聚类"""
-        kmeans = KMeans(
-            n_clusters=k,
-            max_iter=max_iter,
-            random_state=random_state,
-            n_init=10
+        is_large = features.shape[0] > self.LARGE_IMAGE_PIXELS
+        
+        if use_sklearn:
+            if is_large:
+                kmeans = MiniBatchKMeans(
+                    n_clusters=k,
+                    max_iter=max_iter,
+                    batch_size=10000,
+                    random_state=random_state,
+                    n_init=3
+                )
+            else:
+                kmeans = KMeans(
+                    n_clusters=k,
+                    max_iter=max_iter,
+                    random_state=random_state,
+                    n_init=10
+                )
+            
+            labels = kmeans.fit_predict(features)
+            centers = kmeans.cluster_centers_
+            
+            return labels, centers
+        
+        if is_large and FAISS_AVAILABLE:
+            return self._perform_faiss_clustering(features, k, max_iter, random_state)
+        
+        # OpenCV实现：k-means++初始化，只运行一次
+        cv2.setRNGSeed(random_state)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, max_iter, 1e-4)
+        _, labels, centers = cv2.kmeans(
+            np.ascontiguousarray(features, dtype=np.float32), k, None,
+            criteria, 1, cv2.KMEANS_PP_CENTERS
         )
         
-        labels = kmeans.fit_predict(features)
-        centers = kmeans.cluster_centers_
+        return labels.ravel(), centers
+    
+    def _perform_faiss_clustering(self, features: np.ndarray, k: int,
+                                  max_iter: int, random_state: int) -> Tuple[np.ndarray, np.ndarray]:
+        """使用FAISS执行K-Means聚类（大图像）"""
+        features = np.ascontiguousarray(features, dtype=np.float32)
         
-        return labels, centers
+        kmeans = faiss.Kmeans(features.shape[1], k, niter=max_iter, seed=random_state)
+        kmeans.train(features)
+        _, labels = kmeans.index.search(features, 1)
+        
+        return labels.ravel(), kmeans.centroids
+    
+    def _perform_quantized_clustering(self, pixels: np.ndarray, k: int,
+                                      max_iter: int, random_state: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在uint8像素上执行K-Means（需要Numba）
+        
+        分配步骤使用int32平方距离，聚类中心取整后仍保存为uint8，
+        中心不再变化即收敛。
+        
+        Args:
+            pixels: uint8像素矩阵 (N, C)
+            k: 聚类数量
+            max_iter: 最大迭代次数
+            random_state: 随机种子
+            
+        Returns:
+            (标签, 归一化到0-1的聚类中心)
+        """
+        rng = np.random.default_rng(random_state)
+        centers = self._init_centers_pp(pixels, k, rng)
+        
+        for _ in range(max_iter):
+            labels = _assign_uint8(pixels, centers)
+            
+            # 按标签累加各通道求新的中心，空簇保持原中心
+            counts = np.bincount(labels, minlength=k)
+            sums = np.stack([np.bincount(labels, weights=pixels[:, ch], minlength=k)
+                             for ch in range(pixels.shape[1])], axis=1)
+            new_centers = centers.copy()
+            nonempty = counts > 0
+            new_centers[nonempty] = np.rint(sums[nonempty] / counts[nonempty, None])
+            
+            if np.array_equal(new_centers, centers):
+                break
+            centers = new_centers
+        else:
+            labels = _assign_uint8(pixels, centers)
+        
+        return labels, centers.astype(np.float32) / 255.0
+    
+    def _init_centers_pp(self, pixels: np.ndarray, k: int,
+                         rng: np.random.Generator, sample_size: int = 10000) -> np.ndarray:
+        """在像素子样本上用k-means++选择初始中心"""
+        if len(pixels) > sample_size:
+            sample = pixels[rng.choice(len(pixels), sample_size, replace=False)]
+        else:
+            sample = pixels
+        sample = sample.astype(np.float32)
+        
+        centers = np.empty((k, sample.shape[1]), dtype=np.float32)
+        centers[0] = sample[rng.integers(len(sample))]
+        min_dist = np.sum((sample - centers[0]) ** 2, axis=1)
+        
+        for i in range(1, k):
+            total = min_dist.sum()
+            if total > 0:
+                idx = rng.choice(len(sample), p=min_dist / total)
+            else:
+                idx = rng.integers(len(sample))
+            centers[i] = sample[idx]
+            min_dist = np.minimum(min_dist, np.sum((sample - centers[i]) ** 2, axis=1))
+        
+        return centers.astype(np.uint8)
     
     def _generate_segmented_image(self, labels: np.ndarray, centers: np.ndarray, 
                                 image_shape: Tuple[int, int, int]) -> np.ndarray:
         """生成分割图像"""
         h, w, c = image_shape
         
-        # 只使用颜色部分的聚类中心
-        color_centers = centers[:, :3]
-        
-        # 将标签映射到颜色
-        segmented = color_centers[labels]
-        segmented = segmented.reshape(h, w, c)
+        # 只使用颜色部分的聚类中心，先转换为k×3的uint8查找表
+        lut = np.clip(centers[:, :3] * 255, 0, 255).astype(np.uint8)
         
-        # 转换回0-255范围
-        segmented = (segmented * 255).astype(np.uint8)
+        # 将标签直接映射到uint8颜色，不生成整幅float中间图像
+        segmented = lut[labels.reshape(h, w)]
         
         return segmented
     
-    def _post_process(self, image: np.ndarray) -> np.ndarray:
-        """后处理"""
-        # 可选的形态学操作
+    def _post_process(self, labels: np.ndarray) -> np.ndarray:
+        """后处理标签图 (H, W)"""
+        # 可选的形态学操作，k<=20 可直接用uint8表示标签
         kernel = np.ones((3, 3), np.uint8)
+        processed = labels.astype(np.uint8)
         
         # 开运算去除噪声
-        processed = cv2.morphologyEx(image, cv2.MORPH_OPEN, kernel)
+        processed = cv2.morphologyEx(processed, cv2.MORPH_OPEN, kernel)
         
         # 闭运算填充空洞
         processed = cv2.morphologyEx(processed, cv2.MORPH_CLOSE, kernel)
         
-        return processed
+        return processed.astype(labels.dtype)
 
 
 class GMMSegmentation(LoggerMixin):
@@ -225,6 +374,7 @@ class GMMSegmentation(LoggerMixin):
                 max_iter: int = 100,
                 color_space: str = 'RGB',
                 random_state: int = 42,
+                use_sklearn: bool = False,
                 **kwargs) -> Dict[str, Any]:
         """
         执行高斯混合模型分割
@@ -236,6 +386,7 @@ class GMMSegmentation(LoggerMixin):
             max_iter: 最大迭代次数
             color_space: 颜色空间
             random_state: 随机种子
+            use_sklearn: diag/spherical协方差时是否仍使用sklearn的GaussianMixture
             
         Returns:
             分割结果字典
@@ -254,7 +405,7 @@ class GMMSegmentation(LoggerMixin):
             
             # 执行GMM聚类
             labels, means = self._perform_gmm_clustering(
-                features, n_components, covariance_type, max_iter, random_state
+                features, n_components, covariance_type, max_iter, random_state, use_sklearn
             )
             
             # 生成分割结果
@@ -272,7 +423,8 @@ class GMMSegmentation(LoggerMixin):
                     'covariance_type': covariance_type,
                     'max_iter': max_iter,
                     'color_space': color_space,
-                    'random_state': random_state
+                    'random_state': random_state,
+                    'use_sklearn': use_sklearn
                 },
                 execution_time=execution_time,
                 image_shape=image.shape
@@ -320,15 +472,22 @@ class GMMSegmentation(LoggerMixin):
         elif color_space == 'HSV':
             processed = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
         else:
-            processed = image.copy()
+            processed = image
         
-        processed = processed.astype(np.float32) / 255.0
+        processed = processed.astype(np.float32)
+        processed *= 1.0 / 255.0
         return processed
     
     def _perform_gmm_clustering(self, features: np.ndarray, n_components: int,
                               covariance_type: str, max_iter: int, 
-                              random_state: int) -> Tuple[np.ndarray, np.ndarray]:
+                              random_state: int,
+                              use_sklearn: bool = False) -> Tuple[np.ndarray, np.ndarray]:
         """执行GMM聚类"""
+        if covariance_type in ('diag', 'spherical') and not use_sklearn:
+            return self._perform_diagonal_em(
+                features, n_components, covariance_type, max_iter, random_state
+            )
+        
         gmm = GaussianMixture(
             n_components=n_components,
             covariance_type=covariance_type,
@@ -341,17 +500,101 @@ class GMMSegmentation(LoggerMixin):
         
         return labels, means
     
+    def _perform_diagonal_em(self, features: np.ndarray, n_components: int,
+                             covariance_type: str, max_iter: int, random_state: int,
+                             tol: float = 1e-3, reg_covar: float = 1e-6) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对角/球形协方差GMM的EM实现
+        
+        对角协方差下各分量的对数概率只需两次 (K, D) x (D, N) 矩阵乘法；
+        响应度按 (K, N) 存储，logsumexp沿长度为K的轴做逐行运算，
+        比sklearn通用实现中 (N, K) 布局的小轴归约快得多。
+        初始化使用cv2.kmeans的硬标签，M步由np.bincount完成。
+        收敛判据与正则化参数同sklearn的默认值。
+        
+        Args:
+            features: 特征矩阵 (N, D)
+            n_components: 高斯分量数量
+            covariance_type: 'diag' 或 'spherical'
+            max_iter: 最大迭代次数
+            random_state: 随机种子
+            tol: 平均对数似然的收敛阈值
+            reg_covar: 方差正则项
+            
+        Returns:
+            (标签, 各分量均值)
+        """
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        n_samples, n_features = features.shape
+        
+        features_t = np.ascontiguousarray(features.T)  # (D, N)
+        features_sq_t = features_t * features_t
+        
+        def m_step(counts, sums, sq_sums):
+            means = sums / counts[:, None]
+            # 浮点抵消可能产生负数，截断为0后再加正则项
+            variances = np.maximum(sq_sums / counts[:, None] - means ** 2, 0.0)
+            if covariance_type == 'spherical':
+                variances = np.repeat(variances.mean(axis=1, keepdims=True), n_features, axis=1)
+            return counts / n_samples, means, variances + reg_covar
+        
+        def weighted_log_prob(weights, means, variances):
+            precisions = 1.0 / variances
+            const = (np.log(weights) - 0.5 * (np.sum(means ** 2 * precisions, axis=1) +
+                                              np.sum(np.log(variances), axis=1) +
+                                              n_features * np.log(2 * np.pi)))
+            log_prob = (-0.5 * precisions).astype(np.float32) @ features_sq_t
+            log_prob += (means * precisions).astype(np.float32) @ features_t
+            log_prob += const.astype(np.float32)[:, None]
+            return log_prob  # (K, N)
+        
+        # K-Means硬标签初始化
+        cv2.setRNGSeed(random_state)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-4)
+        _, labels, _ = cv2.kmeans(features, n_components, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+        labels = labels.ravel()
+        
+        eps = 10 * np.finfo(np.float32).eps
+        counts = np.bincount(labels, minlength=n_components) + eps
+        sums = np.stack([np.bincount(labels, weights=features_t[d], minlength=n_components)
+                         for d in range(n_features)], axis=1)
+        sq_sums = np.stack([np.bincount(labels, weights=features_sq_t[d], minlength=n_components)
+                            for d in range(n_features)], axis=1)
+        weights, means, variances = m_step(counts, sums, sq_sums)
+        
+        prev_lower_bound = -np.inf
+        for _ in range(max_iter):
+            # E步：原地计算归一化的响应度
+            resp = weighted_log_prob(weights, means, variances)
+            log_max = resp.max(axis=0)
+            resp -= log_max
+            np.exp(resp, out=resp)
+            norm = resp.sum(axis=0)
+            resp /= norm
+            lower_bound = float(np.mean(np.log(norm) + log_max))
+            
+            # M步
+            counts = resp.sum(axis=1, dtype=np.float64) + eps
+            sums = (resp @ features).astype(np.float64)
+            sq_sums = (resp @ features_sq_t.T).astype(np.float64)
+            weights, means, variances = m_step(counts, sums, sq_sums)
+            
+            if abs(lower_bound - prev_lower_bound) < tol:
+                break
+            prev_lower_bound = lower_bound
+        
+        labels = weighted_log_prob(weights, means, variances).argmax(axis=0)
+        
+        return labels, means
+    
     def _generate_segmented_image(self, labels: np.ndarray, means: np.ndarray,
                                 image_shape: Tuple[int, int, int]) -> np.ndarray:
         """生成分割图像"""
         h, w, c = image_shape
         
-        # 将标签映射到均值颜色
-        segmented = means[labels]
-        segmented = segmented.reshape(h, w, c)
-        
-        # 转换回0-255范围
-        segmented = (segmented * 255).astype(np.uint8)
+        # 均值颜色转换为uint8查找表，再按标签映射
+        lut = np.clip(means * 255, 0, 255).astype(np.uint8)
+        segmented = lut[labels.reshape(h, w)]
         
         return segmented
 
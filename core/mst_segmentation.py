@@ -5,7 +5,9 @@
 
 import numpy as np
 from typing import Dict, List, Tuple, Optional
+import hashlib
 import heapq
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 from pathlib import Path
@@ -14,9 +16,38 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from data_structures.union_find import SegmentationUnionFind, UnionFind
-from .graph_builder import PixelGraphBuilder
+from data_structures.union_find import SegmentationUnionFind
+from .graph_builder import PixelGraphBuilder, edge_line_points
 from .edge_weights import EdgeWeightCalculator
+from ._mst_numba import NUMBA_AVAILABLE
+
+if NUMBA_AVAILABLE:
+    from ._mst_numba import _kruskal
+
+
+def _stable_weight_order(weights: np.ndarray) -> np.ndarray:
+    """
+    返回按权重升序、权重相同时按下标升序的边顺序（等价于稳定argsort）
+    
+    非负float32的位模式与数值大小同序，把 (权重位模式, 下标) 打包成
+    uint64 键后做一次普通排序，比稳定argsort快得多。
+    
+    Args:
+        weights: 边权重数组 (E,)
+        
+    Returns:
+        边下标数组 (E,)
+    """
+    # 下标以int32返回，边数达到2^31时改用argsort（返回int64下标）
+    if (weights.dtype != np.float32 or len(weights) >= 1 << 31
+            or np.signbit(weights).any()):
+        return np.argsort(weights, kind='stable')
+    
+    keys = weights.view(np.uint32).astype(np.uint64) << np.uint64(32)
+    keys |= np.arange(len(weights), dtype=np.uint64)
+    keys.sort()
+    
+    return (keys & np.uint64(0xFFFFFFFF)).astype(np.int32)
 
 
 class MSTSegmentation:
@@ -39,6 +70,9 @@ class MSTSegmentation:
         self.min_segment_size = min_segment_size
         self.graph_builder = PixelGraphBuilder(connectivity, weight_calculator)
         
+        # 最近一幅图像的 (图像键, 像素图, MST)，同一图像重复分割时复用
+        self._graph_cache: Optional[Tuple[Tuple, Dict, Optional[Tuple[np.ndarray, np.ndarray]]]] = None
+        
     def segment(self,
                 image: np.ndarray,
                 threshold: float = None,
@@ -48,7 +82,8 @@ class MSTSegmentation:
         执行MST图像分割
 
         Args:
-            image: 输入图像 (H, W, C)
+            image: 输入图像 (H, W, C) 或灰度图像 (H, W)（按单通道处理，
+                   边权重与复制成三通道RGB时相同）
             threshold: 分割阈值，None表示自动计算
             adaptive_threshold: 是否使用自适应阈值
             progress_callback: 进度回调函数
@@ -67,20 +102,16 @@ class MSTSegmentation:
         if len(image.shape) < 2:
             raise ValueError("输入图像维度不足")
 
-        if len(image.shape) == 2:
-            # 灰度图像转为RGB
-            image = np.stack([image] * 3, axis=-1)
-
         height, width = image.shape[:2]
 
         try:
             # 1. 构建像素图
             self._safe_progress_callback(progress_callback, "构建像素图...", 0.1)
-            graph = self.graph_builder.build_graph(image)
+            graph = self._cached_build_graph(image)
 
             # 2. 构建最小生成树
             self._safe_progress_callback(progress_callback, "构建最小生成树...", 0.3)
-            mst_edges, mst_weights = self._build_mst(graph)
+            mst_edges, mst_weights = self._cached_build_mst(graph)
 
             # 3. 计算分割阈值
             if threshold is None:
@@ -88,7 +119,7 @@ class MSTSegmentation:
 
             # 验证阈值
             if threshold <= 0:
-                threshold = np.median(mst_weights) if mst_weights else 1.0
+                threshold = np.median(mst_weights) if len(mst_weights) > 0 else 1.0
 
             # 4. 基于阈值进行分割
             self._safe_progress_callback(progress_callback, f"使用阈值 {threshold:.2f} 进行分割...", 0.6)
@@ -118,42 +149,101 @@ class MSTSegmentation:
                 # 如果回调函数出错，记录但不中断主流程
                 print(f"进度回调函数错误: {e}")
 
-    def _build_mst(self, graph: Dict) -> Tuple[List, List]:
+    def _graph_params(self) -> Tuple:
+        """影响建图结果的参数：连通性、邻域偏移和边权重计算器的设置"""
+        builder = self.graph_builder
+        calculator = builder.weight_calculator
+        return (builder.connectivity, tuple(builder.offsets), type(calculator).__name__,
+                calculator.alpha, calculator.beta, calculator.color_space,
+                getattr(calculator, 'adaptive', None))
+    
+    def _cached_build_graph(self, image: np.ndarray) -> Dict:
         """
-        使用Kruskal算法构建最小生成树
+        构建像素图，若与上一次是同一幅图像和同样的建图参数则直接返回缓存的图
+        
+        以形状、数据类型、像素内容的哈希和建图参数作为键，哈希只需一次顺序读取，
+        远比重新构建图便宜，且图像被原地修改或参数被修改后不会误用旧结果。
         
         Args:
-            graph: 像素图结构
+            image: 输入图像
             
         Returns:
-            MST的边和权重列表
+            像素图结构
         """
-        # 创建边列表并按权重排序
-        edges_with_weights = list(zip(graph['edges'], graph['weights']))
-        edges_with_weights.sort(key=lambda x: x[1])  # 按权重排序
+        digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).digest()
+        key = (image.shape, image.dtype.str, digest, self._graph_params())
+        
+        if self._graph_cache is None or self._graph_cache[0] != key:
+            self._graph_cache = (key, self.graph_builder.build_graph(image), None)
+        
+        return self._graph_cache[1]
+    
+    def _cached_build_mst(self, graph: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """构建最小生成树，缓存中的图只计算一次"""
+        if self._graph_cache is None or self._graph_cache[1] is not graph:
+            return self._build_mst(graph)
         
-        # 初始化并查集
-        num_nodes = len(graph['nodes'])
-        uf = UnionFind(num_nodes)  # 使用基础并查集
+        key, cached_graph, mst = self._graph_cache
+        if mst is None:
+            mst = self._build_mst(graph)
+            self._graph_cache = (key, cached_graph, mst)
         
-        mst_edges = []
-        mst_weights = []
+        return mst
+    
+    def _build_mst(self, graph: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        使用Kruskal算法构建最小生成树
+        
+        Args:
+            graph: 像素图结构
+            
+        Returns:
+            MST的边数组 (M, 2) 和权重数组 (M,)，按权重升序排列
+        """
+        edges = graph['edges']
+        weights = graph['weights']
+        num_nodes = graph['num_nodes']
+        
+        # 按权重排序（在NumPy中完成，不生成(边, 权重)元组）
+        order = _stable_weight_order(weights)
+        
+        if NUMBA_AVAILABLE:
+            # 并查集使用紧凑数组，循环交给编译后的内核
+            parent = np.arange(num_nodes, dtype=np.int32)
+            rank = np.zeros(num_nodes, dtype=np.int8)
+            mst_idx = _kruskal(edges[:, 0], edges[:, 1], order, parent, rank)
+            return edges[mst_idx], weights[mst_idx]
+        
+        # 纯Python实现：列表并查集，查找内联为迭代路径减半
+        parent = list(range(num_nodes))
+        rank = [0] * num_nodes
+        mst_idx = []
+        target = num_nodes - 1  # MST有n-1条边，达到后提前结束
+        count = 0
         
         # Kruskal算法
-        for edge, weight in edges_with_weights:
-            node1, node2 = edge
+        for idx, (node1, node2) in zip(order.tolist(), edges[order].tolist()):
+            while parent[node1] != node1:
+                parent[node1] = parent[parent[node1]]
+                node1 = parent[node1]
+            while parent[node2] != node2:
+                parent[node2] = parent[parent[node2]]
+                node2 = parent[node2]
             
             # 如果两个节点不在同一连通分量中，添加这条边
-            if not uf.connected(node1, node2):
-                uf.union(node1, node2)
-                mst_edges.append(edge)
-                mst_weights.append(weight)
-                
-                # MST有n-1条边
-                if len(mst_edges) == num_nodes - 1:
+            if node1 != node2:
+                if rank[node1] < rank[node2]:
+                    node1, node2 = node2, node1
+                parent[node2] = node1
+                if rank[node1] == rank[node2]:
+                    rank[node1] += 1
+                mst_idx.append(idx)
+                count += 1
+                if count == target:
                     break
         
-        return mst_edges, mst_weights
+        mst_idx = np.array(mst_idx, dtype=np.int64)
+        return edges[mst_idx], weights[mst_idx]
     
     def _calculate_threshold(self, 
                            mst_weights: List[float], 
@@ -168,12 +258,15 @@ class MSTSegmentation:
         Returns:
             分割阈值
         """
-        weights = np.array(mst_weights)
+        weights = np.asarray(mst_weights, dtype=np.float64)
         
         if adaptive:
-            # 自适应阈值：使用权重分布的统计特性
-            mean_weight = np.mean(weights)
-            std_weight = np.std(weights)
+            # 自适应阈值：使用权重分布的统计特性。均值和方差由一遍求和与一次
+            # 点积（BLAS ddot）得到，float64累加避免 E[x^2] - E[x]^2 的精度损失
+            n = weights.size
+            mean_weight = weights.sum() / n
+            mean_square = np.dot(weights, weights) / n
+            std_weight = np.sqrt(max(mean_square - mean_weight * mean_weight, 0.0))
             
             # 使用均值加一个标准差作为阈值
             threshold = mean_weight + 0.5 * std_weight
@@ -185,8 +278,8 @@ class MSTSegmentation:
     
     def _threshold_segmentation(self, 
                               graph: Dict,
-                              mst_edges: List,
-                              mst_weights: List,
+                              mst_edges: np.ndarray,
+                              mst_weights: np.ndarray,
                               threshold: float,
                               height: int,
                               width: int) -> Dict:
@@ -195,8 +288,8 @@ class MSTSegmentation:
         
         Args:
             graph: 原始图结构
-            mst_edges: MST边列表
-            mst_weights: MST权重列表
+            mst_edges: MST边数组 (M, 2)
+            mst_weights: MST权重数组 (M,)
             threshold: 分割阈值
             height: 图像高度
             width: 图像宽度
@@ -207,16 +300,16 @@ class MSTSegmentation:
         # 初始化分割并查集
         seg_uf = SegmentationUnionFind(height, width)
         
-        # 只保留权重小于阈值的边
-        valid_edges = []
-        for edge, weight in zip(mst_edges, mst_weights):
-            if weight <= threshold:
-                node1, node2 = edge
-                pixel1 = graph['nodes'][node1]
-                pixel2 = graph['nodes'][node2]
-                
-                seg_uf.union_pixels(pixel1, pixel2, weight)
-                valid_edges.append((edge, weight))
+        # 只保留权重小于阈值的边：一次比较得到下标，再按下标收集
+        mst_edges = np.asarray(mst_edges).reshape(-1, 2)
+        mst_weights = np.asarray(mst_weights)
+        keep = np.flatnonzero(mst_weights <= threshold)
+        kept_edges = mst_edges.take(keep, axis=0)
+        kept_weights = mst_weights.take(keep)
+        
+        # 图节点即并查集中的行优先像素索引，无需再转换为行列坐标
+        seg_uf.union_batch(kept_edges[:, 0], kept_edges[:, 1], kept_weights)
+        valid_edges = list(zip(map(tuple, kept_edges.tolist()), kept_weights.tolist()))
         
         # 获取分割结果
         label_map = seg_uf.get_segmentation_map()
@@ -247,39 +340,90 @@ class MSTSegmentation:
         seg_uf = segmentation_result['union_find']
         
         # 合并小区域
-        seg_uf.merge_small_segments(self.min_segment_size, graph['adjacency'])
+        adjacency = self.graph_builder.get_adjacency(graph)
+        seg_uf.merge_small_segments(self.min_segment_size, adjacency)
         
         # 更新分割结果
         segmentation_result['label_map'] = seg_uf.get_segmentation_map()
         segmentation_result['statistics'] = seg_uf.get_segment_statistics()
     
+    def _segment_at_threshold(self,
+                              graph: Dict,
+                              mst_edges: np.ndarray,
+                              mst_weights: np.ndarray,
+                              threshold: float,
+                              height: int,
+                              width: int) -> Dict:
+        """
+        在单个阈值下完成分割和后处理
+        
+        每次调用都分配独立的SegmentationUnionFind，图和MST只读，
+        因此可以在多个线程中并发执行。
+        
+        Args:
+            graph: 原始图结构（只读）
+            mst_edges: MST边数组 (M, 2)
+            mst_weights: MST权重数组 (M,)
+            threshold: 分割阈值
+            height: 图像高度
+            width: 图像宽度
+            
+        Returns:
+            分割结果
+        """
+        result = self._threshold_segmentation(
+            graph, mst_edges, mst_weights, threshold, height, width
+        )
+        self._post_process_segments(result, graph)
+        return result
+    
     def segment_with_multiple_thresholds(self, 
                                        image: np.ndarray,
-                                       thresholds: List[float]) -> Dict:
+                                       thresholds: List[float],
+                                       max_workers: Optional[int] = 1) -> Dict:
         """
         使用多个阈值进行分割，用于比较分析
         
+        各阈值的分割互不依赖，可以提交到线程池并发执行。并查集内核运行时持有GIL，
+        多线程往往没有收益，因此默认串行，需要时显式开启。
+        
         Args:
             image: 输入图像
             thresholds: 阈值列表
+            max_workers: 最大线程数，1表示串行，None表示每个阈值一个线程（不超过CPU核数）
             
         Returns:
             多阈值分割结果
         """
         height, width = image.shape[:2]
         
-        # 构建图和MST（只需要一次）
-        graph = self.graph_builder.build_graph(image)
-        mst_edges, mst_weights = self._build_mst(graph)
+        # 构建图和MST（只需要一次，同一图像的后续调用直接复用）
+        graph = self._cached_build_graph(image)
+        mst_edges, mst_weights = self._cached_build_mst(graph)
+        
+        # 提前构建邻接矩阵，避免多个线程同时惰性构建并写入graph
+        self.graph_builder.get_adjacency(graph)
         
         results = {}
         
-        for threshold in thresholds:
-            result = self._threshold_segmentation(
-                graph, mst_edges, mst_weights, threshold, height, width
-            )
-            self._post_process_segments(result, graph)
-            results[threshold] = result
+        if len(thresholds) <= 1 or max_workers == 1:
+            for threshold in thresholds:
+                results[threshold] = self._segment_at_threshold(
+                    graph, mst_edges, mst_weights, threshold, height, width
+                )
+        else:
+            if max_workers is None:
+                max_workers = min(len(thresholds), os.cpu_count() or 1)
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(self._segment_at_threshold, graph,
+                                    mst_edges, mst_weights, threshold, height, width)
+                    for threshold in thresholds
+                ]
+                # 按阈值原顺序收集结果
+                for threshold, future in zip(thresholds, futures):
+                    results[threshold] = future.result()
         
         return {
             'results': results,
@@ -290,22 +434,24 @@ class MSTSegmentation:
     
     def get_segmentation_hierarchy(self, 
                                  image: np.ndarray,
-                                 num_levels: int = 5) -> Dict:
+                                 num_levels: int = 5,
+                                 max_workers: Optional[int] = 1) -> Dict:
         """
         获取分割层次结构（不同粒度的分割）
         
         Args:
             image: 输入图像
             num_levels: 层次数量
+            max_workers: 各层分割的最大线程数，含义同segment_with_multiple_thresholds
             
         Returns:
             层次分割结果
         """
         height, width = image.shape[:2]
         
-        # 构建图和MST
-        graph = self.graph_builder.build_graph(image)
-        mst_edges, mst_weights = self._build_mst(graph)
+        # 构建图和MST（下面的多阈值分割会复用缓存）
+        graph = self._cached_build_graph(image)
+        mst_edges, mst_weights = self._cached_build_mst(graph)
         
         # 计算不同层次的阈值
         weights = np.array(mst_weights)
@@ -315,22 +461,22 @@ class MSTSegmentation:
         thresholds = np.linspace(min_weight, max_weight, num_levels)
         
         # 执行多阈值分割
-        hierarchy_results = self.segment_with_multiple_thresholds(image, thresholds)
+        hierarchy_results = self.segment_with_multiple_thresholds(image, thresholds, max_workers)
         
         return hierarchy_results
     
     def visualize_mst(self, 
                      image: np.ndarray, 
-                     mst_edges: List,
-                     mst_weights: List,
+                     mst_edges: np.ndarray,
+                     mst_weights: np.ndarray,
                      threshold: float = None) -> np.ndarray:
         """
         可视化最小生成树
         
         Args:
             image: 原始图像
-            mst_edges: MST边列表
-            mst_weights: MST权重列表
+            mst_edges: MST边数组 (M, 2)
+            mst_weights: MST权重数组 (M,)
             threshold: 显示阈值，只显示权重小于此值的边
             
         Returns:
@@ -339,24 +485,29 @@ class MSTSegmentation:
         import cv2
         
         vis_image = image.copy()
-        graph = self.graph_builder.build_graph(image)
-        
-        for edge, weight in zip(mst_edges, mst_weights):
-            if threshold is None or weight <= threshold:
-                node1, node2 = edge
-                pixel1 = graph['nodes'][node1]
-                pixel2 = graph['nodes'][node2]
-                
-                # 根据权重设置颜色（权重越大颜色越红）
-                if threshold is not None:
-                    color_intensity = int(255 * (weight / threshold))
-                    color = (0, 255 - color_intensity, color_intensity)
-                else:
-                    color = (0, 255, 0)
-                
-                cv2.line(vis_image,
-                        (pixel1[1], pixel1[0]),  # (col, row)
-                        (pixel2[1], pixel2[0]),  # (col, row)
-                        color, 1)
+        width = image.shape[1]
+        
+        mst_edges = np.asarray(mst_edges).reshape(-1, 2)
+        mst_weights = np.asarray(mst_weights)
+        
+        if threshold is None:
+            if len(mst_edges) > 0:
+                points = edge_line_points(mst_edges[:, 0], mst_edges[:, 1], width)
+                cv2.polylines(vis_image, points, False, (0, 255, 0), 1)
+            return vis_image
+        
+        keep = np.flatnonzero(mst_weights <= threshold)
+        points = edge_line_points(mst_edges[keep, 0], mst_edges[keep, 1], width)
+        
+        # 根据权重设置颜色（权重越大颜色越红），同色的边一次polylines绘制。
+        # 按颜色强度升序逐组绘制，与按权重升序逐边绘制时端点像素的覆盖结果一致
+        intensity = (255 * (mst_weights[keep].astype(np.float64) / threshold)).astype(np.int64)
+        order = np.argsort(intensity, kind='stable')
+        levels, starts = np.unique(intensity[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        
+        for level, start, end in zip(levels.tolist(), starts.tolist(), ends.tolist()):
+            cv2.polylines(vis_image, points[order[start:end]], False,
+                          (0, 255 - level, level), 1)
         
         return vis_image
@@ -6,8 +6,9 @@ Watershed图像分割算法实现
 import numpy as np
 import cv2
 from scipy import ndimage
-from skimage import segmentation, feature, filters, morphology
+from skimage import feature, filters, morphology
 from skimage.segmentation import watershed
+from skimage.util import img_as_ubyte
 from typing import Dict, Optional, Tuple, Any, Callable
 import time
 
@@ -23,18 +24,26 @@ except ImportError:
             """
             Fallback implementation for peak_local_maxima
             """
-            from scipy.ndimage import maximum_filter
-
-            # Apply maximum filter
-            local_maxima = maximum_filter(image, size=min_distance) == image
+            # Grayscale dilation with a rectangular kernel is a maximum filter
+            image = np.asarray(image, dtype=np.float32)
+            size = max(1, int(min_distance))
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+            local_maxima = cv2.dilate(image, kernel) == image
 
             # Apply threshold if provided
             if threshold_abs is not None:
-                local_maxima = local_maxima & (image >= threshold_abs)
+                local_maxima &= image >= threshold_abs
 
             # Return coordinates as tuple of arrays (similar to original function)
-            coords = np.where(local_maxima)
-            return coords
+            return np.nonzero(local_maxima)
+
+# 可选的GPU分水岭（cuCIM提供与skimage接口一致的GPU实现）
+try:
+    import cupy as cp
+    from cucim.skimage import segmentation as cucim_segmentation
+    CUCIM_AVAILABLE = hasattr(cucim_segmentation, 'watershed')
+except ImportError:
+    CUCIM_AVAILABLE = False
 
 from data_structures.segmentation_result import SegmentationResult
 
@@ -50,12 +59,15 @@ class WatershedSegmentation:
     3. 标记点检测：找到局部最小值作为种子点
     4. 分水岭变换：模拟水流填充过程
     5. 后处理：合并小区域、优化边界
+    
+    实例缓存了CLAHE等OpenCV对象，不是线程安全的，多线程时每个线程使用独立实例。
     """
     
     def __init__(self, 
                  min_distance: int = 20,
                  compactness: float = 0.001,
-                 watershed_line: bool = True):
+                 watershed_line: bool = True,
+                 use_gpu: bool = False):
         """
         初始化Watershed分割器
         
@@ -63,10 +75,19 @@ class WatershedSegmentation:
             min_distance: 局部最大值之间的最小距离
             compactness: 分水岭的紧凑性参数
             watershed_line: 是否在分割边界添加分水岭线
+            use_gpu: 是否使用cuCIM在GPU上执行分水岭变换（不可用时回退到CPU）
         """
         self.min_distance = min_distance
         self.compactness = compactness
         self.watershed_line = watershed_line
+        self.use_gpu = use_gpu and CUCIM_AVAILABLE
+        
+        # 标记点扩展使用的disk(2)结构元素（固定不变，只生成一次）
+        self._disk2_kernel = morphology.disk(2).astype(np.uint8)
+        
+        # 对比度增强使用的CLAHE对象（参数固定，跨调用复用；内部持有缓冲区，
+        # 因此同一实例不能在多个线程中同时调用segment）
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         
         # 统计信息
         self.processing_stats = {
@@ -86,7 +107,7 @@ class WatershedSegmentation:
         执行Watershed分割
         
         Args:
-            image: 输入图像 (H, W, 3) 或 (H, W)
+            image: 输入图像 (H, W, 3) 或 (H, W)，不会被修改
             markers: 可选的标记图像，如果为None则自动生成
             progress_callback: 进度回调函数
             
@@ -96,15 +117,21 @@ class WatershedSegmentation:
         start_time = time.time()
         
         try:
-            # 确保图像格式正确
-            if len(image.shape) == 3:
+            # 确保图像格式正确：后续的双边滤波和CLAHE都要求连续的uint8灰度图。
+            # 其他类型按各自的取值范围显式缩放到uint8（浮点图像须在[0, 1]内，
+            # 超出范围时抛出ValueError），不做截断或取模
+            uint8_image = image if image.dtype == np.uint8 else img_as_ubyte(image)
+            
+            # 各处理步骤都不会原地修改输入，已是连续uint8的灰度图可直接使用
+            if len(uint8_image.shape) == 3:
                 # 转换为灰度图像
-                if image.shape[2] == 3:
-                    gray_image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+                if uint8_image.shape[2] == 3:
+                    gray_image = cv2.cvtColor(uint8_image, cv2.COLOR_RGB2GRAY)
                 else:
-                    gray_image = image[:, :, 0]
+                    gray_image = uint8_image[:, :, 0]
             else:
-                gray_image = image.copy()
+                gray_image = uint8_image
+            gray_image = np.ascontiguousarray(gray_image)
             
             height, width = gray_image.shape
             self._safe_progress_callback(progress_callback, "开始Watershed分割...", 0.0)
@@ -170,8 +197,7 @@ class WatershedSegmentation:
         denoised = cv2.bilateralFilter(image, 9, 75, 75)
         
         # 增强对比度
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised)
+        enhanced = self._clahe.apply(denoised)
         
         self.processing_stats['preprocessing_time'] = time.time() - start_time
         return enhanced
@@ -180,14 +206,13 @@ class WatershedSegmentation:
         """计算图像梯度"""
         start_time = time.time()
         
-        # 使用Sobel算子计算梯度
-        grad_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
-        gradient = np.sqrt(grad_x**2 + grad_y**2)
+        # 使用Sobel算子计算梯度（float32即可满足精度，cv2.magnitude一次算出幅值）
+        grad_x = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+        gradient = cv2.magnitude(grad_x, grad_y)
         
         # 归一化到0-255范围
-        gradient = ((gradient - gradient.min()) / 
-                   (gradient.max() - gradient.min()) * 255).astype(np.uint8)
+        gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
         
         self.processing_stats['gradient_time'] = time.time() - start_time
         return gradient
@@ -208,13 +233,15 @@ class WatershedSegmentation:
             threshold_abs=0.3 * distance.max()
         )
         
-        # 3. 创建标记图像
+        # 3. 创建标记图像：按检测顺序为每个峰值分配标签 1..n，一次散射写入
+        ys, xs = local_maxima[0], local_maxima[1]
         markers = np.zeros_like(image, dtype=np.int32)
-        for i, (y, x) in enumerate(zip(local_maxima[0], local_maxima[1])):
-            markers[y, x] = i + 1
+        markers[ys, xs] = np.arange(1, len(ys) + 1, dtype=np.int32)
         
-        # 4. 扩展标记点
-        markers = morphology.dilation(markers, morphology.disk(2))
+        # 4. 扩展标记点：cv2.dilate不支持int32，标签数不超过65535时用uint16
+        #    （SIMD最快），否则用float64（整数标签可精确表示）
+        work_dtype = np.uint16 if len(local_maxima[0]) <= np.iinfo(np.uint16).max else np.float64
+        markers = cv2.dilate(markers.astype(work_dtype), self._disk2_kernel).astype(np.int32)
         
         self.processing_stats['markers_time'] = time.time() - start_time
         return markers
@@ -223,13 +250,15 @@ class WatershedSegmentation:
         """处理用户提供的标记点"""
         start_time = time.time()
         
-        # 确保标记点是连续的整数
-        unique_labels = np.unique(markers)
-        processed_markers = np.zeros_like(markers, dtype=np.int32)
+        # 确保标记点是连续的整数：np.unique的逆映射即每个像素的标签序号，
+        # 减去非正标签（背景）的个数后正标签映射为 1..k，背景截断为0
+        markers = np.asarray(markers)
+        unique_labels, inverse = np.unique(markers, return_inverse=True)
+        num_background = int(np.searchsorted(unique_labels, 0, side='right'))
         
-        for i, label in enumerate(unique_labels):
-            if label > 0:  # 跳过背景
-                processed_markers[markers == label] = i + 1
+        processed_markers = inverse.reshape(markers.shape).astype(np.int32, copy=False)
+        processed_markers += 1 - num_background
+        np.maximum(processed_markers, 0, out=processed_markers)
         
         self.processing_stats['markers_time'] = time.time() - start_time
         return processed_markers
@@ -239,12 +268,21 @@ class WatershedSegmentation:
         start_time = time.time()
         
         # 执行分水岭变换
-        labels = watershed(
-            gradient, 
-            markers, 
-            compactness=self.compactness,
-            watershed_line=self.watershed_line
-        )
+        if self.use_gpu:
+            # 梯度(uint8)和标记(int32)上传开销很小，洪水填充在GPU上按盆地并行
+            labels = cp.asnumpy(cucim_segmentation.watershed(
+                cp.asarray(gradient),
+                cp.asarray(markers),
+                compactness=self.compactness,
+                watershed_line=self.watershed_line
+            ))
+        else:
+            labels = watershed(
+                gradient, 
+                markers, 
+                compactness=self.compactness,
+                watershed_line=self.watershed_line
+            )
         
         self.processing_stats['watershed_time'] = time.time() - start_time
         return labels
@@ -253,15 +291,16 @@ class WatershedSegmentation:
         """后处理标签图像"""
         start_time = time.time()
         
-        # 移除小区域
+        # 移除小区域并重新标记为连续编号：按标签统计像素数，构建查找表
+        # （过小的区域和背景映射为0，其余依次映射为 1..k），一次索引完成
         min_size = max(50, (labels.shape[0] * labels.shape[1]) // 1000)
-        cleaned_labels = morphology.remove_small_objects(
-            labels.astype(bool), 
-            min_size=min_size
-        ).astype(np.int32)
+        sizes = np.bincount(labels.ravel())
+        keep = sizes >= min_size
+        keep[0] = False
         
-        # 重新标记连续区域
-        final_labels = segmentation.relabel_sequential(cleaned_labels)[0]
+        lut = np.cumsum(keep, dtype=np.int32)
+        lut[~keep] = 0
+        final_labels = lut[labels]
         
         self.processing_stats['postprocessing_time'] = time.time() - start_time
         return final_labels
@@ -286,6 +325,8 @@ class WatershedSegmentation:
             self.compactness = max(0.0, float(kwargs['compactness']))
         if 'watershed_line' in kwargs:
             self.watershed_line = bool(kwargs['watershed_line'])
+        if 'use_gpu' in kwargs:
+            self.use_gpu = bool(kwargs['use_gpu']) and CUCIM_AVAILABLE
     
     def get_parameters(self) -> Dict[str, Any]:
         """获取当前算法参数"""
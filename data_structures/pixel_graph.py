@@ -6,13 +6,35 @@
 import numpy as np
 from typing import Dict, List, Tuple, Set, Optional
 import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components, laplacian
 from collections import defaultdict
 
 
+
+def _csr_from_arrays(data: np.ndarray, indices: np.ndarray, indptr: np.ndarray,
+                     shape: Tuple[int, int]) -> sp.csr_matrix:
+    """
+    由已知合法的CSR数组构建矩阵（不复制数组）
+    
+    调用方保证每行的列索引严格递增（有序且无重复），直接标记为规范格式，
+    之后的稀疏运算不再逐元素检查排序和重复项。
+    """
+    matrix = sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    matrix.has_sorted_indices = True
+    matrix.has_canonical_format = True
+    return matrix
+
 class PixelGraph:
-    """像素关系图数据结构"""
+    """
+    像素关系图数据结构
+    
+    节点为行优先的像素索引，边以 (src, dst, weight) 数组存储，
+    邻接关系通过CSR矩阵 (weight_matrix) 查询；adjacency_list和
+    edge_weights是按需展开的只读视图。
+    """
     
-    def __init__(self, height: int, width: int, connectivity: int = 4):
+    def __init__(self, height: int, width: int, connectivity: int = 4,
+                 feature_dim: Optional[int] = None):
         """
         初始化像素图
         
@@ -20,35 +42,151 @@ class PixelGraph:
             height: 图像高度
             width: 图像宽度
             connectivity: 连接性 (4 或 8)
+            feature_dim: 节点特征维度，None表示在首次设置特征时确定
         """
         self.height = height
         self.width = width
         self.connectivity = connectivity
         self.num_pixels = height * width
         
-        # 像素坐标到索引的映射
-        self.coord_to_idx = {}
-        self.idx_to_coord = {}
-        self._build_coordinate_mapping()
-        
-        # 图结构存储
-        self.adjacency_list = defaultdict(list)  # 邻接表
-        self.edge_weights = {}  # 边权重
-        self.node_features = {}  # 节点特征
+        # 像素索引按行优先排列 idx = row * width + col，坐标与索引直接换算
+        
+        # 图结构存储：每条无向边保存一次 (src <= dst)，按数组存放
+        self._src = np.empty(0, dtype=np.int32)
+        self._dst = np.empty(0, dtype=np.int32)
+        self._weights = np.empty(0, dtype=np.float32)
+        # add_edge逐条追加的边，以无向边键 min_idx * num_pixels + max_idx 记录，
+        # 下次访问图结构时一次性并入数组
+        self._pending_keys = []
+        self._pending_weights = []
+        # 节点特征：(N, D) float32 数组，第idx行为像素idx的特征，
+        # _has_feature标记哪些节点已设置特征
+        self.node_features = None
+        self._has_feature = np.zeros(self.num_pixels, dtype=bool)
+        if feature_dim is not None:
+            self.node_features = np.zeros((self.num_pixels, feature_dim), dtype=np.float32)
+        
+        # 稀疏矩阵表示（用于高效计算，边集合变化后按需重建）
+        self.adjacency_matrix = None
+        self.weight_matrix = None
         
-        # 稀疏矩阵表示（用于高效计算）
+    def _c2i(self, pixel: Tuple[int, int]) -> int:
+        """像素坐标转换为索引，坐标超出图像范围时抛出IndexError"""
+        row, col = pixel
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise IndexError(f"像素坐标超出图像范围: {pixel}")
+        return row * self.width + col
+    
+    def _i2c(self, idx: int) -> Tuple[int, int]:
+        """像素索引转换为坐标"""
+        return divmod(idx, self.width)
+    
+    def _set_edge_arrays(self, src: np.ndarray, dst: np.ndarray, weights: np.ndarray):
+        """替换边数组并使稀疏矩阵失效"""
+        self._src = np.asarray(src, dtype=np.int32)
+        self._dst = np.asarray(dst, dtype=np.int32)
+        self._weights = np.asarray(weights, dtype=np.float32)
         self.adjacency_matrix = None
         self.weight_matrix = None
+    
+    def _edge_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        获取边数组 (src, dst, weights)，先并入add_edge追加的边
+        
+        重复添加的边只保留最后一次的权重，与按边键存储字典时的语义一致。
+        """
+        if self._pending_keys:
+            keys = np.concatenate([self._src.astype(np.int64) * self.num_pixels + self._dst,
+                                   np.array(self._pending_keys, dtype=np.int64)])
+            weights = np.concatenate([self._weights,
+                                      np.array(self._pending_weights, dtype=np.float32)])
+            self._pending_keys, self._pending_weights = [], []
+            
+            # 反转后np.unique取到的首次出现即原顺序中的最后一次
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = len(keys) - 1 - last
+            src, dst = np.divmod(keys[keep], self.num_pixels)
+            self._set_edge_arrays(src, dst, weights[keep])
+        
+        return self._src, self._dst, self._weights
+    
+    @property
+    def edge_weights(self) -> Dict[Tuple[int, int], float]:
+        """边权重字典 {(idx1, idx2): weight}，idx1 <= idx2（由边数组展开，修改返回值不影响图）"""
+        src, dst, weights = self._edge_arrays()
+        return dict(zip(zip(src.tolist(), dst.tolist()), weights.tolist()))
+    
+    @edge_weights.setter
+    def edge_weights(self, edge_weights: Dict[Tuple[int, int], float]):
+        self._pending_keys, self._pending_weights = [], []
+        if edge_weights:
+            pairs = np.array(list(edge_weights.keys()), dtype=np.int64).reshape(-1, 2)
+            self._set_edge_arrays(pairs.min(axis=1), pairs.max(axis=1),
+                                  np.fromiter(edge_weights.values(), dtype=np.float32,
+                                              count=len(edge_weights)))
+        else:
+            self._set_edge_arrays(np.empty(0), np.empty(0), np.empty(0))
+    
+    @property
+    def adjacency_list(self) -> Dict[int, List[int]]:
+        """邻接表 {idx: [邻居索引, ...]}（由CSR展开，只包含有邻居的节点）"""
+        csr = self._get_weight_matrix()
+        neighbors = np.split(csr.indices, csr.indptr[1:-1])
+        return defaultdict(list, {idx: nbrs.tolist()
+                                  for idx, nbrs in enumerate(neighbors) if len(nbrs)})
+    
+    def _get_weight_matrix(self) -> sp.csr_matrix:
+        """获取带权邻接矩阵，边集合变化后首次调用时重新构建"""
+        if self.weight_matrix is None or self._pending_keys:
+            self.build_sparse_matrices()
+        return self.weight_matrix
+    
+    def build_grid_from_weights(self,
+                                weights_h: np.ndarray,
+                                weights_v: np.ndarray,
+                                weights_diag: Optional[np.ndarray] = None,
+                                weights_anti: Optional[np.ndarray] = None) -> 'PixelGraph':
+        """
+        由各方向的权重图直接构建网格图，替换现有的边
+        
+        每个方向上像素 (row, col) 与 (row+dr, col+dc) 之间的权重位于
+        权重图的 (row - max(0, -dr), col - max(0, -dc)) 处，与
+        EdgeWeightCalculator.calculate_weights_batch的输出布局一致。
         
-    def _build_coordinate_mapping(self):
-        """构建坐标到索引的映射"""
-        idx = 0
-        for row in range(self.height):
-            for col in range(self.width):
-                coord = (row, col)
-                self.coord_to_idx[coord] = idx
-                self.idx_to_coord[idx] = coord
-                idx += 1
+        Args:
+            weights_h: 水平方向 (0, 1) 的权重 (H, W-1)
+            weights_v: 垂直方向 (1, 0) 的权重 (H-1, W)
+            weights_diag: 主对角方向 (1, 1) 的权重 (H-1, W-1)，8-连通时必需
+            weights_anti: 副对角方向 (1, -1) 的权重 (H-1, W-1)，8-连通时必需
+            
+        Returns:
+            图自身
+        """
+        height, width = self.height, self.width
+        node_ids = np.arange(self.num_pixels, dtype=np.int32).reshape(height, width)
+        
+        blocks = [(node_ids[:, :-1], node_ids[:, 1:], weights_h),
+                  (node_ids[:-1, :], node_ids[1:, :], weights_v)]
+        if self.connectivity == 8:
+            if weights_diag is None or weights_anti is None:
+                raise ValueError("8-连通图需要提供对角方向的权重")
+            blocks += [(node_ids[:-1, :-1], node_ids[1:, 1:], weights_diag),
+                       (node_ids[:-1, 1:], node_ids[1:, :-1], weights_anti)]
+        
+        for src, _, weights in blocks:
+            if np.shape(weights) != src.shape:
+                raise ValueError(f"权重图形状 {np.shape(weights)} 与期望的 {src.shape} 不一致")
+        
+        # src < dst 对所有方向成立，每条边只生成一次
+        self._pending_keys, self._pending_weights = [], []
+        self._set_edge_arrays(
+            np.concatenate([src.ravel() for src, _, _ in blocks]),
+            np.concatenate([dst.ravel() for _, dst, _ in blocks]),
+            np.concatenate([np.ravel(weights) for _, _, weights in blocks])
+        )
+        self.build_sparse_matrices()
+        
+        return self
     
     def add_edge(self, 
                 pixel1: Tuple[int, int], 
@@ -62,16 +200,12 @@ class PixelGraph:
             pixel2: 第二个像素坐标
             weight: 边权重
         """
-        idx1 = self.coord_to_idx[pixel1]
-        idx2 = self.coord_to_idx[pixel2]
-        
-        # 添加到邻接表
-        self.adjacency_list[idx1].append(idx2)
-        self.adjacency_list[idx2].append(idx1)
-        
-        # 存储边权重
-        edge_key = (min(idx1, idx2), max(idx1, idx2))
-        self.edge_weights[edge_key] = weight
+        idx1 = self._c2i(pixel1)
+        idx2 = self._c2i(pixel2)
+        if idx1 > idx2:
+            idx1, idx2 = idx2, idx1
+        self._pending_keys.append(idx1 * self.num_pixels + idx2)
+        self._pending_weights.append(weight)
     
     def get_edge_weight(self, 
                        pixel1: Tuple[int, int], 
@@ -86,11 +220,16 @@ class PixelGraph:
         Returns:
             边权重，如果边不存在返回None
         """
-        idx1 = self.coord_to_idx[pixel1]
-        idx2 = self.coord_to_idx[pixel2]
-        edge_key = (min(idx1, idx2), max(idx1, idx2))
-        
-        return self.edge_weights.get(edge_key)
+        idx1 = self._c2i(pixel1)
+        idx2 = self._c2i(pixel2)
+        
+        # CSR每行的列索引有序，在该行内二分查找
+        csr = self._get_weight_matrix()
+        start, end = csr.indptr[idx1], csr.indptr[idx1 + 1]
+        pos = start + np.searchsorted(csr.indices[start:end], idx2)
+        if pos < end and csr.indices[pos] == idx2:
+            return float(csr.data[pos])
+        return None
     
     def get_neighbors(self, pixel: Tuple[int, int]) -> List[Tuple[int, int]]:
         """
@@ -102,10 +241,12 @@ class PixelGraph:
         Returns:
             邻居像素坐标列表
         """
-        idx = self.coord_to_idx[pixel]
-        neighbor_indices = self.adjacency_list[idx]
+        idx = self._c2i(pixel)
+        csr = self._get_weight_matrix()
+        neighbor_indices = csr.indices[csr.indptr[idx]:csr.indptr[idx + 1]]
         
-        return [self.idx_to_coord[neighbor_idx] for neighbor_idx in neighbor_indices]
+        rows, cols = np.divmod(neighbor_indices, self.width)
+        return list(zip(rows.tolist(), cols.tolist()))
     
     def set_node_feature(self, pixel: Tuple[int, int], feature: np.ndarray):
         """
@@ -115,8 +256,26 @@ class PixelGraph:
             pixel: 像素坐标
             feature: 特征向量
         """
-        idx = self.coord_to_idx[pixel]
+        feature = np.ravel(feature)
+        if self.node_features is None:
+            self.node_features = np.zeros((self.num_pixels, feature.size), dtype=np.float32)
+        elif feature.size != self.node_features.shape[1]:
+            raise ValueError(f"特征维度 {feature.size} 与图的特征维度 "
+                             f"{self.node_features.shape[1]} 不一致")
+        
+        idx = self._c2i(pixel)
         self.node_features[idx] = feature
+        self._has_feature[idx] = True
+    
+    def set_all_features(self, features: np.ndarray):
+        """
+        一次性设置所有节点的特征
+        
+        Args:
+            features: 特征数组 (N, D) 或 (height, width, D)，按行优先的像素顺序排列
+        """
+        self.node_features = np.array(features, dtype=np.float32).reshape(self.num_pixels, -1)
+        self._has_feature[:] = True
     
     def get_node_feature(self, pixel: Tuple[int, int]) -> Optional[np.ndarray]:
         """
@@ -126,43 +285,44 @@ class PixelGraph:
             pixel: 像素坐标
             
         Returns:
-            特征向量
+            特征向量，未设置时返回None
         """
-        idx = self.coord_to_idx[pixel]
-        return self.node_features.get(idx)
+        idx = self._c2i(pixel)
+        if not self._has_feature[idx]:
+            return None
+        return self.node_features[idx]
     
     def build_sparse_matrices(self):
-        """构建稀疏矩阵表示"""
-        # 构建邻接矩阵
-        row_indices = []
-        col_indices = []
-        
-        for node_idx, neighbors in self.adjacency_list.items():
-            for neighbor_idx in neighbors:
-                row_indices.append(node_idx)
-                col_indices.append(neighbor_idx)
-        
-        # 创建邻接矩阵
-        data = np.ones(len(row_indices))
-        self.adjacency_matrix = sp.csr_matrix(
-            (data, (row_indices, col_indices)), 
-            shape=(self.num_pixels, self.num_pixels)
-        )
+        """
+        构建稀疏矩阵表示（由边数组直接生成CSR的三个数组，无逐边循环）
         
-        # 构建权重矩阵
-        weight_data = []
-        weight_rows = []
-        weight_cols = []
+        每条边在两端各出现一次；自环只出现一次，值加倍，与COO重复项
+        求和的结果一致。邻接矩阵与权重矩阵共用同一组indptr/indices。
+        """
+        src, dst, weights = self._edge_arrays()
+        num_pixels = self.num_pixels
+        
+        not_loop = src != dst
+        rows = np.concatenate([src, dst[not_loop]])
+        cols = np.concatenate([dst, src[not_loop]])
+        values = np.concatenate([weights, weights[not_loop]])
+        adjacency = np.ones(len(rows))
+        loops = np.flatnonzero(~not_loop)
+        values[loops] *= 2
+        adjacency[loops] = 2
+        
+        # 按 (行, 列) 排序，使每行的列索引有序，get_edge_weight可在行内二分查找
+        order = np.argsort(rows.astype(np.int64) * num_pixels + cols, kind='stable')
+        indices = cols[order].astype(np.int32, copy=False)
+        indptr = np.zeros(num_pixels + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=num_pixels), out=indptr[1:])
+        shape = (num_pixels, num_pixels)
         
-        for (idx1, idx2), weight in self.edge_weights.items():
-            weight_data.extend([weight, weight])  # 对称矩阵
-            weight_rows.extend([idx1, idx2])
-            weight_cols.extend([idx2, idx1])
+        # 构建邻接矩阵
+        self.adjacency_matrix = _csr_from_arrays(adjacency[order], indices, indptr, shape)
         
-        self.weight_matrix = sp.csr_matrix(
-            (weight_data, (weight_rows, weight_cols)),
-            shape=(self.num_pixels, self.num_pixels)
-        )
+        # 构建权重矩阵（对称矩阵）
+        self.weight_matrix = _csr_from_arrays(values[order], indices, indptr, shape)
     
     def get_degree(self, pixel: Tuple[int, int]) -> int:
         """
@@ -174,8 +334,9 @@ class PixelGraph:
         Returns:
             节点度数
         """
-        idx = self.coord_to_idx[pixel]
-        return len(self.adjacency_list[idx])
+        idx = self._c2i(pixel)
+        indptr = self._get_weight_matrix().indptr
+        return int(indptr[idx + 1] - indptr[idx])
     
     def get_graph_statistics(self) -> Dict:
         """
@@ -184,19 +345,29 @@ class PixelGraph:
         Returns:
             统计信息字典
         """
-        degrees = [len(neighbors) for neighbors in self.adjacency_list.values()]
-        weights = list(self.edge_weights.values())
+        src, dst, weights = self._edge_arrays()
+        num_edges = len(weights)
+        
+        # 计算度数：有CSR时取每行的非零元个数，否则直接按边端点计数（自环只计一次），
+        # 不必为统计重新构建CSR；只统计有邻居的节点
+        if self.weight_matrix is not None:
+            degrees = np.diff(self.weight_matrix.indptr)
+        else:
+            degrees = (np.bincount(src, minlength=self.num_pixels) +
+                       np.bincount(dst[src != dst], minlength=self.num_pixels))
+        degrees = degrees[degrees > 0]
         
         stats = {
             'num_nodes': self.num_pixels,
-            'num_edges': len(self.edge_weights),
-            'avg_degree': np.mean(degrees) if degrees else 0,
-            'max_degree': np.max(degrees) if degrees else 0,
-            'min_degree': np.min(degrees) if degrees else 0,
-            'avg_weight': np.mean(weights) if weights else 0,
-            'max_weight': np.max(weights) if weights else 0,
-            'min_weight': np.min(weights) if weights else 0,
-            'density': len(self.edge_weights) / (self.num_pixels * (self.num_pixels - 1) / 2)
+            'num_edges': num_edges,
+            'avg_degree': np.mean(degrees) if len(degrees) else 0,
+            'max_degree': np.max(degrees) if len(degrees) else 0,
+            'min_degree': np.min(degrees) if len(degrees) else 0,
+            'avg_weight': np.mean(weights) if num_edges else 0,
+            'max_weight': np.max(weights) if num_edges else 0,
+            'min_weight': np.min(weights) if num_edges else 0,
+            'density': (num_edges / (self.num_pixels * (self.num_pixels - 1) / 2)
+                        if self.num_pixels > 1 else 0)
         }
         
         return stats
@@ -214,102 +385,126 @@ class PixelGraph:
         filtered_graph = PixelGraph(self.height, self.width, self.connectivity)
         
         # 复制节点特征
-        filtered_graph.node_features = self.node_features.copy()
+        if self.node_features is not None:
+            filtered_graph.node_features = self.node_features.copy()
+            filtered_graph._has_feature = self._has_feature.copy()
+        
+        # 只保留权重小于等于阈值的边（float64比较，与按Python浮点数逐边比较一致）
+        threshold = np.float64(threshold)
+        src, dst, weights = self._edge_arrays()
+        keep = np.flatnonzero(weights <= threshold)
+        filtered_graph._set_edge_arrays(src[keep], dst[keep], weights[keep])
         
-        # 只添加权重小于等于阈值的边
-        for (idx1, idx2), weight in self.edge_weights.items():
-            if weight <= threshold:
-                pixel1 = self.idx_to_coord[idx1]
-                pixel2 = self.idx_to_coord[idx2]
-                filtered_graph.add_edge(pixel1, pixel2, weight)
+        # 已有稀疏矩阵时直接按非零元筛选，无需重新排序构建
+        if self.weight_matrix is not None:
+            filtered_graph.adjacency_matrix, filtered_graph.weight_matrix = \
+                self._filter_sparse_matrices(threshold)
         
         return filtered_graph
     
+    def _filter_sparse_matrices(self, threshold: float) -> Tuple[sp.csr_matrix, sp.csr_matrix]:
+        """按边权重阈值筛选邻接矩阵和权重矩阵的非零元，行内列索引保持有序"""
+        adjacency, weight_matrix = self.adjacency_matrix, self.weight_matrix
+        
+        # 自环在矩阵中的值为两倍权重（邻接矩阵中为2），阈值同样加倍
+        keep = weight_matrix.data <= threshold * adjacency.data
+        rows = np.repeat(np.arange(self.num_pixels, dtype=np.int32), np.diff(weight_matrix.indptr))
+        indptr = np.zeros(self.num_pixels + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows[keep], minlength=self.num_pixels), out=indptr[1:])
+        indices = weight_matrix.indices[keep]
+        shape = weight_matrix.shape
+        
+        return (_csr_from_arrays(adjacency.data[keep], indices, indptr, shape),
+                _csr_from_arrays(weight_matrix.data[keep], indices, indptr, shape))
+    
     def get_connected_components(self) -> List[Set[Tuple[int, int]]]:
         """
         获取连通分量
         
         Returns:
-            连通分量列表，每个分量是像素坐标的集合
+            连通分量列表，每个分量是像素坐标的集合（按分量中首个像素的行优先顺序）
         """
-        visited = set()
-        components = []
+        # SciPy在CSR数组上做原生BFS，标签按首个未访问节点的顺序分配
+        _, labels = connected_components(self._get_weight_matrix(), directed=False)
         
-        def dfs(pixel: Tuple[int, int], component: Set[Tuple[int, int]]):
-            if pixel in visited:
-                return
-            
-            visited.add(pixel)
-            component.add(pixel)
-            
-            # 访问所有邻居
-            for neighbor in self.get_neighbors(pixel):
-                if neighbor not in visited:
-                    dfs(neighbor, component)
-        
-        # 遍历所有像素
-        for row in range(self.height):
-            for col in range(self.width):
-                pixel = (row, col)
-                if pixel not in visited:
-                    component = set()
-                    dfs(pixel, component)
-                    if component:
-                        components.append(component)
-        
-        return components
+        # 按标签稳定排序后切分，每段即一个分量的像素索引
+        order = np.argsort(labels, kind='stable')
+        rows, cols = np.divmod(order, self.width)
+        splits = np.cumsum(np.bincount(labels))[:-1]
+        
+        return [set(zip(r.tolist(), c.tolist()))
+                for r, c in zip(np.split(rows, splits), np.split(cols, splits))]
     
-    def compute_laplacian_matrix(self) -> sp.csr_matrix:
+    def compute_laplacian_matrix(self, normed: bool = False) -> sp.csr_matrix:
         """
-        计算拉普拉斯矩阵
+        计算拉普拉斯矩阵 L = D - A（A为无权邻接矩阵）
         
+        Args:
+            normed: 是否返回对称归一化的拉普拉斯矩阵 I - D^-1/2 A D^-1/2
+            
         Returns:
             拉普拉斯矩阵
         """
-        if self.adjacency_matrix is None:
-            self.build_sparse_matrices()
-        
-        # 计算度矩阵
-        degrees = np.array(self.adjacency_matrix.sum(axis=1)).flatten()
-        degree_matrix = sp.diags(degrees, format='csr')
-        
-        # 拉普拉斯矩阵 = 度矩阵 - 邻接矩阵
-        laplacian = degree_matrix - self.adjacency_matrix
+        self._get_weight_matrix()  # 确保邻接矩阵包含最新的边
         
-        return laplacian
+        # csgraph.laplacian直接在CSR数据上计算，不再构建度对角矩阵再做稀疏减法
+        return sp.csr_matrix(laplacian(self.adjacency_matrix, normed=normed))
     
     def save_to_file(self, filename: str):
         """
-        保存图到文件
+        保存图到文件（NumPy .npz格式，直接写入边数组和特征数组）
         
         Args:
             filename: 文件名
         """
-        import pickle
-        
-        graph_data = {
-            'height': self.height,
-            'width': self.width,
-            'connectivity': self.connectivity,
-            'adjacency_list': dict(self.adjacency_list),
-            'edge_weights': self.edge_weights,
-            'node_features': self.node_features
+        src, dst, weights = self._edge_arrays()
+        arrays = {
+            'meta': np.array([self.height, self.width, self.connectivity], dtype=np.int64),
+            'src': src,
+            'dst': dst,
+            'weights': weights,
         }
+        if self.node_features is not None:
+            arrays['node_features'] = self.node_features
+            arrays['has_feature'] = self._has_feature
         
+        # 传入文件对象，避免savez_compressed给文件名追加.npz后缀
         with open(filename, 'wb') as f:
-            pickle.dump(graph_data, f)
+            np.savez_compressed(f, **arrays)
     
     @classmethod
-    def load_from_file(cls, filename: str) -> 'PixelGraph':
+    def load_from_file(cls, filename: str, allow_pickle: bool = False) -> 'PixelGraph':
         """
         从文件加载图
         
         Args:
             filename: 文件名
+            allow_pickle: 是否允许加载旧版本写出的pickle文件。pickle可执行任意代码，
+                只应对可信的文件开启
             
         Returns:
             加载的图对象
         """
+        with open(filename, 'rb') as f:
+            is_npz = f.read(4) == b'PK\x03\x04'
+        if not is_npz:
+            if not allow_pickle:
+                raise ValueError(f"不是npz格式的图文件: {filename}（旧版pickle文件需设置allow_pickle=True）")
+            return cls._load_from_pickle(filename)
+        
+        with np.load(filename, allow_pickle=False) as data:
+            height, width, connectivity = data['meta'].tolist()
+            graph = cls(height, width, connectivity)
+            graph._set_edge_arrays(data['src'], data['dst'], data['weights'])
+            if 'node_features' in data:
+                graph.node_features = data['node_features']
+                graph._has_feature = data['has_feature']
+        
+        return graph
+    
+    @classmethod
+    def _load_from_pickle(cls, filename: str) -> 'PixelGraph':
+        """加载旧版本save_to_file写出的pickle文件（只应用于可信的文件）"""
         import pickle
         
         with open(filename, 'rb') as f:
@@ -322,9 +517,10 @@ class PixelGraph:
             graph_data['connectivity']
         )
         
-        # 恢复数据
-        graph.adjacency_list = defaultdict(list, graph_data['adjacency_list'])
+        # 恢复数据（邻接表由边权重推导，无需单独恢复）
         graph.edge_weights = graph_data['edge_weights']
-        graph.node_features = graph_data['node_features']
+        # 特征按 {idx: 特征向量} 存储
+        for idx, feature in graph_data['node_features'].items():
+            graph.set_node_feature(graph._i2c(idx), feature)
         
         return graph
@@ -4,14 +4,19 @@
 """
 
 import numpy as np
+from scipy import ndimage
 from typing import Dict, List, Tuple, Optional, Any
 import json
+from collections import OrderedDict
 from pathlib import Path
 
 
 class SegmentationResult:
     """分割结果数据结构"""
     
+    # 按标签缓存的区域窗口掩码和区域特征的最大条目数（超出后淘汰最久未使用的）
+    SEGMENT_CACHE_SIZE = 256
+    
     def __init__(self, 
                  label_map: np.ndarray,
                  original_image: Optional[np.ndarray] = None,
@@ -38,6 +43,34 @@ class SegmentationResult:
         self.metadata = {}
         self.performance_metrics = {}
         self.quality_metrics = {}
+    
+    @property
+    def label_map(self) -> np.ndarray:
+        """
+        分割标签图
+        
+        赋值新的标签图会使按标签缓存的索引、统计量和特征失效；原地修改
+        标签图（如 result.label_map[mask] = k）无法被察觉，修改后需调用
+        invalidate_cache()。
+        """
+        return self._label_map
+    
+    @label_map.setter
+    def label_map(self, label_map: np.ndarray):
+        self._label_map = label_map
+        self.invalidate_cache()
+    
+    def invalidate_cache(self):
+        """
+        清除由标签图和原始图像派生的缓存（标签索引、周长、区域窗口和特征）
+        
+        原地修改label_map或original_image的内容后调用；下次访问时重新计算。
+        """
+        self._label_index_source = None
+        self._perimeter_source = None
+        self._feature_image_source = None
+        self._window_cache = OrderedDict()
+        self._feature_cache = OrderedDict()
         
     def _compute_basic_statistics(self):
         """计算基本统计信息"""
@@ -58,6 +91,91 @@ class SegmentationResult:
             'median_segment_size': np.median(counts)
         }
     
+    def _ensure_label_index(self):
+        """
+        一次遍历标签图，建立并缓存所有区域的索引信息
+        
+        标签可以不连续或为负数，先映射为 1..K 的稠密标签再交给
+        ndimage.find_objects。缓存的内容：
+            _label_values: 升序的区域标签 (K,)
+            _label_sizes: 各区域像素数 (K,)
+            _label_dense: 稠密标签图 (H, W)，值为标签序号 + 1
+            _label_slices: 各区域的边界框切片
+            _label_centroids: 各区域的质心 (K, 2)
+        """
+        if getattr(self, '_label_index_source', None) is self.label_map:
+            return
+        
+        values, inverse, sizes = np.unique(self.label_map, return_inverse=True,
+                                           return_counts=True)
+        inverse = inverse.reshape(-1)
+        dense = (inverse + 1).astype(np.int32).reshape(self.label_map.shape)
+        
+        # 按标签累加行列坐标得到质心
+        rows, cols = np.divmod(np.arange(inverse.size), self.label_map.shape[1])
+        centroids = np.stack([np.bincount(inverse, weights=rows, minlength=len(values)),
+                              np.bincount(inverse, weights=cols, minlength=len(values))],
+                             axis=1) / sizes[:, None]
+        
+        self._label_values = values
+        self._label_sizes = sizes
+        self._label_dense = dense
+        self._label_slices = ndimage.find_objects(dense)
+        self._label_centroids = centroids
+        self._label_index_source = self.label_map
+        
+        # 标签图变化后按标签缓存的内容一并失效
+        self._window_cache = OrderedDict()
+        self._feature_cache = OrderedDict()
+    
+    def _cache_get(self, cache: OrderedDict, label: int):
+        """从LRU缓存中取出标签对应的条目，命中时移到最近使用端"""
+        entry = cache.get(label)
+        if entry is not None:
+            cache.move_to_end(label)
+        return entry
+    
+    def _cache_put(self, cache: OrderedDict, label: int, entry):
+        """写入LRU缓存，超出容量时淘汰最久未使用的条目"""
+        cache[label] = entry
+        if len(cache) > self.SEGMENT_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    def _label_position(self, label: int) -> Optional[int]:
+        """查找标签在缓存索引中的位置，标签不存在时返回None"""
+        self._ensure_label_index()
+        pos = int(np.searchsorted(self._label_values, label))
+        if pos < len(self._label_values) and self._label_values[pos] == label:
+            return pos
+        return None
+    
+    def _segment_window(self, label: int) -> Tuple[Tuple[slice, slice], np.ndarray]:
+        """
+        获取区域边界框向外扩展一个像素后的窗口及窗口内的区域掩码
+        
+        扩展的一圈保证窗口边缘的区域像素只可能位于图像边界，
+        窗口内的形态学运算与在整幅图像上计算的结果一致。结果按标签缓存，
+        返回的掩码为只读数组。
+        """
+        pos = self._label_position(label)
+        cached = self._cache_get(self._window_cache, label)
+        if cached is not None:
+            return cached
+        
+        if pos is None:
+            # 标签不存在时取一个像素的窗口，掩码为空
+            window = (slice(0, 1), slice(0, 1))
+        else:
+            row_slice, col_slice = self._label_slices[pos]
+            height, width = self.label_map.shape[:2]
+            window = (slice(max(row_slice.start - 1, 0), min(row_slice.stop + 1, height)),
+                      slice(max(col_slice.start - 1, 0), min(col_slice.stop + 1, width)))
+        mask = self.label_map[window] == label
+        mask.flags.writeable = False
+        
+        self._cache_put(self._window_cache, label, (window, mask))
+        return window, mask
+    
     def get_segment_mask(self, label: int) -> np.ndarray:
         """
         获取指定标签的分割掩码
@@ -68,9 +186,13 @@ class SegmentationResult:
         Returns:
             布尔掩码数组
         """
-        return self.label_map == label
+        # 只在区域的边界框窗口内比较，窗口外全为False
+        window, window_mask = self._segment_window(label)
+        mask = np.zeros(self.label_map.shape, dtype=bool)
+        mask[window] = window_mask
+        return mask
     
-    def get_segment_pixels(self, label: int) -> List[Tuple[int, int]]:
+    def get_segment_pixels(self, label: int) -> np.ndarray:
         """
         获取指定分割区域的像素坐标
         
@@ -78,11 +200,27 @@ class SegmentationResult:
             label: 分割标签
             
         Returns:
-            像素坐标列表
+            像素坐标数组 (n, 2) int32，每行为 (row, col)，按行优先顺序排列
+        """
+        # 只在区域的边界框窗口内查找，再平移回整幅图像的坐标
+        window, mask = self._segment_window(label)
+        rows, cols = np.nonzero(mask)
+        pixels = np.empty((len(rows), 2), dtype=np.int32)
+        pixels[:, 0] = rows + window[0].start
+        pixels[:, 1] = cols + window[1].start
+        return pixels
+    
+    def get_segment_pixels_tuples(self, label: int) -> List[Tuple[int, int]]:
+        """
+        获取指定分割区域的像素坐标列表（需要元组列表的调用方使用）
+        
+        Args:
+            label: 分割标签
+            
+        Returns:
+            像素坐标列表 [(row, col), ...]
         """
-        mask = self.get_segment_mask(label)
-        coords = np.where(mask)
-        return list(zip(coords[0], coords[1]))
+        return list(map(tuple, self.get_segment_pixels(label).tolist()))
     
     def get_segment_bounding_box(self, label: int) -> Tuple[int, int, int, int]:
         """
@@ -94,16 +232,12 @@ class SegmentationResult:
         Returns:
             边界框 (min_row, min_col, max_row, max_col)
         """
-        mask = self.get_segment_mask(label)
-        coords = np.where(mask)
-        
-        if len(coords[0]) == 0:
+        pos = self._label_position(label)
+        if pos is None:
             return (0, 0, 0, 0)
         
-        min_row, max_row = np.min(coords[0]), np.max(coords[0])
-        min_col, max_col = np.min(coords[1]), np.max(coords[1])
-        
-        return (min_row, min_col, max_row, max_col)
+        row_slice, col_slice = self._label_slices[pos]
+        return (row_slice.start, col_slice.start, row_slice.stop - 1, col_slice.stop - 1)
     
     def get_segment_centroid(self, label: int) -> Tuple[float, float]:
         """
@@ -115,15 +249,11 @@ class SegmentationResult:
         Returns:
             质心坐标 (row, col)
         """
-        mask = self.get_segment_mask(label)
-        coords = np.where(mask)
-        
-        if len(coords[0]) == 0:
+        pos = self._label_position(label)
+        if pos is None:
             return (0.0, 0.0)
         
-        centroid_row = np.mean(coords[0])
-        centroid_col = np.mean(coords[1])
-        
+        centroid_row, centroid_col = self._label_centroids[pos]
         return (centroid_row, centroid_col)
     
     def compute_segment_features(self, label: int) -> Dict[str, Any]:
@@ -136,7 +266,17 @@ class SegmentationResult:
         Returns:
             特征字典
         """
-        mask = self.get_segment_mask(label)
+        # 特征按标签缓存；标签图或原始图像替换后缓存失效
+        self._ensure_label_index()
+        if getattr(self, '_feature_image_source', None) is not self.original_image:
+            self._feature_cache.clear()
+            self._feature_image_source = self.original_image
+        cached = self._cache_get(self._feature_cache, label)
+        if cached is not None:
+            return dict(cached)
+        
+        # 只在区域边界框（外扩一个像素）内计算掩码
+        window, mask = self._segment_window(label)
         
         # 基本几何特征
         area = np.sum(mask)
@@ -144,7 +284,8 @@ class SegmentationResult:
         centroid = self.get_segment_centroid(label)
         
         # 形状特征
-        perimeter = self._compute_perimeter(mask)
+        pos = self._label_position(label)
+        perimeter = self._label_perimeters()[pos] if pos is not None else 0
         compactness = (perimeter ** 2) / (4 * np.pi * area) if area > 0 else 0
         
         features = {
@@ -158,29 +299,47 @@ class SegmentationResult:
         
         # 如果有原始图像，计算颜色特征
         if self.original_image is not None:
-            color_features = self._compute_color_features(mask)
+            color_features = self._compute_color_features(mask, window)
             features.update(color_features)
         
-        return features
+        self._cache_put(self._feature_cache, label, features)
+        return dict(features)
     
-    def _compute_perimeter(self, mask: np.ndarray) -> float:
-        """计算区域周长"""
-        import cv2
-        
-        # 使用形态学操作计算边界
-        kernel = np.ones((3, 3), np.uint8)
-        eroded = cv2.erode(mask.astype(np.uint8), kernel, iterations=1)
-        boundary = mask.astype(np.uint8) - eroded
+    def _label_perimeters(self) -> np.ndarray:
+        """
+        各区域的周长 (K,)，与_label_values对应，对整幅标签图一次算出并缓存
         
-        return np.sum(boundary)
+        周长为区域内8-邻域中（不含图像外）存在其他区域像素的像素个数，
+        与对区域掩码做3x3腐蚀后相减得到的边界像素数一致。
+        """
+        self._ensure_label_index()
+        if getattr(self, '_perimeter_source', None) is not self.label_map:
+            dense = self._label_dense
+            boundary = np.zeros(dense.shape, dtype=bool)
+            
+            # 水平、垂直、主对角、副对角四个方向上相邻像素标签不同时，两侧都是边界
+            head, tail, full = slice(None, -1), slice(1, None), slice(None)
+            for first, second in [((full, head), (full, tail)),
+                                  ((head, full), (tail, full)),
+                                  ((head, head), (tail, tail)),
+                                  ((head, tail), (tail, head))]:
+                differs = dense[first] != dense[second]
+                boundary[first] |= differs
+                boundary[second] |= differs
+            
+            counts = np.bincount(dense[boundary], minlength=len(self._label_values) + 1)
+            self._label_perimeter_values = counts[1:]
+            self._perimeter_source = self.label_map
+        return self._label_perimeter_values
     
-    def _compute_color_features(self, mask: np.ndarray) -> Dict[str, Any]:
-        """计算颜色特征"""
+    def _compute_color_features(self, mask: np.ndarray,
+                                window: Tuple[slice, slice] = (slice(None), slice(None))) -> Dict[str, Any]:
+        """计算颜色特征（mask为window窗口内的区域掩码）"""
         if self.original_image is None:
             return {}
         
         # 提取区域内的像素值
-        region_pixels = self.original_image[mask]
+        region_pixels = self.original_image[window][mask]
         
         if len(region_pixels) == 0:
             return {}
@@ -205,20 +364,16 @@ class SegmentationResult:
         Returns:
             过滤后的分割结果
         """
-        filtered_label_map = self.label_map.copy()
-        
-        # 找到小区域
-        for label, size in self.segment_sizes.items():
-            if size < min_size:
-                # 将小区域标记为背景（标签0）
-                filtered_label_map[self.label_map == label] = 0
+        self._ensure_label_index()
         
-        # 重新标记连续的标签
-        unique_labels = np.unique(filtered_label_map)
-        new_label_map = np.zeros_like(filtered_label_map)
+        # 将小区域标记为背景（标签0）：按稠密标签查表，一次完成
+        is_small = np.concatenate([[False], self._label_sizes < min_size])
+        filtered_label_map = np.where(is_small[self._label_dense], 0, self.label_map)
         
-        for new_label, old_label in enumerate(unique_labels):
-            new_label_map[filtered_label_map == old_label] = new_label
+        # 重新标记连续的标签：每个像素的新标签即其标签在升序唯一值中的位置
+        _, new_label_map = np.unique(filtered_label_map, return_inverse=True)
+        new_label_map = new_label_map.reshape(self.label_map.shape).astype(
+            self.label_map.dtype, copy=False)
         
         # 创建新的分割结果
         filtered_result = SegmentationResult(
@@ -284,74 +439,84 @@ class SegmentationResult:
     
     def _compute_intra_region_variance(self) -> float:
         """计算区域内方差"""
-        total_variance = 0.0
-        total_pixels = 0
-        
-        for label in np.unique(self.label_map):
-            mask = self.get_segment_mask(label)
-            region_pixels = self.original_image[mask]
-            
-            if len(region_pixels) > 1:
-                variance = np.var(region_pixels)
-                total_variance += variance * len(region_pixels)
-                total_pixels += len(region_pixels)
+        labels, sizes = self._region_labels_and_sizes()
+        multi = sizes > 1  # 单像素区域没有方差，不参与统计
+        if not np.any(multi):
+            return 0.0
         
-        return total_variance / total_pixels if total_pixels > 0 else 0.0
+        # 每个区域内所有通道的像素值视为同一组样本（与对区域像素整体求np.var一致），
+        # ndimage按标签一次遍历完成全部区域的统计
+        image = self.original_image
+        label_map = self.label_map
+        if image.ndim == 3:
+            label_map = np.broadcast_to(label_map[..., None], image.shape)
+        # ndimage统计 0..最大标签 的全部取值，标签不连续时空缺标签的0/0会产生
+        # RuntimeWarning，这些值不在index中，不影响结果
+        with np.errstate(invalid='ignore'):
+            variances = np.asarray(ndimage.variance(image, label_map, labels[multi]))
+        
+        return float(np.sum(variances * sizes[multi]) / np.sum(sizes[multi]))
     
     def _compute_inter_region_contrast(self) -> float:
         """计算区域间对比度"""
         # 简化实现：计算相邻区域间的平均颜色差异
         import cv2
         
-        # 计算边界
-        grad_x = cv2.Sobel(self.label_map.astype(np.float32), cv2.CV_32F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(self.label_map.astype(np.float32), cv2.CV_32F, 0, 1, ksize=3)
+        # 与逐像素实现相同：在标签图的Sobel响应非零处视为边界像素，
+        # 每个边界像素与其4邻域中标签不同的像素构成一对
+        labels = self.label_map
+        label_float = labels.astype(np.float32)
+        grad_x = cv2.Sobel(label_float, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(label_float, cv2.CV_32F, 0, 1, ksize=3)
         boundaries = (np.abs(grad_x) + np.abs(grad_y)) > 0
         
-        if np.sum(boundaries) == 0:
+        if not boundaries.any():
             return 0.0
         
-        # 计算边界处的颜色差异
-        boundary_coords = np.where(boundaries)
+        # 在错位切片上一次比较水平和垂直相邻的像素对；一对像素从两端各被
+        # 计数一次，只有是边界像素的一端才计入，因此按两端的边界标记加权
+        image = self.original_image
         total_contrast = 0.0
         count = 0
-        
-        for i in range(len(boundary_coords[0])):
-            row, col = boundary_coords[0][i], boundary_coords[1][i]
-            
-            # 检查相邻像素
-            for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nr, nc = row + dr, col + dc
-                if (0 <= nr < self.label_map.shape[0] and 
-                    0 <= nc < self.label_map.shape[1]):
-                    
-                    if self.label_map[row, col] != self.label_map[nr, nc]:
-                        # 计算颜色差异
-                        color_diff = np.linalg.norm(
-                            self.original_image[row, col].astype(float) - 
-                            self.original_image[nr, nc].astype(float)
-                        )
-                        total_contrast += color_diff
-                        count += 1
+        for src, dst in (((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                         ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))):
+            differs = labels[src] != labels[dst]
+            weight = (boundaries[src][differs].astype(np.int64) +
+                      boundaries[dst][differs])
+            diff = image[src][differs].astype(np.float64) - image[dst][differs]
+            if diff.ndim == 2:
+                color_diff = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            else:
+                color_diff = np.abs(diff)
+            total_contrast += float(np.dot(color_diff, weight))
+            count += int(weight.sum())
         
         return total_contrast / count if count > 0 else 0.0
     
     def _compute_segmentation_consistency(self) -> float:
         """计算分割一致性"""
         # 简化实现：计算每个区域内颜色的一致性
-        total_consistency = 0.0
-        
-        for label in np.unique(self.label_map):
-            mask = self.get_segment_mask(label)
-            region_pixels = self.original_image[mask]
-            
-            if len(region_pixels) > 1:
-                # 计算颜色标准差的倒数作为一致性度量
-                std_dev = np.mean(np.std(region_pixels, axis=0))
-                consistency = 1.0 / (1.0 + std_dev)
-                total_consistency += consistency * len(region_pixels)
+        labels, sizes = self._region_labels_and_sizes()
+        multi = sizes > 1
+        if not np.any(multi):
+            return 0.0
         
-        return total_consistency / self.total_pixels
+        # 各通道按标签一次性求区域标准差，再对通道取平均
+        image = self.original_image
+        channels = [image[..., c] for c in range(image.shape[2])] if image.ndim == 3 else [image]
+        # 空缺标签的0/0警告同_compute_intra_region_variance
+        with np.errstate(invalid='ignore'):
+            std_dev = np.mean([ndimage.standard_deviation(channel, self.label_map, labels[multi])
+                               for channel in channels], axis=0)
+        
+        # 计算颜色标准差的倒数作为一致性度量
+        consistency = 1.0 / (1.0 + std_dev)
+        return float(np.sum(consistency * sizes[multi]) / self.total_pixels)
+    
+    def _region_labels_and_sizes(self) -> Tuple[np.ndarray, np.ndarray]:
+        """获取所有区域的标签（升序）和对应的像素数"""
+        self._ensure_label_index()
+        return self._label_values, self._label_sizes
     
     def save_to_file(self, filepath: str):
         """
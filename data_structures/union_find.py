@@ -3,9 +3,150 @@
 用于高效管理连通分量和区域合并操作
 """
 
-from typing import Dict, List, Set, Optional
+import itertools
+from typing import Dict, List, Set, Optional, Tuple
 import numpy as np
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _find(parent, x):
+    """查找根节点（两遍迭代：先走到根，再把路径上的节点直接指向根）"""
+    root = x
+    while parent[root] != root:
+        root = parent[root]
+    while parent[x] != root:
+        next_x = parent[x]
+        parent[x] = root
+        x = next_x
+    return root
+
+
+def _union(parent, rank, size, x, y):
+    """按秩合并x和y所在的集合，返回新的根；已在同一集合时返回-1"""
+    root_x = _find(parent, x)
+    root_y = _find(parent, y)
+    if root_x == root_y:
+        return -1
+    
+    if rank[root_x] < rank[root_y]:
+        root_x, root_y = root_y, root_x
+    parent[root_y] = root_x
+    size[root_x] += size[root_y]
+    if rank[root_x] == rank[root_y]:
+        rank[root_x] += 1
+    return root_x
+
+
+def _union_record(parent, rank, size, x, y, weight,
+                  roots_x, roots_y, merge_weights, sizes_x, sizes_y, root_weights, count):
+    """
+    带权重地合并x和y所在的集合，并把合并前的两个根、权重和两个集合的
+    大小写入合并记录的第count个位置，合并后的根的权重记入root_weights
+    
+    Returns:
+        新的记录数；已在同一集合中时不合并，原样返回count
+    """
+    root_x = _find(parent, x)
+    root_y = _find(parent, y)
+    if root_x == root_y:
+        return count
+    
+    roots_x[count] = root_x
+    roots_y[count] = root_y
+    merge_weights[count] = weight
+    sizes_x[count] = size[root_x]
+    sizes_y[count] = size[root_y]
+    root_weights[_union(parent, rank, size, root_x, root_y)] = weight
+    return count + 1
+
+
+def _union_record_batch(parent, rank, size, xs, ys, weights,
+                        roots_x, roots_y, merge_weights, sizes_x, sizes_y, root_weights, count):
+    """按顺序对 (xs[i], ys[i], weights[i]) 执行_union_record，返回新的记录数"""
+    for i in range(xs.shape[0]):
+        count = _union_record(parent, rank, size, xs[i], ys[i], weights[i],
+                              roots_x, roots_y, merge_weights, sizes_x, sizes_y,
+                              root_weights, count)
+    return count
+
+
+def _merge_into_large(parent, rank, size, pixels, indptr, indices, min_size):
+    """
+    按顺序把每个像素合并到第一个属于大区域（大小不小于min_size）的邻居，
+    邻居由CSR数组 indices[indptr[p]:indptr[p + 1]] 给出
+
+    Returns:
+        实际发生的合并次数
+    """
+    merged = 0
+    for i in range(pixels.shape[0]):
+        p = pixels[i]
+        for j in range(indptr[p], indptr[p + 1]):
+            q = indices[j]
+            if size[_find(parent, q)] >= min_size:
+                if _union(parent, rank, size, p, q) >= 0:
+                    merged += 1
+                break
+    return merged
+
+
+if NUMBA_AVAILABLE:
+    # 同一份实现编译为机器码；没有Numba时以上函数按纯Python运行
+    _find = njit(cache=True)(_find)
+    _union = njit(cache=True)(_union)
+    _union_record = njit(cache=True)(_union_record)
+    _union_record_batch = njit(cache=True)(_union_record_batch)
+    _merge_into_large = njit(cache=True)(_merge_into_large)
+    
+    @njit(cache=True)
+    def _find_all(parent):
+        """
+        一次求出所有元素的根节点 (N,)，并把全部路径压缩为直接指向根
+        
+        串行执行：该内核会在多阈值分割的线程池中调用，在工作线程里启动
+        Numba的并行后端（TBB）会导致解释器退出时挂起。
+        """
+        n = parent.shape[0]
+        roots = np.empty(n, dtype=np.int32)
+        for i in range(n):
+            x = parent[i]  # 从父节点起步，使x始终与parent同为int32
+            while parent[x] != x:
+                x = parent[x]
+            roots[i] = x
+        parent[:] = roots
+        return roots
+else:
+    def _find_all(parent):
+        """一次求出所有元素的根节点（NumPy指针跳跃，每轮把所有节点指向祖父节点）"""
+        roots = parent.copy()
+        while True:
+            grandparents = roots[roots]
+            if np.array_equal(grandparents, roots):
+                break
+            roots = grandparents
+        parent[:] = roots  # 全部路径压缩为直接指向根
+        return roots
+
+
+
+def _component_labels(roots: np.ndarray):
+    """
+    由每个元素的根求连通分量编号
+    
+    Returns:
+        (component_roots, labels)：各分量的根 (K,)，按分量首个元素的出现
+        顺序排列；每个元素所属分量的编号 (N,) int32
+    """
+    unique_roots, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[order] = np.arange(len(first), dtype=np.int32)
+    return unique_roots[order], rank[inverse.reshape(-1)]
 
 class UnionFind:
     """并查集数据结构"""
@@ -17,14 +158,25 @@ class UnionFind:
         Args:
             n: 元素数量
         """
-        self.parent = list(range(n))  # 父节点数组
-        self.rank = [0] * n          # 秩数组（用于按秩合并）
-        self.size = [1] * n          # 每个连通分量的大小
-        self.num_components = n       # 连通分量数量
+        self.parent = np.arange(n, dtype=np.int32)  # 父节点数组
+        self.rank = np.zeros(n, dtype=np.int32)     # 秩数组（用于按秩合并）
+        self.size = np.ones(n, dtype=np.int32)      # 每个连通分量的大小
+        self.num_components = n                     # 连通分量数量
+    
+    def _check_index(self, x: int):
+        """检查元素索引是否在 [0, n) 内（编译后的内核不做越界检查）"""
+        if not 0 <= x < len(self.parent):
+            raise IndexError(f"元素索引超出范围: {x}")
+    
+    def _check_indices(self, *arrays: np.ndarray):
+        """一次检查若干索引数组的取值是否都在 [0, n) 内"""
+        for indices in arrays:
+            if indices.size > 0 and (indices.min() < 0 or indices.max() >= len(self.parent)):
+                raise IndexError("元素索引超出范围")
     
     def find(self, x: int) -> int:
         """
-        查找元素x的根节点（带路径压缩）
+        查找元素x的根节点（迭代路径压缩，不受递归深度限制）
         
         Args:
             x: 要查找的元素
@@ -32,9 +184,8 @@ class UnionFind:
         Returns:
             根节点
         """
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])  # 路径压缩
-        return self.parent[x]
+        self._check_index(x)
+        return int(_find(self.parent, x))
     
     def union(self, x: int, y: int) -> bool:
         """
@@ -47,21 +198,12 @@ class UnionFind:
         Returns:
             是否成功合并（如果已经在同一集合中返回False）
         """
-        root_x = self.find(x)
-        root_y = self.find(y)
-        
-        if root_x == root_y:
-            return False  # 已经在同一集合中
+        self._check_index(x)
+        self._check_index(y)
         
         # 按秩合并
-        if self.rank[root_x] < self.rank[root_y]:
-            root_x, root_y = root_y, root_x
-        
-        self.parent[root_y] = root_x
-        self.size[root_x] += self.size[root_y]
-        
-        if self.rank[root_x] == self.rank[root_y]:
-            self.rank[root_x] += 1
+        if _union(self.parent, self.rank, self.size, x, y) < 0:
+            return False  # 已经在同一集合中
         
         self.num_components -= 1
         return True
@@ -90,7 +232,25 @@ class UnionFind:
             连通分量大小
         """
         root = self.find(x)
-        return self.size[root]
+        return int(self.size[root])
+    
+    def get_components_indexed(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取所有连通分量的索引视图（不构建字典和列表）
+        
+        分量按首个元素的出现顺序编号，第k个分量的元素为
+        order[starts[k]:starts[k + 1]]，按升序排列。调用后所有路径都已压缩，
+        self.parent[order[starts[k]]] 即第k个分量的根。
+        
+        Returns:
+            (starts, order)：各分量的起始位置 (K+1,)，按分量排列的元素 (N,)
+        """
+        _, labels = _component_labels(_find_all(self.parent))
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels)
+        starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=starts[1:])
+        return starts, order
     
     def get_components(self) -> Dict[int, List[int]]:
         """
@@ -99,13 +259,10 @@ class UnionFind:
         Returns:
             字典，键为根节点，值为该分量中的所有元素
         """
-        components = {}
-        for i in range(len(self.parent)):
-            root = self.find(i)
-            if root not in components:
-                components[root] = []
-            components[root].append(i)
-        return components
+        starts, order = self.get_components_indexed()
+        roots = self.parent[order[starts[:-1]]]
+        return dict(zip(roots.tolist(),
+                        (members.tolist() for members in np.split(order, starts[1:-1]))))
     
     def get_component_roots(self) -> Set[int]:
         """
@@ -114,16 +271,51 @@ class UnionFind:
         Returns:
             根节点集合
         """
-        return {self.find(i) for i in range(len(self.parent))}
+        return set(np.unique(_find_all(self.parent)).tolist())
 
 
 class WeightedUnionFind(UnionFind):
-    """带权重的并查集"""
+    """
+    带权重的并查集
+    
+    合并记录存放在预分配的结构化数组中（成功的合并最多 n - 1 次），
+    每个根最近一次合并的边权重存放在按根索引的数组中，未合并过的根为NaN。
+    """
+    
+    MERGE_RECORD_DTYPE = np.dtype([('root_x', np.int32), ('root_y', np.int32),
+                                   ('weight', np.float64),
+                                   ('size_x', np.int32), ('size_y', np.int32)])
     
     def __init__(self, n: int):
         super().__init__(n)
-        self.edge_weights = {}  # 存储合并时的边权重
-        self.merge_history = []  # 合并历史
+        self._merge_records = np.empty(max(n - 1, 0), dtype=self.MERGE_RECORD_DTYPE)
+        self._num_merges = 0
+        self._root_weights = np.full(n, np.nan)  # 存储合并时的边权重
+        # 合并内核直接写入的各字段视图，依次对应_union_record的记录参数
+        self._record_arrays = tuple(self._merge_records[name] for name in
+                                    ('root_x', 'root_y', 'weight', 'size_x', 'size_y')) + \
+                              (self._root_weights,)
+    
+    @property
+    def merge_records(self) -> np.ndarray:
+        """合并记录的结构化数组 (M,)，字段为 root_x, root_y, weight, size_x, size_y"""
+        return self._merge_records[:self._num_merges]
+    
+    @property
+    def merge_history(self) -> List[Dict]:
+        """合并历史，每次合并为 {'components': (root_x, root_y), 'weight': w, 'sizes': (size_x, size_y)}"""
+        records = self.merge_records
+        return [{'components': (root_x, root_y), 'weight': weight, 'sizes': (size_x, size_y)}
+                for root_x, root_y, weight, size_x, size_y in zip(
+                    records['root_x'].tolist(), records['root_y'].tolist(),
+                    records['weight'].tolist(),
+                    records['size_x'].tolist(), records['size_y'].tolist())]
+    
+    @property
+    def edge_weights(self) -> Dict[int, float]:
+        """各根最近一次合并的边权重 {root: weight}"""
+        roots = np.flatnonzero(~np.isnan(self._root_weights))
+        return dict(zip(roots.tolist(), self._root_weights[roots].tolist()))
     
     def union_with_weight(self, x: int, y: int, weight: float) -> bool:
         """
@@ -137,29 +329,42 @@ class WeightedUnionFind(UnionFind):
         Returns:
             是否成功合并
         """
-        root_x = self.find(x)
-        root_y = self.find(y)
-        
-        if root_x == root_y:
+        self._check_index(x)
+        self._check_index(y)
+        count = _union_record(self.parent, self.rank, self.size, x, y, weight,
+                              *self._record_arrays, self._num_merges)
+        if count == self._num_merges:
             return False
         
-        # 记录合并历史
-        merge_info = {
-            'components': (root_x, root_y),
-            'weight': weight,
-            'sizes': (self.size[root_x], self.size[root_y])
-        }
-        self.merge_history.append(merge_info)
-        
-        # 执行合并
-        success = self.union(x, y)
-        
-        if success:
-            # 记录边权重
-            new_root = self.find(x)
-            self.edge_weights[new_root] = weight
+        self._num_merges = count
+        self.num_components -= 1
+        return True
+    
+    def union_batch(self, xs: np.ndarray, ys: np.ndarray, weights: np.ndarray) -> int:
+        """
+        按顺序批量执行带权重的合并
         
-        return success
+        Args:
+            xs: 第一个元素数组
+            ys: 第二个元素数组
+            weights: 合并边的权重数组
+            
+        Returns:
+            成功合并的次数
+        """
+        xs = np.ascontiguousarray(xs, dtype=np.int64)
+        ys = np.ascontiguousarray(ys, dtype=np.int64)
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self._check_indices(xs, ys)
+        
+        # 合并循环与记录都在编译后的内核中完成（与逐条调用union_with_weight的结果相同）
+        count = _union_record_batch(self.parent, self.rank, self.size, xs, ys, weights,
+                                    *self._record_arrays, self._num_merges)
+        merged = count - self._num_merges
+        self._num_merges = count
+        self.num_components -= merged
+        
+        return merged
     
     def get_merge_threshold(self, percentile: float = 50.0) -> float:
         """
@@ -171,11 +376,10 @@ class WeightedUnionFind(UnionFind):
         Returns:
             权重阈值
         """
-        if not self.merge_history:
+        if self._num_merges == 0:
             return 0.0
         
-        weights = [info['weight'] for info in self.merge_history]
-        return np.percentile(weights, percentile)
+        return np.percentile(self.merge_records['weight'], percentile)
 
 
 class SegmentationUnionFind(WeightedUnionFind):
@@ -192,16 +396,7 @@ class SegmentationUnionFind(WeightedUnionFind):
         super().__init__(height * width)
         self.height = height
         self.width = width
-        self.pixel_to_idx = {}
-        self.idx_to_pixel = {}
-        
-        # 建立像素坐标到索引的映射
-        idx = 0
-        for row in range(height):
-            for col in range(width):
-                self.pixel_to_idx[(row, col)] = idx
-                self.idx_to_pixel[idx] = (row, col)
-                idx += 1
+        # 像素索引按行优先排列 idx = row * width + col，不再建立坐标映射字典
     
     def union_pixels(self, pixel1: tuple, pixel2: tuple, weight: float) -> bool:
         """
@@ -215,10 +410,42 @@ class SegmentationUnionFind(WeightedUnionFind):
         Returns:
             是否成功合并
         """
-        idx1 = self.pixel_to_idx[pixel1]
-        idx2 = self.pixel_to_idx[pixel2]
+        for row, col in (pixel1, pixel2):
+            if not (0 <= row < self.height and 0 <= col < self.width):
+                raise IndexError(f"像素坐标超出图像范围: {(row, col)}")
+        idx1 = pixel1[0] * self.width + pixel1[1]
+        idx2 = pixel2[0] * self.width + pixel2[1]
         return self.union_with_weight(idx1, idx2, weight)
     
+    def union_pixels_batch(self,
+                           rows1: np.ndarray, cols1: np.ndarray,
+                           rows2: np.ndarray, cols2: np.ndarray,
+                           weights: np.ndarray) -> int:
+        """
+        批量合并像素对
+        
+        像素索引按行优先排列，直接由坐标计算 row * width + col。
+        
+        Args:
+            rows1: 第一个像素的行坐标数组
+            cols1: 第一个像素的列坐标数组
+            rows2: 第二个像素的行坐标数组
+            cols2: 第二个像素的列坐标数组
+            weights: 边权重数组
+            
+        Returns:
+            成功合并的次数
+        """
+        rows1, cols1, rows2, cols2 = map(np.asarray, (rows1, cols1, rows2, cols2))
+        # 列坐标越界时扁平索引仍可能落在 [0, n) 内，因此按坐标检查
+        for rows, cols in ((rows1, cols1), (rows2, cols2)):
+            if rows.size > 0 and (rows.min() < 0 or rows.max() >= self.height or
+                                  cols.min() < 0 or cols.max() >= self.width):
+                raise IndexError("像素坐标超出图像范围")
+        idx1 = rows1 * self.width + cols1
+        idx2 = rows2 * self.width + cols2
+        return self.union_batch(idx1, idx2, weights)
+    
     def get_segmentation_map(self) -> np.ndarray:
         """
         获取分割结果图
@@ -226,18 +453,10 @@ class SegmentationUnionFind(WeightedUnionFind):
         Returns:
             分割标签图 (height, width)
         """
-        label_map = np.zeros((self.height, self.width), dtype=np.int32)
-        
-        # 获取所有连通分量
-        components = self.get_components()
-        
-        # 为每个分量分配标签
-        for label, (root, pixels) in enumerate(components.items()):
-            for pixel_idx in pixels:
-                row, col = self.idx_to_pixel[pixel_idx]
-                label_map[row, col] = label
-        
-        return label_map
+        # 一次求出所有像素的根，标签按分量首个像素的出现顺序编号，
+        # 与get_components的顺序保持一致
+        _, labels = _component_labels(_find_all(self.parent))
+        return labels.reshape(self.height, self.width)
     
     def get_segment_statistics(self) -> Dict:
         """
@@ -246,12 +465,11 @@ class SegmentationUnionFind(WeightedUnionFind):
         Returns:
             统计信息字典
         """
-        components = self.get_components()
-        
-        sizes = [len(pixels) for pixels in components.values()]
+        starts, _ = self.get_components_indexed()
+        sizes = np.diff(starts)
         
         stats = {
-            'num_segments': len(components),
+            'num_segments': len(sizes),
             'avg_segment_size': np.mean(sizes),
             'max_segment_size': np.max(sizes),
             'min_segment_size': np.min(sizes),
@@ -271,15 +489,16 @@ class SegmentationUnionFind(WeightedUnionFind):
         Returns:
             过滤后的分割信息
         """
-        components = self.get_components()
-        filtered_components = {}
-        small_segments = []
+        starts, order = self.get_components_indexed()
+        counts = np.diff(starts)
+        roots = self.parent[order[starts[:-1]]]
+        is_small = counts < min_size
         
-        for root, pixels in components.items():
-            if len(pixels) >= min_size:
-                filtered_components[root] = pixels
-            else:
-                small_segments.extend(pixels)
+        # 大区域按分量切分成列表，小区域的像素按分量顺序拼接在一起
+        members = np.split(order, starts[1:-1])
+        filtered_components = {int(roots[k]): members[k].tolist()
+                               for k in np.flatnonzero(~is_small).tolist()}
+        small_segments = order[np.repeat(is_small, counts)].tolist()
         
         return {
             'filtered_components': filtered_components,
@@ -295,19 +514,26 @@ class SegmentationUnionFind(WeightedUnionFind):
         
         Args:
             min_size: 最小区域大小
-            adjacency_info: 邻接信息
+            adjacency_info: 邻接信息，邻接表字典或CSR邻接矩阵
         """
-        filter_result = self.filter_small_segments(min_size)
-        small_segments = filter_result['small_segments']
-        
-        for pixel_idx in small_segments:
-            pixel = self.idx_to_pixel[pixel_idx]
-            
-            # 找到相邻的大区域
-            neighbors = adjacency_info.get(pixel_idx, [])
-            for neighbor_idx in neighbors:
-                neighbor_root = self.find(neighbor_idx)
-                if self.size[neighbor_root] >= min_size:
-                    # 合并到这个大区域
-                    self.union(pixel_idx, neighbor_idx)
-                    break
+        # 小区域的全部像素，按分量顺序排列
+        starts, order = self.get_components_indexed()
+        counts = np.diff(starts)
+        small_pixels = order[np.repeat(counts < min_size, counts)]
+        
+        if hasattr(adjacency_info, 'indptr'):
+            indptr, indices = adjacency_info.indptr, adjacency_info.indices
+        else:
+            # 邻接表字典转换为CSR数组，保持每个节点的邻居顺序
+            nodes = sorted(adjacency_info)
+            degrees = np.zeros(len(self.parent), dtype=np.int64)
+            degrees[nodes] = [len(adjacency_info[node]) for node in nodes]
+            indptr = np.zeros(len(self.parent) + 1, dtype=np.int64)
+            np.cumsum(degrees, out=indptr[1:])
+            indices = np.fromiter(itertools.chain.from_iterable(adjacency_info[node] for node in nodes),
+                                  dtype=np.int64, count=int(indptr[-1]))
+        
+        # 逐像素找到相邻的大区域并合并（合并后区域变大，会影响之后像素的判断，
+        # 因此按顺序在编译后的内核中执行）
+        self.num_components -= _merge_into_large(self.parent, self.rank, self.size, small_pixels,
+                                                 indptr, indices, min_size)
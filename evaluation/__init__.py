@@ -1,11 +1,20 @@
 """
 评估模块
 包含性能评估和算法对比的工具
+
+PerformanceAnalyzer和AlgorithmComparator依赖matplotlib/pandas等较重的库，
+在首次访问时才导入（PEP 562），只使用SegmentationMetrics时不承担这部分开销。
 """
 
+import importlib
+
 from .metrics import SegmentationMetrics, PerformanceProfiler
-from .performance_analyzer import PerformanceAnalyzer
-from .comparison_tools import AlgorithmComparator
+
+# 延迟导入的属性 -> 所在子模块
+_LAZY_ATTRIBUTES = {
+    'PerformanceAnalyzer': '.performance_analyzer',
+    'AlgorithmComparator': '.comparison_tools',
+}
 
 __all__ = [
     'SegmentationMetrics',
@@ -13,3 +22,16 @@ __all__ = [
     'PerformanceAnalyzer',
     'AlgorithmComparator'
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
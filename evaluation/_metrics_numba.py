@@ -0,0 +1,88 @@
+"""
+分割评估指标的Numba内核
+一次遍历标签图和图像，同时累加每个区域的各通道一阶、二阶矩和边界像素数
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange, get_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# 各分块累加数组的区域总数上限（分块数 × 区域数），标签很多时减少分块数以限制内存
+_MAX_PARTIAL_REGIONS = 1 << 20
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _region_sums(pixels, labels, num_labels, num_chunks):
+        """
+        按行分块并行累加每个区域的统计量
+
+        每个分块写入自己的累加数组，避免多个线程同时更新同一区域，由调用方
+        对分块维求和。
+
+        Args:
+            pixels: 图像 (H, W, C)
+            labels: 稠密编号的标签图 (H, W)，取值在 [0, num_labels)
+            num_labels: 区域数
+            num_chunks: 行分块数
+
+        Returns:
+            (s1, s2, perimeters)：各分块的各通道像素值之和 (K, L, C) float64、
+            平方和 (K, L, C) float64，以及8邻域内（不含图像外）存在其他标签的
+            像素数 (K, L) int64
+        """
+        height, width, channels = pixels.shape
+        s1 = np.zeros((num_chunks, num_labels, channels))
+        s2 = np.zeros((num_chunks, num_labels, channels))
+        perimeters = np.zeros((num_chunks, num_labels), dtype=np.int64)
+        rows_per_chunk = (height + num_chunks - 1) // num_chunks
+
+        for k in prange(num_chunks):
+            for y in range(k * rows_per_chunk, min(height, (k + 1) * rows_per_chunk)):
+                for x in range(width):
+                    label = labels[y, x]
+                    for c in range(channels):
+                        v = np.float64(pixels[y, x, c])
+                        s1[k, label, c] += v
+                        s2[k, label, c] += v * v
+
+                    # 与3x3腐蚀一致：8邻域内有其他标签即为边界像素
+                    y0, y1 = max(y - 1, 0), min(y + 2, height)
+                    x0, x1 = max(x - 1, 0), min(x + 2, width)
+                    boundary = False
+                    yy = y0
+                    while yy < y1 and not boundary:
+                        for xx in range(x0, x1):
+                            if labels[yy, xx] != label:
+                                boundary = True
+                                break
+                        yy += 1
+                    if boundary:
+                        perimeters[k, label] += 1
+
+        return s1, s2, perimeters
+
+
+def region_sums(image: np.ndarray, labels: np.ndarray, num_labels: int):
+    """
+    调用_region_sums内核并合并各分块的结果，灰度图像按单通道处理
+
+    Args:
+        image: 图像 (H, W) 或 (H, W, C)
+        labels: 稠密编号的标签图 (H, W)
+        num_labels: 区域数
+
+    Returns:
+        (s1, s2, perimeters)：各区域各通道像素值之和 (L, C)、平方和 (L, C)
+        和周长 (L,)
+    """
+    pixels = image if image.ndim == 3 else image[:, :, np.newaxis]
+    num_chunks = max(1, min(get_num_threads(), labels.shape[0],
+                            _MAX_PARTIAL_REGIONS // max(num_labels, 1)))
+    s1, s2, perimeters = _region_sums(pixels, labels, num_labels, num_chunks)
+    return s1.sum(axis=0), s2.sum(axis=0), perimeters.sum(axis=0)
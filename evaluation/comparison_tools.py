@@ -6,16 +6,185 @@
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 from matplotlib.gridspec import GridSpec
-import seaborn as sns
 from typing import Dict, List, Tuple, Any, Optional, Callable
-import pandas as pd
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import pickle
 import time
 
 from .metrics import SegmentationMetrics
 from .performance_analyzer import PerformanceAnalyzer
+from utils.logger import get_global_logger
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# 可视化图像的最长边上限：子图按300 DPI栅格化后不超过该尺寸，更大的分辨率
+# 在保存的图中不可见
+DISPLAY_MAX_SIZE = 1200
+
+# tab20的20种颜色 (20, 3) uint8，模块加载时从colormap取一次
+_TAB20_COLORS = np.round(plt.cm.tab20(np.arange(plt.cm.tab20.N))[:, :3] * 255).astype(np.uint8)
+
+# 按标签数缓存的颜色查找表，条目过多时整体清空
+_LABEL_COLORS_CACHE: Dict[int, np.ndarray] = {}
+_LABEL_COLORS_CACHE_SIZE = 64
+
+# 每个比较器缓存的比较图数量上限
+_FIGURE_CACHE_SIZE = 8
+
+
+def _label_colors(num_labels: int) -> np.ndarray:
+    """
+    num_labels个标签的颜色查找表
+    
+    与 plt.cm.tab20(np.linspace(0, 1, num_labels)) 的取色一致：ListedColormap
+    把 x 映射到第 min(int(x * N), N - 1) 种颜色。
+    
+    Args:
+        num_labels: 标签数
+        
+    Returns:
+        颜色查找表 (num_labels, 3) uint8，只读
+    """
+    lut = _LABEL_COLORS_CACHE.get(num_labels)
+    if lut is None:
+        n = len(_TAB20_COLORS)
+        index = np.minimum((np.linspace(0, 1, num_labels) * n).astype(np.intp), n - 1)
+        lut = _TAB20_COLORS[index]
+        lut.flags.writeable = False
+        if len(_LABEL_COLORS_CACHE) >= _LABEL_COLORS_CACHE_SIZE:
+            _LABEL_COLORS_CACHE.clear()
+        _LABEL_COLORS_CACHE[num_labels] = lut
+    return lut
+
+
+def _display_shape(height: int, width: int, max_size: int = DISPLAY_MAX_SIZE) -> Tuple[int, int]:
+    """按比例缩小后的显示尺寸 (高, 宽)，最长边为max_size"""
+    scale = max_size / max(height, width)
+    return max(int(round(height * scale)), 1), max(int(round(width * scale)), 1)
+
+
+def _downscale_for_display(*arrays: np.ndarray,
+                           max_size: int = DISPLAY_MAX_SIZE) -> Tuple[np.ndarray, ...]:
+    """
+    最近邻缩小同尺寸的数组，使最长边不超过max_size
+    
+    最近邻采样保持标签值不变；按下标取样与cv2.INTER_NEAREST的取样位置一致，
+    且不受cv2.resize支持的数据类型限制（如int64标签）。
+    
+    Args:
+        *arrays: 前两维尺寸相同的数组 (H, W, ...)
+        max_size: 最长边上限
+        
+    Returns:
+        缩小后的数组元组；无需缩小时原样返回
+    """
+    height, width = arrays[0].shape[:2]
+    if max(height, width) <= max_size:
+        return arrays
+    
+    new_height, new_width = _display_shape(height, width, max_size)
+    rows = (np.arange(new_height) * (height / new_height)).astype(np.intp)
+    cols = (np.arange(new_width) * (width / new_width)).astype(np.intp)
+    return tuple(a[rows[:, None], cols] for a in arrays)
+
+
+def _label_values(label_map: np.ndarray) -> np.ndarray:
+    """
+    标签图中出现的标签值（升序）
+    
+    整数标签取值范围不大时用 (标签 - 最小值) 索引的存在表代替np.unique的排序。
+    
+    Args:
+        label_map: 标签图
+        
+    Returns:
+        升序排列的唯一标签值 (L,)
+    """
+    flat = label_map.reshape(-1)
+    if flat.size > 0 and np.issubdtype(flat.dtype, np.integer):
+        offset = int(flat.min())
+        span = int(flat.max()) - offset + 1
+        if span <= 4 * flat.size + 1024:
+            present = np.zeros(span, dtype=bool)
+            present[np.subtract(flat, offset, dtype=np.intp)] = True
+            return (np.flatnonzero(present) + offset).astype(flat.dtype)
+    return np.unique(flat)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _colorize(labels, offset, remap, lut, out):
+        """按稠密重映射表把扁平标签逐像素写成uint8 RGB（表外的标签取第0种颜色）"""
+        n = remap.shape[0]
+        for i in prange(labels.shape[0]):
+            v = labels[i] - offset
+            c = remap[v] if 0 <= v < n else 0
+            out[i, 0] = lut[c, 0]
+            out[i, 1] = lut[c, 1]
+            out[i, 2] = lut[c, 2]
+
+    @njit(parallel=True, cache=True)
+    def _colorize_direct(labels, offset, lut, out):
+        """标签连续时直接以 (标签 - 最小值) 为颜色下标写出uint8 RGB"""
+        n = lut.shape[0]
+        for i in prange(labels.shape[0]):
+            v = labels[i] - offset
+            c = v if 0 <= v < n else 0
+            out[i, 0] = lut[c, 0]
+            out[i, 1] = lut[c, 1]
+            out[i, 2] = lut[c, 2]
+else:
+    def _colorize(labels, offset, remap, lut, out):
+        """按稠密重映射表把扁平标签逐像素写成uint8 RGB（表外的标签取第0种颜色）"""
+        v = np.subtract(labels, offset, dtype=np.intp)
+        valid = (v >= 0) & (v < remap.shape[0])
+        out[:] = lut[np.where(valid, remap[np.where(valid, v, 0)], 0)]
+
+    def _colorize_direct(labels, offset, lut, out):
+        """标签连续时直接以 (标签 - 最小值) 为颜色下标写出uint8 RGB"""
+        v = np.subtract(labels, offset, dtype=np.intp)
+        out[:] = lut[np.where((v >= 0) & (v < lut.shape[0]), v, 0)]
+
+
+def _profile_in_worker(shm_name: str,
+                       shape: Tuple[int, ...],
+                       dtype: str,
+                       algorithm: Dict) -> Dict[str, Any]:
+    """
+    在子进程中分析单个算法（测试图像通过共享内存传入，不随任务序列化）
+    
+    Args:
+        shm_name: 存放测试图像的共享内存名
+        shape: 图像形状
+        dtype: 图像数据类型
+        algorithm: 算法描述 {'name': str, 'func': callable, 'params': dict}
+        
+    Returns:
+        profile_segmentation_algorithm的性能分析结果
+    """
+    # 复制出进程私有的图像后立即释放共享内存映射，算法结果不会引用共享缓冲区
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    
+    return PerformanceAnalyzer().profile_segmentation_algorithm(
+        algorithm['func'],
+        image,
+        algorithm['name'],
+        algorithm.get('params', {})
+    )
 
 
 class AlgorithmComparator:
@@ -33,13 +202,19 @@ class AlgorithmComparator:
         self.metrics_calculator = SegmentationMetrics()
         self.performance_analyzer = PerformanceAnalyzer()
         self.comparison_results = []
+        # 可视化缓存：键为 (类型, 输入数组id...)，值为 (输入数组, 结果)；
+        # 保留输入数组引用以防id被回收后复用
+        self._viz_cache: Dict[tuple, Tuple[tuple, np.ndarray]] = {}
+        # 比较图缓存：键为 (比较结果时间戳, show_metrics, show_performance)
+        self._figure_cache: Dict[Tuple[float, bool, bool], plt.Figure] = {}
     
     def compare_algorithms(self,
                          algorithms: List[Dict],
                          test_image: np.ndarray,
                          ground_truth: Optional[np.ndarray] = None,
                          save_results: bool = True,
-                         output_dir: str = "comparison_results") -> Dict[str, Any]:
+                         output_dir: str = "comparison_results",
+                         max_workers: Optional[int] = 1) -> Dict[str, Any]:
         """
         比较多个算法的性能和结果
         
@@ -49,31 +224,42 @@ class AlgorithmComparator:
             ground_truth: 真实标签（可选）
             save_results: 是否保存结果
             output_dir: 输出目录
+            max_workers: 并行运行算法的进程数，1表示串行，None表示按CPU核数；
+                并行时各算法争用CPU和内存，计时与内存指标会相互干扰
             
         Returns:
             比较结果字典
         """
         print(f"开始比较 {len(algorithms)} 个算法...")
+        self._viz_cache.clear()
         
         # 存储所有结果
         algorithm_results = {}
         performance_results = {}
         
+        # 并行时预先在子进程中运行可序列化的算法，其余算法仍在本进程串行运行
+        parallel_results = {}
+        if max_workers != 1 and len(algorithms) > 1:
+            parallel_results = self._profile_algorithms_parallel(
+                algorithms, test_image, max_workers
+            )
+        
         # 对每个算法进行测试
         for i, algorithm in enumerate(algorithms):
             print(f"\n测试算法 {i+1}/{len(algorithms)}: {algorithm['name']}")
             
             try:
                 # 执行算法并测量性能
-                start_time = time.time()
-                
-                # 性能分析
-                perf_result = self.performance_analyzer.profile_segmentation_algorithm(
-                    algorithm['func'],
-                    test_image,
-                    algorithm['name'],
-                    algorithm.get('params', {})
-                )
+                perf_result = parallel_results.get(i)
+                if perf_result is None:
+                    perf_result = self.performance_analyzer.profile_segmentation_algorithm(
+                        algorithm['func'],
+                        test_image,
+                        algorithm['name'],
+                        algorithm.get('params', {})
+                    )
+                else:
+                    self.performance_analyzer.results.append(perf_result)
                 
                 if perf_result['success']:
                     segmentation_result = perf_result['result']
@@ -96,6 +282,7 @@ class AlgorithmComparator:
                     
                     algorithm_results[algorithm['name']] = {
                         'label_map': label_map,
+                        'unique_labels': _label_values(label_map),
                         'metrics': metrics,
                         'segmentation_result': segmentation_result,
                         'success': True
@@ -119,14 +306,16 @@ class AlgorithmComparator:
                     'error': str(e)
                 }
         
-        # 生成比较结果
+        # 生成比较结果（成功算法列表只计算一次，供摘要和可视化复用）
+        successful_algorithms = self._successful_algorithms(algorithm_results)
         comparison_result = {
             'test_image': test_image,
             'ground_truth': ground_truth,
             'algorithm_results': algorithm_results,
             'performance_results': performance_results,
+            'successful_algorithms': successful_algorithms,
             'comparison_summary': self._generate_comparison_summary(
-                algorithm_results, performance_results
+                algorithm_results, performance_results, successful_algorithms
             ),
             'timestamp': time.time()
         }
@@ -139,6 +328,68 @@ class AlgorithmComparator:
         
         return comparison_result
     
+    def _profile_algorithms_parallel(self,
+                                    algorithms: List[Dict],
+                                    test_image: np.ndarray,
+                                    max_workers: Optional[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        在进程池中并行分析可序列化的算法
+        
+        测试图像只复制一次到共享内存；无法序列化的算法或进程池中出错的
+        任务不出现在返回结果中，由调用方回退到串行执行。
+        
+        Args:
+            algorithms: 算法列表
+            test_image: 测试图像
+            max_workers: 最大进程数，None表示按CPU核数
+            
+        Returns:
+            {算法下标: 性能分析结果}
+        """
+        picklable = []
+        for i, algorithm in enumerate(algorithms):
+            try:
+                pickle.dumps(algorithm)
+                picklable.append(i)
+            except Exception as e:
+                get_global_logger().warning(
+                    f"算法 {algorithm['name']} 无法序列化，改为在本进程串行运行: {e}"
+                )
+        
+        if len(picklable) <= 1 or test_image.dtype.hasobject:
+            return {}
+        
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, len(picklable))
+        
+        image = np.ascontiguousarray(test_image)
+        shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+        results = {}
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            
+            # 用spawn启动子进程：本进程可能已启动numba/TBB线程池，fork后不安全
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                futures = {
+                    i: executor.submit(_profile_in_worker, shm.name, image.shape,
+                                       image.dtype.str, algorithms[i])
+                    for i in picklable
+                }
+                for i, future in futures.items():
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        get_global_logger().warning(
+                            f"算法 {algorithms[i]['name']} 在子进程中运行失败，改为在本进程串行运行: {e}"
+                        )
+        finally:
+            shm.close()
+            shm.unlink()
+        
+        return results
+    
     def visualize_comparison(self,
                            comparison_result: Dict[str, Any],
                            show_metrics: bool = True,
@@ -156,15 +407,22 @@ class AlgorithmComparator:
         Returns:
             matplotlib图形对象
         """
+        # 同一比较结果、同样选项的图形已绘制且仍未关闭时直接复用
+        cache_key = (comparison_result.get('timestamp'), show_metrics, show_performance)
+        fig = self._figure_cache.get(cache_key)
+        if fig is not None and plt.fignum_exists(fig.number):
+            if save_path:
+                fig.savefig(save_path, dpi=300, bbox_inches='tight')
+            return fig
+        
         algorithm_results = comparison_result['algorithm_results']
         performance_results = comparison_result['performance_results']
         test_image = comparison_result['test_image']
         
-        # 过滤成功的结果
-        successful_algorithms = [
-            name for name, result in algorithm_results.items() 
-            if result.get('success', False)
-        ]
+        # 过滤成功的结果（旧的比较结果中没有缓存的列表时现场计算）
+        successful_algorithms = comparison_result.get('successful_algorithms')
+        if successful_algorithms is None:
+            successful_algorithms = self._successful_algorithms(algorithm_results)
         
         if not successful_algorithms:
             print("没有成功的算法结果可以可视化")
@@ -175,14 +433,15 @@ class AlgorithmComparator:
         num_rows = 2 + (1 if show_metrics else 0) + (1 if show_performance else 0)
         
         # 创建图形
-        fig = plt.figure(figsize=(4 * num_algorithms, 4 * num_rows))
+        # constrained_layout在绘制时布局，无需另外调用tight_layout
+        fig = plt.figure(figsize=(4 * num_algorithms, 4 * num_rows), constrained_layout=True)
         gs = GridSpec(num_rows, num_algorithms, figure=fig)
         
         # 第一行：原始图像
         for i in range(num_algorithms):
             ax = fig.add_subplot(gs[0, i])
             if i == 0:
-                ax.imshow(test_image)
+                ax.imshow(self._create_display_image(test_image), rasterized=True)
                 ax.set_title("原始图像")
             else:
                 ax.axis('off')
@@ -195,8 +454,10 @@ class AlgorithmComparator:
             label_map = algorithm_results[alg_name]['label_map']
             
             # 创建彩色分割图
-            colored_segmentation = self._create_colored_segmentation(label_map)
-            ax.imshow(colored_segmentation)
+            colored_segmentation = self._create_colored_segmentation(
+                label_map, algorithm_results[alg_name].get('unique_labels')
+            )
+            ax.imshow(colored_segmentation, rasterized=True)
             ax.set_title(f"{alg_name}\n分割结果")
             ax.set_xticks([])
             ax.set_yticks([])
@@ -214,77 +475,161 @@ class AlgorithmComparator:
             ax = fig.add_subplot(gs[current_row, :])
             self._plot_performance_comparison(ax, performance_results, successful_algorithms)
         
-        plt.tight_layout()
-        
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            fig.savefig(save_path, dpi=300, bbox_inches='tight')
         
+        self._cache_figure(cache_key, fig)
         return fig
     
-    def _create_colored_segmentation(self, label_map: np.ndarray) -> np.ndarray:
-        """创建彩色分割图"""
-        # 获取唯一标签
-        unique_labels = np.unique(label_map)
-        num_labels = len(unique_labels)
-        
-        # 创建颜色映射
-        colors = plt.cm.tab20(np.linspace(0, 1, num_labels))
-        
-        # 创建彩色图像
-        colored = np.zeros((*label_map.shape, 3))
-        for i, label in enumerate(unique_labels):
-            mask = label_map == label
-            colored[mask] = colors[i][:3]
-        
-        return colored
+    def _cache_figure(self, key: Tuple[float, bool, bool], fig: plt.Figure):
+        """缓存比较图，超出上限时丢弃最早的条目（缺少时间戳的比较结果不缓存）"""
+        if key[0] is None:
+            return
+        self._figure_cache.pop(key, None)
+        self._figure_cache[key] = fig
+        while len(self._figure_cache) > _FIGURE_CACHE_SIZE:
+            del self._figure_cache[next(iter(self._figure_cache))]
+    
+    def _create_colored_segmentation(self,
+                                     label_map: np.ndarray,
+                                     unique_labels: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        创建彩色分割图
+        
+        颜色按全分辨率标签图的唯一标签（升序）分配；超过DISPLAY_MAX_SIZE的
+        标签图先按最近邻缩小再着色。整数标签连续时直接以 (标签 - 最小值)
+        查颜色表；取值范围不大时经稠密重映射表查表；两者都由逐像素内核直接
+        写出uint8 RGB。其他情况用searchsorted查颜色下标。
+        
+        Args:
+            label_map: 标签图 (H, W)
+            unique_labels: label_map的升序唯一标签（如compare_algorithms结果中的
+                'unique_labels'），None时现场计算
+            
+        Returns:
+            彩色分割图 (h, w, 3) uint8，最长边不超过DISPLAY_MAX_SIZE
+        """
+        cached = self._get_cached_visual('colored', label_map)
+        if cached is not None:
+            return cached
+        
+        if unique_labels is None:
+            unique_labels = _label_values(label_map)
+        
+        source = label_map
+        label_map, = _downscale_for_display(label_map)
+        flat = label_map.reshape(-1)
+        colored = np.zeros((flat.size, 3), dtype=np.uint8)
+        
+        if flat.size > 0 and len(unique_labels) > 0:
+            # 颜色查找表：第i个唯一标签（按升序）对应第i种颜色
+            lut = _label_colors(len(unique_labels))
+            dense = False
+            if np.issubdtype(unique_labels.dtype, np.integer):
+                offset = int(unique_labels[0])
+                span = int(unique_labels[-1]) - offset + 1
+                dense = span <= 4 * source.size + 1024
+            
+            if dense and span == len(unique_labels):
+                # 标签连续（常见的 [0, K) 情形）：颜色下标即 标签 - 最小值
+                _colorize_direct(flat, offset, lut, colored)
+            elif dense:
+                remap = np.zeros(span, dtype=np.int32)
+                remap[np.subtract(unique_labels, offset, dtype=np.intp)] = np.arange(
+                    len(unique_labels), dtype=np.int32
+                )
+                _colorize(flat, offset, remap, lut, colored)
+            else:
+                index = np.searchsorted(unique_labels, flat)
+                colored[:] = lut[np.minimum(index, len(unique_labels) - 1)]
+        
+        colored = colored.reshape(label_map.shape + (3,))
+        return self._put_cached_visual('colored', colored, source)
+    
+    def _create_display_image(self, image: np.ndarray) -> np.ndarray:
+        """
+        获取用于显示的原始图像
+        
+        超过DISPLAY_MAX_SIZE时用区域插值缩小（与matplotlib缩小显示时的抗锯齿
+        效果接近），cv2不支持的数据类型退回最近邻；否则原样返回。
+        
+        Args:
+            image: 原始图像 (H, W) 或 (H, W, C)
+            
+        Returns:
+            显示图像，最长边不超过DISPLAY_MAX_SIZE
+        """
+        height, width = image.shape[:2]
+        if max(height, width) <= DISPLAY_MAX_SIZE:
+            return image
+        
+        cached = self._get_cached_visual('display', image)
+        if cached is not None:
+            return cached
+        
+        if image.dtype in (np.uint8, np.uint16, np.float32, np.float64):
+            new_height, new_width = _display_shape(height, width)
+            display = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        else:
+            display, = _downscale_for_display(image)
+        return self._put_cached_visual('display', display, image)
+    
+    def _get_cached_visual(self, kind: str, *sources: np.ndarray) -> Optional[np.ndarray]:
+        """按输入数组的身份查找已生成的可视化图像，未命中返回None"""
+        entry = self._viz_cache.get((kind,) + tuple(id(a) for a in sources))
+        if entry is not None and all(a is b for a, b in zip(entry[0], sources)):
+            return entry[1]
+        return None
+    
+    def _put_cached_visual(self, kind: str, result: np.ndarray, *sources: np.ndarray) -> np.ndarray:
+        """缓存可视化图像（只读，多个图形共享同一份数据）"""
+        result.flags.writeable = False
+        self._viz_cache[(kind,) + tuple(id(a) for a in sources)] = (sources, result)
+        return result
     
     def _plot_metrics_comparison(self, 
                                ax: plt.Axes, 
                                algorithm_results: Dict, 
                                algorithm_names: List[str]):
         """绘制评估指标对比"""
-        # 收集指标数据
-        metrics_data = []
+        # 收集各算法的有效指标
+        valid_metrics = []
         for alg_name in algorithm_names:
             metrics = algorithm_results[alg_name]['metrics']
-            for metric_name, value in metrics.items():
-                if isinstance(value, (int, float)) and not np.isnan(value):
-                    metrics_data.append({
-                        'Algorithm': alg_name,
-                        'Metric': metric_name,
-                        'Value': value
-                    })
-        
-        if not metrics_data:
+            valid_metrics.append({
+                metric_name: value for metric_name, value in metrics.items()
+                if isinstance(value, (int, float)) and not np.isnan(value)
+            })
+        
+        if not any(valid_metrics):
             ax.text(0.5, 0.5, '没有可用的评估指标', 
                    ha='center', va='center', transform=ax.transAxes)
             return
         
-        # 创建DataFrame
-        df = pd.DataFrame(metrics_data)
-        
         # 选择主要指标进行显示
         main_metrics = [
             'intra_region_variance', 'inter_region_contrast', 
             'boundary_recall', 'region_compactness'
         ]
         
-        available_metrics = [m for m in main_metrics if m in df['Metric'].values]
-        if available_metrics:
-            df_filtered = df[df['Metric'].isin(available_metrics)]
+        # 按首次出现的顺序列出可用的主要指标
+        metric_names = []
+        for metrics in valid_metrics:
+            for metric_name in metrics:
+                if metric_name in main_metrics and metric_name not in metric_names:
+                    metric_names.append(metric_name)
+        
+        if metric_names:
+            # 指标值矩阵 (算法数, 指标数)，缺失的指标记为0
+            values = np.array([[metrics.get(m, 0) for m in metric_names]
+                               for metrics in valid_metrics], dtype=float)
             
             # 创建分组柱状图
-            metric_names = df_filtered['Metric'].unique()
             x = np.arange(len(metric_names))
             width = 0.8 / len(algorithm_names)
             
             for i, alg_name in enumerate(algorithm_names):
-                alg_data = df_filtered[df_filtered['Algorithm'] == alg_name]
-                values = [alg_data[alg_data['Metric'] == m]['Value'].iloc[0] 
-                         if len(alg_data[alg_data['Metric'] == m]) > 0 else 0 
-                         for m in metric_names]
-                
-                ax.bar(x + i * width, values, width, label=alg_name)
+                ax.bar(x + i * width, values[i], width, label=alg_name)
             
             ax.set_xlabel('评估指标')
             ax.set_ylabel('指标值')
@@ -331,15 +676,8 @@ class AlgorithmComparator:
         ax.set_xticklabels(algorithm_names, rotation=45)
         
         # 添加数值标签
-        for bar, value in zip(bars1, exec_times):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                   f'{value:.3f}s', ha='center', va='bottom')
-        
-        for bar, value in zip(bars2, memory_usage):
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{value:.1f}MB', ha='center', va='bottom')
+        ax.bar_label(bars1, labels=[f'{value:.3f}s' for value in exec_times])
+        ax2.bar_label(bars2, labels=[f'{value:.1f}MB' for value in memory_usage])
         
         ax.grid(True, alpha=0.3)
         
@@ -348,15 +686,22 @@ class AlgorithmComparator:
         lines2, labels2 = ax2.get_legend_handles_labels()
         ax.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
 
-    def _generate_comparison_summary(self,
-                                   algorithm_results: Dict,
-                                   performance_results: Dict) -> Dict[str, Any]:
-        """生成比较摘要"""
-        successful_algorithms = [
+    @staticmethod
+    def _successful_algorithms(algorithm_results: Dict) -> List[str]:
+        """按原顺序列出运行成功的算法名称"""
+        return [
             name for name, result in algorithm_results.items()
             if result.get('success', False)
         ]
 
+    def _generate_comparison_summary(self,
+                                   algorithm_results: Dict,
+                                   performance_results: Dict,
+                                   successful_algorithms: Optional[List[str]] = None) -> Dict[str, Any]:
+        """生成比较摘要（successful_algorithms为None时由algorithm_results现场计算）"""
+        if successful_algorithms is None:
+            successful_algorithms = self._successful_algorithms(algorithm_results)
+
         if not successful_algorithms:
             return {
                 'total_algorithms': len(algorithm_results),
@@ -391,28 +736,21 @@ class AlgorithmComparator:
         }
 
         # 如果有评估指标，找出质量最佳的算法
-        quality_scores = []
-        for name in successful_algorithms:
-            metrics = algorithm_results[name]['metrics']
-            # 简单的质量分数计算（可以根据需要调整）
-            score = 0
-            if 'inter_region_contrast' in metrics:
-                score += metrics['inter_region_contrast'] * 0.3
-            if 'boundary_recall' in metrics:
-                score += metrics['boundary_recall'] * 0.3
-            if 'region_compactness' in metrics:
-                score += metrics['region_compactness'] * 0.2
-            if 'segmentation_consistency' in metrics:
-                score += metrics['segmentation_consistency'] * 0.2
-
-            quality_scores.append(score)
-
-        if quality_scores:
-            best_quality_idx = np.argmax(quality_scores)
-            summary['best_quality_algorithm'] = {
-                'name': successful_algorithms[best_quality_idx],
-                'quality_score': quality_scores[best_quality_idx]
-            }
+        # 简单的质量分数：主要指标的加权和，缺失的指标记为0（可以根据需要调整）
+        quality_keys = ('inter_region_contrast', 'boundary_recall',
+                        'region_compactness', 'segmentation_consistency')
+        quality_weights = np.array([0.3, 0.3, 0.2, 0.2])
+        metric_matrix = np.array([
+            [algorithm_results[name]['metrics'].get(key, 0.0) for key in quality_keys]
+            for name in successful_algorithms
+        ], dtype=float)
+        quality_scores = (metric_matrix * quality_weights).sum(axis=1)
+
+        best_quality_idx = int(np.argmax(quality_scores))
+        summary['best_quality_algorithm'] = {
+            'name': successful_algorithms[best_quality_idx],
+            'quality_score': float(quality_scores[best_quality_idx])
+        }
 
         return summary
 
@@ -426,12 +764,14 @@ class AlgorithmComparator:
         # 生成时间戳
         timestamp = time.strftime("%Y%m%d_%H%M%S")
 
-        # 保存可视化结果
-        fig = self.visualize_comparison(comparison_result, save_path=None)
+        # 保存可视化结果（由visualize_comparison在绘制后直接保存）
+        fig = self.visualize_comparison(
+            comparison_result, save_path=str(output_path / f"comparison_{timestamp}.png")
+        )
         if fig:
-            fig.savefig(output_path / f"comparison_{timestamp}.png",
-                       dpi=300, bbox_inches='tight')
             plt.close(fig)
+            # 已关闭的图形不再复用，从缓存中移除以释放其引用
+            self._figure_cache.pop((comparison_result.get('timestamp'), True, True), None)
 
         # 保存详细报告
         self._generate_detailed_report(comparison_result, output_path, timestamp)
@@ -445,64 +785,68 @@ class AlgorithmComparator:
         """生成详细报告"""
         report_path = output_path / f"detailed_report_{timestamp}.txt"
 
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write("=" * 60 + "\n")
-            f.write("算法比较详细报告\n")
-            f.write("=" * 60 + "\n\n")
-
-            # 基本信息
-            f.write(f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"测试图像尺寸: {comparison_result['test_image'].shape}\n\n")
-
-            # 比较摘要
-            summary = comparison_result['comparison_summary']
-            f.write("比较摘要:\n")
-            f.write("-" * 30 + "\n")
-            f.write(f"总算法数: {summary['total_algorithms']}\n")
-            f.write(f"成功算法数: {summary['successful_algorithms']}\n")
-            f.write(f"失败算法数: {summary['failed_algorithms']}\n\n")
-
-            if summary['successful_algorithms'] > 0:
-                f.write(f"最快算法: {summary['fastest_algorithm']['name']} ")
-                f.write(f"({summary['fastest_algorithm']['execution_time']:.3f}s)\n")
-
-                f.write(f"最省内存算法: {summary['most_memory_efficient']['name']} ")
-                f.write(f"({summary['most_memory_efficient']['memory_usage']:.1f}MB)\n")
-
-                if 'best_quality_algorithm' in summary:
-                    f.write(f"最佳质量算法: {summary['best_quality_algorithm']['name']} ")
-                    f.write(f"(质量分数: {summary['best_quality_algorithm']['quality_score']:.3f})\n")
-
-                f.write(f"\n平均执行时间: {summary['average_execution_time']:.3f}s\n")
-                f.write(f"平均内存使用: {summary['average_memory_usage']:.1f}MB\n\n")
-
-            # 详细结果
-            f.write("详细结果:\n")
-            f.write("-" * 30 + "\n")
-
-            for alg_name, result in comparison_result['algorithm_results'].items():
-                f.write(f"\n算法: {alg_name}\n")
-
-                if result.get('success', False):
-                    f.write("状态: 成功\n")
-
-                    # 性能指标
-                    if alg_name in comparison_result['performance_results']:
-                        perf = comparison_result['performance_results'][alg_name]
-                        f.write(f"执行时间: {perf['execution_time']:.3f}s\n")
-                        f.write(f"内存使用: {perf['memory_used_mb']:.1f}MB\n")
-                        f.write(f"处理速度: {perf.get('pixels_per_second', 0):.0f} 像素/秒\n")
-
-                    # 评估指标
-                    metrics = result['metrics']
-                    f.write("评估指标:\n")
-                    for metric_name, value in metrics.items():
-                        if isinstance(value, (int, float)):
-                            f.write(f"  {metric_name}: {value:.4f}\n")
+        # 先拼接完整报告再一次写入，避免逐行write的调用开销
+        parts = []
+        parts.append("=" * 60 + "\n")
+        parts.append("算法比较详细报告\n")
+        parts.append("=" * 60 + "\n\n")
+
+        # 基本信息
+        parts.append(f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        parts.append(f"测试图像尺寸: {comparison_result['test_image'].shape}\n\n")
+
+        # 比较摘要
+        summary = comparison_result['comparison_summary']
+        parts.append("比较摘要:\n")
+        parts.append("-" * 30 + "\n")
+        parts.append(f"总算法数: {summary['total_algorithms']}\n")
+        parts.append(f"成功算法数: {summary['successful_algorithms']}\n")
+        parts.append(f"失败算法数: {summary['failed_algorithms']}\n\n")
+
+        if summary['successful_algorithms'] > 0:
+            parts.append(f"最快算法: {summary['fastest_algorithm']['name']} ")
+            parts.append(f"({summary['fastest_algorithm']['execution_time']:.3f}s)\n")
+
+            parts.append(f"最省内存算法: {summary['most_memory_efficient']['name']} ")
+            parts.append(f"({summary['most_memory_efficient']['memory_usage']:.1f}MB)\n")
+
+            if 'best_quality_algorithm' in summary:
+                parts.append(f"最佳质量算法: {summary['best_quality_algorithm']['name']} ")
+                parts.append(f"(质量分数: {summary['best_quality_algorithm']['quality_score']:.3f})\n")
+
+            parts.append(f"\n平均执行时间: {summary['average_execution_time']:.3f}s\n")
+            parts.append(f"平均内存使用: {summary['average_memory_usage']:.1f}MB\n\n")
+
+        # 详细结果
+        parts.append("详细结果:\n")
+        parts.append("-" * 30 + "\n")
+
+        for alg_name, result in comparison_result['algorithm_results'].items():
+            parts.append(f"\n算法: {alg_name}\n")
+
+            if result.get('success', False):
+                parts.append("状态: 成功\n")
+
+                # 性能指标
+                if alg_name in comparison_result['performance_results']:
+                    perf = comparison_result['performance_results'][alg_name]
+                    parts.append(f"执行时间: {perf['execution_time']:.3f}s\n")
+                    parts.append(f"内存使用: {perf['memory_used_mb']:.1f}MB\n")
+                    parts.append(f"处理速度: {perf.get('pixels_per_second', 0):.0f} 像素/秒\n")
+
+                # 评估指标
+                metrics = result['metrics']
+                parts.append("评估指标:\n")
+                parts.extend(f"  {metric_name}: {value:.4f}\n"
+                             for metric_name, value in metrics.items()
+                             if isinstance(value, (int, float)))
 
-                else:
-                    f.write("状态: 失败\n")
-                    f.write(f"错误: {result.get('error', '未知错误')}\n")
+            else:
+                parts.append("状态: 失败\n")
+                parts.append(f"错误: {result.get('error', '未知错误')}\n")
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("".join(parts))
 
         print(f"详细报告已保存到: {report_path}")
 
@@ -510,25 +854,38 @@ class AlgorithmComparator:
                                      algorithm_results: Dict[str, Any],
                                      test_image: np.ndarray,
                                      algorithm_names: List[str],
-                                     save_path: Optional[str] = None) -> plt.Figure:
+                                     save_path: Optional[str] = None,
+                                     max_workers: Optional[int] = None) -> plt.Figure:
         """
         创建并排对比图
 
+        各算法的边界叠加图在线程池中生成，同时在当前线程生成彩色分割图，
+        全部完成后再依次绘制。
+
         Args:
             algorithm_results: 算法结果字典
             test_image: 测试图像
             algorithm_names: 要比较的算法名称列表
             save_path: 保存路径
+            max_workers: 生成边界叠加图的线程数，1表示串行，None表示按CPU核数
 
         Returns:
             matplotlib图形对象
         """
+        successful_names = [
+            name for name in algorithm_names
+            if name in algorithm_results and algorithm_results[name].get('success', False)
+        ]
+        panels = self._prepare_panels(algorithm_results, test_image,
+                                      successful_names, max_workers)
+
         num_algorithms = len(algorithm_names)
         fig, axes = plt.subplots(2, num_algorithms + 1,
-                                figsize=(4 * (num_algorithms + 1), 8))
+                                figsize=(4 * (num_algorithms + 1), 8),
+                                constrained_layout=True)
 
         # 第一行第一列：原始图像
-        axes[0, 0].imshow(test_image)
+        axes[0, 0].imshow(self._create_display_image(test_image), rasterized=True)
         axes[0, 0].set_title("原始图像")
         axes[0, 0].set_xticks([])
         axes[0, 0].set_yticks([])
@@ -540,21 +897,17 @@ class AlgorithmComparator:
         for i, alg_name in enumerate(algorithm_names):
             col_idx = i + 1
 
-            if (alg_name in algorithm_results and
-                algorithm_results[alg_name].get('success', False)):
-
-                label_map = algorithm_results[alg_name]['label_map']
+            if alg_name in panels:
+                colored_seg, boundary_overlay = panels[alg_name]
 
                 # 第一行：分割结果
-                colored_seg = self._create_colored_segmentation(label_map)
-                axes[0, col_idx].imshow(colored_seg)
+                axes[0, col_idx].imshow(colored_seg, rasterized=True)
                 axes[0, col_idx].set_title(f"{alg_name}")
                 axes[0, col_idx].set_xticks([])
                 axes[0, col_idx].set_yticks([])
 
                 # 第二行：边界叠加
-                boundary_overlay = self._create_boundary_overlay(test_image, label_map)
-                axes[1, col_idx].imshow(boundary_overlay)
+                axes[1, col_idx].imshow(boundary_overlay, rasterized=True)
                 axes[1, col_idx].set_title(f"{alg_name} - 边界")
                 axes[1, col_idx].set_xticks([])
                 axes[1, col_idx].set_yticks([])
@@ -569,28 +922,86 @@ class AlgorithmComparator:
 
                 axes[1, col_idx].axis('off')
 
-        plt.tight_layout()
-
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            fig.savefig(save_path, dpi=300, bbox_inches='tight')
 
         return fig
 
+    def _prepare_panels(self,
+                        algorithm_results: Dict[str, Any],
+                        test_image: np.ndarray,
+                        algorithm_names: List[str],
+                        max_workers: Optional[int] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        生成各算法的彩色分割图与边界叠加图
+
+        边界叠加图（NumPy/OpenCV运算，执行时释放GIL）提交到线程池，彩色分割图
+        在当前线程生成，两者重叠进行。着色的numba并行内核只在调用线程中运行：
+        从工作线程进入并行内核会使TBB线程层在进程退出时挂起。
+
+        Args:
+            algorithm_results: 算法结果字典
+            test_image: 测试图像
+            algorithm_names: 成功的算法名称列表
+            max_workers: 线程数，1表示串行，None表示按CPU核数
+
+        Returns:
+            {算法名称: (彩色分割图, 边界叠加图)}
+        """
+        def colored(name):
+            result = algorithm_results[name]
+            return self._create_colored_segmentation(result['label_map'],
+                                                     result.get('unique_labels'))
+
+        def overlay(name):
+            return self._create_boundary_overlay(test_image, algorithm_results[name]['label_map'])
+
+        if len(algorithm_names) <= 1 or max_workers == 1:
+            return {name: (colored(name), overlay(name)) for name in algorithm_names}
+
+        if max_workers is None:
+            max_workers = min(len(algorithm_names), os.cpu_count() or 1)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            overlay_futures = [executor.submit(overlay, name) for name in algorithm_names]
+            colored_maps = [colored(name) for name in algorithm_names]
+            # 按算法原顺序收集结果
+            return {
+                name: (colored_map, future.result())
+                for name, colored_map, future in zip(algorithm_names, colored_maps, overlay_futures)
+            }
+
     def _create_boundary_overlay(self,
                                original_image: np.ndarray,
                                label_map: np.ndarray) -> np.ndarray:
-        """创建边界叠加图像"""
-        # 计算边界
-        grad_x = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 0, 1, ksize=3)
-        boundaries = np.sqrt(grad_x**2 + grad_y**2) > 0
-
-        # 创建叠加图像
-        overlay = original_image.copy()
+        """创建边界叠加图像 uint8 RGB（超过DISPLAY_MAX_SIZE时先按最近邻缩小）"""
+        cached = self._get_cached_visual('boundary', original_image, label_map)
+        if cached is not None:
+            return cached
+
+        image, labels = _downscale_for_display(original_image, label_map)
+
+        # 计算边界：与右/下邻居标签不同的像素对，两侧像素都标记为边界
+        boundaries = np.zeros(labels.shape, dtype=bool)
+        vertical = labels[:-1, :] != labels[1:, :]
+        horizontal = labels[:, :-1] != labels[:, 1:]
+        boundaries[:-1, :] |= vertical
+        boundaries[1:, :] |= vertical
+        boundaries[:, :-1] |= horizontal
+        boundaries[:, 1:] |= horizontal
+
+        # 创建叠加图像（统一为uint8；[0, 1] 范围的浮点图像先放大到 [0, 255]）
+        if image.dtype != np.uint8:
+            scale = 255.0 if image.dtype.kind == 'f' and image.size and image.max() <= 1.0 else 1.0
+            overlay = cv2.convertScaleAbs(image, alpha=scale)
+        elif image is original_image:
+            overlay = image.copy()
+        else:
+            overlay = image
         if len(overlay.shape) == 2:
             overlay = cv2.cvtColor(overlay, cv2.COLOR_GRAY2RGB)
 
         # 在边界处添加红色
         overlay[boundaries] = [255, 0, 0]
 
-        return overlay
+        return self._put_cached_visual('boundary', overlay, original_image, label_map)
@@ -5,19 +5,64 @@
 
 import numpy as np
 import cv2
+import scipy.sparse as sp
 from typing import Dict, List, Tuple, Optional
-from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
 import time
+import hashlib
 import psutil
 import os
 
+from ._metrics_numba import NUMBA_AVAILABLE
+
+if NUMBA_AVAILABLE:
+    from ._metrics_numba import region_sums
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+
+# 指标缓存的条目上限，超出时整体清空
+_METRICS_CACHE_SIZE = 128
+
+
+def _array_digest(array: np.ndarray):
+    """计算数组内容的摘要（有xxhash时使用xxh64，否则使用blake2b）"""
+    data = np.ascontiguousarray(array)
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh64_intdigest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
 
 class SegmentationMetrics:
     """分割质量评估指标计算器"""
     
     def __init__(self):
+        # (指标类别, 各输入数组的形状/类型/内容摘要) -> 指标字典
         self.metrics_cache = {}
     
+    def clear_cache(self):
+        """清空指标缓存"""
+        self.metrics_cache.clear()
+    
+    def _cache_key(self, kind: str, *arrays: np.ndarray) -> Tuple:
+        """由输入数组的内容生成缓存键，内容相同的输入得到相同的键"""
+        return (kind,) + tuple((array.shape, array.dtype.str, _array_digest(array))
+                               for array in arrays)
+    
+    def _get_cached_metrics(self, key: Tuple) -> Optional[Dict[str, float]]:
+        """读取缓存的指标，返回副本以免调用方修改缓存内容"""
+        cached = self.metrics_cache.get(key)
+        return dict(cached) if cached is not None else None
+    
+    def _put_cached_metrics(self, key: Tuple, metrics: Dict[str, float]):
+        """缓存指标字典"""
+        if len(self.metrics_cache) >= _METRICS_CACHE_SIZE:
+            self.metrics_cache.clear()
+        self.metrics_cache[key] = dict(metrics)
+    
     def compute_all_metrics(self, 
                            original_image: np.ndarray,
                            label_map: np.ndarray,
@@ -57,11 +102,22 @@ class SegmentationMetrics:
         Returns:
             无监督评估指标
         """
+        original_image = np.asarray(original_image)
+        label_map = np.asarray(label_map)
+        key = self._cache_key('unsupervised', original_image, label_map)
+        cached = self._get_cached_metrics(key)
+        if cached is not None:
+            return cached
+        
         metrics = {}
         
+        # 标签划分和区域矩被多个指标共用，只计算一次
+        partition = self._label_partition(label_map)
+        moments, perimeters = self._region_statistics(original_image, label_map, partition)
+        
         # 区域内方差（越小越好）
         metrics['intra_region_variance'] = self.compute_intra_region_variance(
-            original_image, label_map
+            original_image, label_map, moments=moments
         )
         
         # 区域间对比度（越大越好）
@@ -76,15 +132,20 @@ class SegmentationMetrics:
         
         # 分割一致性
         metrics['segmentation_consistency'] = self.compute_segmentation_consistency(
-            original_image, label_map
+            original_image, label_map, moments=moments
         )
         
         # 区域紧凑性
-        metrics['region_compactness'] = self.compute_region_compactness(label_map)
+        metrics['region_compactness'] = self.compute_region_compactness(
+            label_map, partition=partition, perimeters=perimeters
+        )
         
         # 分割均匀性
-        metrics['segmentation_uniformity'] = self.compute_segmentation_uniformity(label_map)
+        metrics['segmentation_uniformity'] = self.compute_segmentation_uniformity(
+            label_map, partition=partition
+        )
         
+        self._put_cached_metrics(key, metrics)
         return metrics
     
     def compute_supervised_metrics(self, 
@@ -100,98 +161,88 @@ class SegmentationMetrics:
         Returns:
             监督评估指标
         """
+        predicted_labels = np.asarray(predicted_labels)
+        ground_truth = np.asarray(ground_truth)
+        key = self._cache_key('supervised', predicted_labels, ground_truth)
+        cached = self._get_cached_metrics(key)
+        if cached is not None:
+            return cached
+        
         metrics = {}
         
-        # 展平标签图
-        pred_flat = predicted_labels.flatten()
-        gt_flat = ground_truth.flatten()
+        # 除像素准确率外的指标都由同一个混淆矩阵导出，只需遍历一次标签图
+        confusion = self._confusion(predicted_labels, ground_truth)
         
         # 调整兰德指数（ARI）
-        metrics['adjusted_rand_index'] = adjusted_rand_score(gt_flat, pred_flat)
+        metrics['adjusted_rand_index'] = self._adjusted_rand_from_confusion(confusion)
         
         # 标准化互信息（NMI）
-        metrics['normalized_mutual_info'] = normalized_mutual_info_score(gt_flat, pred_flat)
+        metrics['normalized_mutual_info'] = self._normalized_mutual_info_from_confusion(confusion)
         
         # 像素准确率
         metrics['pixel_accuracy'] = self.compute_pixel_accuracy(predicted_labels, ground_truth)
         
         # IoU（交并比）
-        metrics['mean_iou'] = self.compute_mean_iou(predicted_labels, ground_truth)
+        metrics['mean_iou'] = self._mean_iou_from_confusion(confusion)
         
         # F1分数
-        metrics['f1_score'] = self.compute_f1_score(predicted_labels, ground_truth)
+        metrics['f1_score'] = self._f1_from_confusion(confusion)
 
         # Dice系数
-        metrics['dice_coefficient'] = self.compute_dice_coefficient(predicted_labels, ground_truth)
+        metrics['dice_coefficient'] = self._dice_from_confusion(confusion)
 
-        # Jaccard指数（与IoU相同，但单独计算以确保一致性）
-        metrics['jaccard_index'] = self.compute_jaccard_index(predicted_labels, ground_truth)
+        # Jaccard指数（与IoU相同）
+        metrics['jaccard_index'] = metrics['mean_iou']
 
+        self._put_cached_metrics(key, metrics)
         return metrics
     
     def compute_intra_region_variance(self, 
                                     image: np.ndarray, 
-                                    label_map: np.ndarray) -> float:
-        """计算区域内方差"""
-        total_variance = 0.0
-        total_pixels = 0
-        
-        unique_labels = np.unique(label_map)
+                                    label_map: np.ndarray,
+                                    moments: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> float:
+        """计算区域内方差（moments为预先计算的_region_moments结果，可选）"""
+        if moments is None:
+            moments = self._region_moments(image, label_map)
+        counts, variances = moments
+        
+        # 只统计像素数大于1的区域，各通道方差取平均后按区域面积加权
+        valid = counts > 1
+        total_pixels = counts[valid].sum()
+        if total_pixels == 0:
+            return 0.0
         
-        for label in unique_labels:
-            mask = label_map == label
-            region_pixels = image[mask]
-            
-            if len(region_pixels) > 1:
-                # 计算每个颜色通道的方差
-                if len(region_pixels.shape) == 2:  # 彩色图像
-                    variance = np.mean([np.var(region_pixels[:, i]) for i in range(region_pixels.shape[1])])
-                else:  # 灰度图像
-                    variance = np.var(region_pixels)
-                
-                total_variance += variance * len(region_pixels)
-                total_pixels += len(region_pixels)
-        
-        return total_variance / total_pixels if total_pixels > 0 else 0.0
+        total_variance = np.dot(variances[valid].mean(axis=1), counts[valid])
+        return float(total_variance / total_pixels)
     
     def compute_inter_region_contrast(self, 
                                     image: np.ndarray, 
                                     label_map: np.ndarray) -> float:
         """计算区域间对比度"""
-        # 计算边界
-        boundaries = self._find_boundaries(label_map)
-        
-        if np.sum(boundaries) == 0:
-            return 0.0
-        
-        # 计算边界处的颜色差异
-        boundary_coords = np.where(boundaries)
         total_contrast = 0.0
         count = 0
         
-        for i in range(len(boundary_coords[0])):
-            row, col = boundary_coords[0][i], boundary_coords[1][i]
+        # 逐对比较水平和垂直相邻像素，标签不同的像素对即边界两侧
+        vertical = label_map[:-1, :] != label_map[1:, :]
+        horizontal = label_map[:, :-1] != label_map[:, 1:]
+        for differs, first, second in ((vertical, image[:-1, :], image[1:, :]),
+                                       (horizontal, image[:, :-1], image[:, 1:])):
+            num_pairs = np.count_nonzero(differs)
+            if num_pairs == 0:
+                continue
+            
+            # 计算颜色差异：只把边界两侧的像素转换为float32，不复制整幅图像
+            color_diff = (first[differs].astype(np.float32) -
+                          second[differs].astype(np.float32))
+            if color_diff.ndim == 2:
+                color_diff = np.sqrt(np.sum(color_diff * color_diff, axis=1))
+            else:
+                color_diff = np.abs(color_diff)
             
-            # 检查相邻像素
-            for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nr, nc = row + dr, col + dc
-                if (0 <= nr < label_map.shape[0] and 
-                    0 <= nc < label_map.shape[1]):
-                    
-                    if label_map[row, col] != label_map[nr, nc]:
-                        # 计算颜色差异
-                        if len(image.shape) == 3:
-                            color_diff = np.linalg.norm(
-                                image[row, col].astype(float) - 
-                                image[nr, nc].astype(float)
-                            )
-                        else:
-                            color_diff = abs(float(image[row, col]) - float(image[nr, nc]))
-                        
-                        total_contrast += color_diff
-                        count += 1
-        
-        return total_contrast / count if count > 0 else 0.0
+            total_contrast += color_diff.sum(dtype=np.float64)
+            count += num_pairs
+        
+        return float(total_contrast / count) if count > 0 else 0.0
     
     def compute_boundary_recall(self, 
                               image: np.ndarray, 
@@ -225,59 +276,51 @@ class SegmentationMetrics:
     
     def compute_segmentation_consistency(self, 
                                        image: np.ndarray, 
-                                       label_map: np.ndarray) -> float:
-        """计算分割一致性"""
-        total_consistency = 0.0
-        total_pixels = 0
-        
-        unique_labels = np.unique(label_map)
+                                       label_map: np.ndarray,
+                                       moments: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> float:
+        """计算分割一致性（moments为预先计算的_region_moments结果，可选）"""
+        if moments is None:
+            moments = self._region_moments(image, label_map)
+        counts, variances = moments
+        
+        valid = counts > 1
+        total_pixels = counts[valid].sum()
+        if total_pixels == 0:
+            return 0.0
         
-        for label in unique_labels:
-            mask = label_map == label
-            region_pixels = image[mask]
-            
-            if len(region_pixels) > 1:
-                # 计算颜色标准差的倒数作为一致性度量
-                if len(region_pixels.shape) == 2:  # 彩色图像
-                    std_dev = np.mean([np.std(region_pixels[:, i]) for i in range(region_pixels.shape[1])])
-                else:  # 灰度图像
-                    std_dev = np.std(region_pixels)
-                
-                consistency = 1.0 / (1.0 + std_dev)
-                total_consistency += consistency * len(region_pixels)
-                total_pixels += len(region_pixels)
-        
-        return total_consistency / total_pixels if total_pixels > 0 else 0.0
+        # 计算颜色标准差的倒数作为一致性度量
+        std_dev = np.sqrt(variances[valid]).mean(axis=1)
+        consistency = 1.0 / (1.0 + std_dev)
+        return float(np.dot(consistency, counts[valid]) / total_pixels)
     
-    def compute_region_compactness(self, label_map: np.ndarray) -> float:
-        """计算区域紧凑性"""
-        total_compactness = 0.0
-        total_area = 0
+    def compute_region_compactness(self, 
+                                   label_map: np.ndarray,
+                                   partition: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                                   perimeters: Optional[np.ndarray] = None) -> float:
+        """计算区域紧凑性（partition、perimeters为预先计算的区域划分和周长，可选）"""
+        if label_map.size == 0:
+            return 0.0
         
-        unique_labels = np.unique(label_map)
+        inverse, areas = partition if partition is not None else self._label_partition(label_map)
         
-        for label in unique_labels:
-            mask = label_map == label
-            area = np.sum(mask)
-            
-            if area > 0:
-                # 计算周长
-                perimeter = self._compute_perimeter(mask)
-                
-                # 紧凑性 = 4π * 面积 / 周长²
-                if perimeter > 0:
-                    compactness = (4 * np.pi * area) / (perimeter ** 2)
-                else:
-                    compactness = 1.0
-                
-                total_compactness += compactness * area
-                total_area += area
-        
-        return total_compactness / total_area if total_area > 0 else 0.0
+        if perimeters is None:
+            # 计算周长：与3x3腐蚀一致，8邻域内（不含图像外）存在其他标签的像素为边界像素
+            boundary = self._find_boundaries(label_map, connectivity=8)
+            perimeters = np.bincount(inverse, weights=boundary.ravel(), minlength=areas.size)
+        
+        # 紧凑性 = 4π * 面积 / 周长²，无边界像素的区域记为1
+        compactness = np.ones(areas.size)
+        has_perimeter = perimeters > 0
+        compactness[has_perimeter] = ((4 * np.pi * areas[has_perimeter]) /
+                                      (perimeters[has_perimeter] ** 2))
+        
+        return float(np.dot(compactness, areas) / areas.sum())
     
-    def compute_segmentation_uniformity(self, label_map: np.ndarray) -> float:
-        """计算分割均匀性"""
-        unique_labels, counts = np.unique(label_map, return_counts=True)
+    def compute_segmentation_uniformity(self, 
+                                        label_map: np.ndarray,
+                                        partition: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> float:
+        """计算分割均匀性（partition为预先计算的_label_partition结果，可选）"""
+        _, counts = partition if partition is not None else self._label_partition(label_map)
         
         if len(counts) <= 1:
             return 1.0
@@ -307,66 +350,20 @@ class SegmentationMetrics:
                         predicted: np.ndarray, 
                         ground_truth: np.ndarray) -> float:
         """计算平均IoU"""
-        unique_labels = np.unique(np.concatenate([predicted.flatten(), ground_truth.flatten()]))
-        
-        ious = []
-        for label in unique_labels:
-            pred_mask = predicted == label
-            gt_mask = ground_truth == label
-            
-            intersection = np.sum(pred_mask & gt_mask)
-            union = np.sum(pred_mask | gt_mask)
-            
-            if union > 0:
-                iou = intersection / union
-                ious.append(iou)
-        
-        return np.mean(ious) if ious else 0.0
+        return self._mean_iou_from_confusion(self._confusion(predicted, ground_truth))
     
     def compute_f1_score(self, 
                         predicted: np.ndarray, 
                         ground_truth: np.ndarray) -> float:
         """计算F1分数"""
         # 简化实现：基于像素级别的F1分数
-        unique_labels = np.unique(ground_truth)
-        
-        f1_scores = []
-        for label in unique_labels:
-            pred_mask = predicted == label
-            gt_mask = ground_truth == label
-            
-            tp = np.sum(pred_mask & gt_mask)
-            fp = np.sum(pred_mask & ~gt_mask)
-            fn = np.sum(~pred_mask & gt_mask)
-            
-            precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-            recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-            
-            if precision + recall > 0:
-                f1 = 2 * (precision * recall) / (precision + recall)
-                f1_scores.append(f1)
-        
-        return np.mean(f1_scores) if f1_scores else 0.0
+        return self._f1_from_confusion(self._confusion(predicted, ground_truth))
 
     def compute_dice_coefficient(self,
                                predicted: np.ndarray,
                                ground_truth: np.ndarray) -> float:
         """计算Dice系数"""
-        unique_labels = np.unique(ground_truth)
-
-        dice_scores = []
-        for label in unique_labels:
-            pred_mask = predicted == label
-            gt_mask = ground_truth == label
-
-            intersection = np.sum(pred_mask & gt_mask)
-            total = np.sum(pred_mask) + np.sum(gt_mask)
-
-            if total > 0:
-                dice = (2.0 * intersection) / total
-                dice_scores.append(dice)
-
-        return np.mean(dice_scores) if dice_scores else 0.0
+        return self._dice_from_confusion(self._confusion(predicted, ground_truth))
 
     def compute_jaccard_index(self,
                             predicted: np.ndarray,
@@ -374,23 +371,267 @@ class SegmentationMetrics:
         """计算Jaccard指数（与IoU相同）"""
         return self.compute_mean_iou(predicted, ground_truth)
 
-    def _find_boundaries(self, label_map: np.ndarray) -> np.ndarray:
-        """查找分割边界"""
-        grad_x = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 0, 1, ksize=3)
+    def _confusion(self, 
+                   predicted: np.ndarray, 
+                   ground_truth: np.ndarray) -> sp.csr_matrix:
+        """
+        计算预测标签与真实标签的混淆矩阵
         
-        gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-        boundaries = gradient_magnitude > 0
+        两者先映射到共同的稠密标签编号，再一次性累加所有像素。过分割结果的
+        标签数可能上万，稠密的 K×K 矩阵会过大，因此以稀疏矩阵保存。
         
-        return boundaries
+        Args:
+            predicted: 预测标签图
+            ground_truth: 真实标签图
+            
+        Returns:
+            (K, K) 混淆矩阵，行为预测标签，列为真实标签，K为两者标签并集的大小
+        """
+        inverse, counts = self._label_partition(
+            np.concatenate([predicted.ravel(), ground_truth.ravel()])
+        )
+        num_labels = counts.size
+        pred_ids, gt_ids = inverse[:predicted.size], inverse[predicted.size:]
+        
+        confusion = sp.coo_matrix(
+            (np.ones(pred_ids.size, dtype=np.int64), (pred_ids, gt_ids)),
+            shape=(num_labels, num_labels)
+        )
+        return confusion.tocsr()
     
-    def _compute_perimeter(self, mask: np.ndarray) -> float:
-        """计算区域周长"""
-        kernel = np.ones((3, 3), np.uint8)
-        eroded = cv2.erode(mask.astype(np.uint8), kernel, iterations=1)
-        boundary = mask.astype(np.uint8) - eroded
+    @staticmethod
+    def _confusion_counts(confusion: sp.csr_matrix) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """由混淆矩阵得到每个标签的交集、预测像素数和真实像素数"""
+        intersection = confusion.diagonal()
+        pred_counts = np.asarray(confusion.sum(axis=1)).ravel()
+        gt_counts = np.asarray(confusion.sum(axis=0)).ravel()
+        return intersection, pred_counts, gt_counts
+    
+    def _adjusted_rand_from_confusion(self, confusion: sp.csr_matrix) -> float:
+        """
+        由混淆矩阵计算调整兰德指数（与sklearn.metrics.adjusted_rand_score一致）
         
-        return np.sum(boundary)
+        先由各格计数和行、列和得到像素对的2x2混淆矩阵，再按ARI公式计算。
+        
+        Args:
+            confusion: _confusion返回的混淆矩阵
+            
+        Returns:
+            调整兰德指数
+        """
+        _, pred_counts, gt_counts = self._confusion_counts(confusion)
+        cell_counts = confusion.data.astype(np.int64)
+        
+        # 转为Python整数，避免像素对数量的乘积溢出
+        num_pixels = int(cell_counts.sum())
+        sum_squares = int(np.dot(cell_counts, cell_counts))
+        fp = int(np.dot(pred_counts, pred_counts)) - sum_squares
+        fn = int(np.dot(gt_counts, gt_counts)) - sum_squares
+        tp = sum_squares - num_pixels
+        tn = num_pixels * num_pixels - fp - fn - sum_squares
+        
+        # 特殊情况：空数据或完全一致
+        if fn == 0 and fp == 0:
+            return 1.0
+        
+        return 2.0 * (tp * tn - fn * fp) / ((tp + fn) * (fn + tn) + (tp + fp) * (fp + tn))
+    
+    def _normalized_mutual_info_from_confusion(self, confusion: sp.csr_matrix) -> float:
+        """
+        由混淆矩阵计算标准化互信息（与sklearn.metrics.normalized_mutual_info_score
+        的默认算术平均归一化一致）
+        
+        Args:
+            confusion: _confusion返回的混淆矩阵
+            
+        Returns:
+            标准化互信息
+        """
+        _, pred_counts, gt_counts = self._confusion_counts(confusion)
+        pred_regions = pred_counts[pred_counts > 0]
+        gt_regions = gt_counts[gt_counts > 0]
+        
+        # 两者都不划分数据（熵均为0）时视为完全一致
+        if pred_regions.size == gt_regions.size and pred_regions.size <= 1:
+            return 1.0
+        # 任一方只有一个区域时互信息为0
+        if pred_regions.size == 1 or gt_regions.size == 1:
+            return 0.0
+        
+        # 互信息只需对混淆矩阵的非零格求和
+        rows, cols, cell_counts = sp.find(confusion)
+        cell_counts = cell_counts.astype(np.float64)
+        num_pixels = cell_counts.sum()
+        outer = pred_counts[rows].astype(np.float64) * gt_counts[cols]
+        probabilities = cell_counts / num_pixels
+        mutual_info = probabilities * (np.log(cell_counts) + np.log(num_pixels) - np.log(outer))
+        mutual_info = np.where(np.abs(mutual_info) < np.finfo(np.float64).eps, 0.0, mutual_info)
+        mutual_info = max(mutual_info.sum(), 0.0)
+        if mutual_info == 0:
+            return 0.0
+        
+        normalizer = (self._entropy(pred_regions) + self._entropy(gt_regions)) / 2
+        return float(mutual_info / normalizer)
+    
+    @staticmethod
+    def _entropy(counts: np.ndarray) -> float:
+        """由各区域的像素数计算划分的熵（自然对数）"""
+        counts = counts.astype(np.float64)
+        total = counts.sum()
+        return float(-np.sum((counts / total) * (np.log(counts) - np.log(total))))
+    
+    def _mean_iou_from_confusion(self, confusion: sp.csr_matrix) -> float:
+        """由混淆矩阵计算平均IoU，统计出现在任一标签图中的所有标签"""
+        intersection, pred_counts, gt_counts = self._confusion_counts(confusion)
+        if intersection.size == 0:
+            return 0.0
+        
+        union = pred_counts + gt_counts - intersection
+        return float(np.mean(intersection / union))
+    
+    def _f1_from_confusion(self, confusion: sp.csr_matrix) -> float:
+        """由混淆矩阵计算F1分数，只统计真实标签中precision+recall>0的标签"""
+        intersection, pred_counts, gt_counts = self._confusion_counts(confusion)
+        
+        # precision与recall的调和平均即 2·TP / (预测像素数 + 真实像素数)
+        valid = (gt_counts > 0) & (intersection > 0)
+        if not np.any(valid):
+            return 0.0
+        
+        f1_scores = 2.0 * intersection[valid] / (pred_counts[valid] + gt_counts[valid])
+        return float(np.mean(f1_scores))
+    
+    def _dice_from_confusion(self, confusion: sp.csr_matrix) -> float:
+        """由混淆矩阵计算Dice系数，统计真实标签图中出现的所有标签"""
+        intersection, pred_counts, gt_counts = self._confusion_counts(confusion)
+        
+        valid = gt_counts > 0
+        if not np.any(valid):
+            return 0.0
+        
+        dice_scores = 2.0 * intersection[valid] / (pred_counts[valid] + gt_counts[valid])
+        return float(np.mean(dice_scores))
+
+    def _label_partition(self, label_map: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把标签图划分为稠密编号的区域
+        
+        Args:
+            label_map: 分割标签图 (H, W)
+            
+        Returns:
+            (inverse, counts)：每个像素的区域编号 (N,) 和各区域像素数 (L,)，
+            区域按标签值升序编号
+        """
+        flat = label_map.reshape(-1)
+        if flat.size > 0 and np.issubdtype(flat.dtype, np.integer):
+            offset = int(flat.min())
+            span = int(flat.max()) - offset + 1
+            if span <= 4 * flat.size + 1024:
+                # 取值范围不大时用 (标签 - 最小值) 索引的计数表重映射，代替np.unique的排序
+                shifted = np.subtract(flat, offset, dtype=np.intp)
+                full_counts = np.bincount(shifted, minlength=span)
+                present = full_counts > 0
+                remap = np.cumsum(present, dtype=np.intp) - 1
+                return remap[shifted], full_counts[present]
+        
+        _, inverse, counts = np.unique(flat, return_inverse=True, return_counts=True)
+        return inverse.ravel(), counts
+    
+    def _region_moments(self, 
+                        image: np.ndarray, 
+                        label_map: np.ndarray,
+                        partition: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次性统计每个区域的像素数和各通道方差
+        
+        用 np.bincount 按标签累加各通道的一阶、二阶矩，方差 = E[x²] - E[x]²，
+        代替逐标签构造掩码的循环。
+        
+        Args:
+            image: 原始图像 (H, W) 或 (H, W, C)
+            label_map: 分割标签图 (H, W)
+            partition: 预先计算的_label_partition结果，None时重新划分
+            
+        Returns:
+            (counts, variances)：各区域像素数 (L,) 和各通道方差 (L, C)，
+            区域按标签值升序排列
+        """
+        inverse, counts = partition if partition is not None else self._label_partition(label_map)
+        
+        channels = image.shape[2] if image.ndim == 3 else 1
+        pixels = image.reshape(inverse.size, channels)
+        s1 = np.empty((counts.size, channels))
+        s2 = np.empty((counts.size, channels))
+        for c in range(channels):
+            channel = pixels[:, c].astype(np.float64)
+            s1[:, c] = np.bincount(inverse, weights=channel, minlength=counts.size)
+            s2[:, c] = np.bincount(inverse, weights=channel * channel, minlength=counts.size)
+        
+        return counts, self._variances_from_sums(counts, s1, s2)
+    
+    @staticmethod
+    def _variances_from_sums(counts: np.ndarray, s1: np.ndarray, s2: np.ndarray) -> np.ndarray:
+        """由各区域像素数、各通道之和与平方和计算方差 (L, C)"""
+        mean = s1 / counts[:, np.newaxis]
+        # 浮点抵消可能产生极小的负数
+        return np.maximum(s2 / counts[:, np.newaxis] - mean * mean, 0.0)
+    
+    def _region_statistics(self, 
+                           image: np.ndarray, 
+                           label_map: np.ndarray,
+                           partition: Tuple[np.ndarray, np.ndarray]
+                           ) -> Tuple[Tuple[np.ndarray, np.ndarray], Optional[np.ndarray]]:
+        """
+        计算无监督指标共用的区域统计量
+        
+        有Numba时由一个内核一次遍历同时得到区域矩和周长，否则只用bincount
+        计算区域矩，周长留给compute_region_compactness自行计算。
+        
+        Args:
+            image: 原始图像 (H, W) 或 (H, W, C)
+            label_map: 分割标签图 (H, W)
+            partition: _label_partition的结果
+            
+        Returns:
+            (moments, perimeters)：moments同_region_moments，perimeters为各区域
+            周长 (L,)，未计算时为None
+        """
+        if not NUMBA_AVAILABLE or label_map.ndim != 2 or image.shape[:2] != label_map.shape:
+            return self._region_moments(image, label_map, partition), None
+        
+        inverse, counts = partition
+        s1, s2, perimeters = region_sums(image, inverse.reshape(label_map.shape), counts.size)
+        return (counts, self._variances_from_sums(counts, s1, s2)), perimeters
+    
+    def _find_boundaries(self, label_map: np.ndarray, connectivity: int = 8) -> np.ndarray:
+        """
+        查找分割边界：邻域内（不含图像外）存在其他标签的像素
+        
+        Args:
+            label_map: 分割标签图 (H, W)
+            connectivity: 邻域连接性 (4或8)，默认8：与旧版Sobel检测一致，对角相邻的角点像素也是边界
+            
+        Returns:
+            边界掩码 (H, W) bool
+        """
+        pairs = [(np.s_[:-1, :], np.s_[1:, :]),
+                 (np.s_[:, :-1], np.s_[:, 1:])]
+        if connectivity == 8:
+            pairs += [(np.s_[:-1, :-1], np.s_[1:, 1:]),
+                      (np.s_[:-1, 1:], np.s_[1:, :-1])]
+        elif connectivity != 4:
+            raise ValueError("连接性必须是4或8")
+        
+        # 每对相邻像素只比较一次，结果同时记到两侧
+        boundaries = np.zeros(label_map.shape, dtype=bool)
+        for first, second in pairs:
+            differs = label_map[first] != label_map[second]
+            boundaries[first] |= differs
+            boundaries[second] |= differs
+        
+        return boundaries
 
 
 class PerformanceProfiler:
@@ -69,8 +69,15 @@ setup(
         ],
         "gpu": [
             "cupy-cuda11x>=9.0",
+            "cucim-cu11>=23.10",
             "GPUtil>=1.4",
         ],
+        "jit": [
+            "numba>=0.56",
+        ],
+        "faiss": [
+            "faiss-cpu>=1.7",
+        ],
         "docs": [
             "sphinx>=4.0",
             "sphinx-rtd-theme>=1.0",
@@ -23,8 +23,37 @@ from utils.logger import get_logger, setup_global_logger
 from utils.config_manager import ConfigManager
 from utils.exceptions import ImageLoadError, AlgorithmError, ParameterError
 from utils.performance_monitor import MemoryManager, PerformanceMonitor
-from core.mst_segmentation import MSTSegmentation
+from core.mst_segmentation import MSTSegmentation, _stable_weight_order
 from core.watershed_segmentation import WatershedSegmentation
+from core.kmeans_segmentation import (KMeansSegmentation, GMMSegmentation,
+                                     NUMBA_AVAILABLE as KMEANS_NUMBA_AVAILABLE)
+from core.graph_builder import PixelGraphBuilder
+from core.edge_weights import EdgeWeightCalculator, AdaptiveWeightCalculator
+from data_structures.pixel_graph import PixelGraph
+from data_structures.segmentation_result import SegmentationResult
+from data_structures.union_find import UnionFind, SegmentationUnionFind
+from evaluation.metrics import SegmentationMetrics
+from evaluation import _metrics_numba
+from evaluation import comparison_tools
+
+try:
+    from sklearn import metrics as sklearn_metrics
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+
+# 算法对比测试用的算法，定义在模块级以便序列化到子进程
+def threshold_algorithm(image, threshold=128):
+    """按灰度阈值把图像分为两个区域"""
+    return {'label_map': (image.mean(axis=2) > threshold).astype(np.int32)}
+
+
+def grid_algorithm(image, block=8):
+    """按固定大小的方块划分图像"""
+    rows = np.arange(image.shape[0])[:, None] // block
+    cols = np.arange(image.shape[1])[None, :] // block
+    return {'label_map': (rows * (image.shape[1] // block + 1) + cols).astype(np.int32)}
 
 
 class TestImageIO(unittest.TestCase):
@@ -118,6 +147,109 @@ class TestAlgorithms(unittest.TestCase):
         except Exception as e:
             self.skipTest(f"Watershed算法测试跳过: {e}")
     
+    def test_stable_weight_order(self):
+        """测试打包键排序与稳定argsort的顺序一致（含相同权重和负权重的回退）"""
+        rng = np.random.default_rng(0)
+        weights = rng.integers(0, 50, 10000).astype(np.float32) / 7
+        for values in (weights, weights - 3, weights.astype(np.float64)):
+            with self.subTest(dtype=values.dtype, negative=bool((values < 0).any())):
+                np.testing.assert_array_equal(_stable_weight_order(values),
+                                              np.argsort(values, kind='stable'))
+    
+    def test_graph_cache_tracks_parameters(self):
+        """测试建图参数变化后不复用缓存的图"""
+        segmenter = MSTSegmentation()
+        graph = segmenter._cached_build_graph(self.test_image)
+        self.assertIs(segmenter._cached_build_graph(self.test_image.copy()), graph)
+        
+        segmenter.graph_builder.weight_calculator.alpha = 2.0
+        rebuilt = segmenter._cached_build_graph(self.test_image)
+        self.assertIsNot(rebuilt, graph)
+        self.assertFalse(np.allclose(rebuilt['weights'], graph['weights']))
+        
+        segmenter.graph_builder.weight_calculator.color_space = 'LAB'
+        self.assertIsNot(segmenter._cached_build_graph(self.test_image), rebuilt)
+    
+    def test_watershed_input_dtypes(self):
+        """测试非uint8输入按取值范围缩放而不是截断，超出范围的浮点图像报错"""
+        rng = np.random.default_rng(0)
+        image = np.kron(rng.integers(0, 256, (6, 6, 3)), np.ones((10, 10, 1))).astype(np.uint8)
+        expected = self.watershed_algorithm.segment(image)['label_map']
+        
+        for converted in (image / 255.0, image.astype(np.uint16) * 257):
+            with self.subTest(dtype=converted.dtype):
+                np.testing.assert_array_equal(
+                    self.watershed_algorithm.segment(converted)['label_map'], expected
+                )
+        with self.assertRaises(RuntimeError):
+            self.watershed_algorithm.segment(image.astype(np.float64))
+    
+    def test_hierarchy_passes_max_workers(self):
+        """测试分割层次结构把max_workers传给多阈值分割"""
+        with patch.object(self.mst_algorithm, 'segment_with_multiple_thresholds',
+                          wraps=self.mst_algorithm.segment_with_multiple_thresholds) as segment:
+            hierarchy = self.mst_algorithm.get_segmentation_hierarchy(self.test_image, 3)
+            segment.assert_called_once()
+            self.assertEqual(segment.call_args[0][2], 1)
+            
+            self.mst_algorithm.get_segmentation_hierarchy(self.test_image, 3, max_workers=2)
+            self.assertEqual(segment.call_args[0][2], 2)
+        self.assertEqual(len(hierarchy['results']), 3)
+    
+    def test_build_mst(self):
+        """测试最小生成树的边数和总权重"""
+        from scipy.sparse.csgraph import minimum_spanning_tree
+        
+        graph = self.mst_algorithm.graph_builder.build_graph(self.test_image)
+        mst_edges, mst_weights = self.mst_algorithm._build_mst(graph)
+        
+        self.assertEqual(mst_edges.shape, (50 * 50 - 1, 2))
+        self.assertTrue(np.all(np.diff(mst_weights) >= 0))
+        
+        expected = minimum_spanning_tree(graph['csr']).sum()
+        self.assertAlmostEqual(float(np.sum(mst_weights, dtype=np.float64)), expected, delta=expected * 1e-5)
+    
+    def test_process_markers(self):
+        """测试用户标记点被重新编号为连续整数"""
+        markers = np.array([[0, 5, 5], [9, 0, -2]])
+        processed = self.watershed_algorithm._process_markers(markers)
+
+        self.assertEqual(processed.dtype, np.int32)
+        np.testing.assert_array_equal(processed, [[0, 1, 1], [2, 0, 0]])
+
+    def test_postprocess_labels(self):
+        """测试分水岭后处理移除小区域并保留其余区域的标签"""
+        labels = np.zeros((100, 100), dtype=np.int32)
+        labels[:, :40] = 3
+        labels[:, 40:90] = 7
+        labels[:5, 90:] = 9  # 50个像素，不小于最小尺寸
+        labels[5:8, 90:] = 4  # 30个像素，应被移除
+        processed = self.watershed_algorithm._postprocess_labels(labels, None)
+
+        np.testing.assert_array_equal(np.unique(processed), [0, 1, 2, 3])
+        self.assertTrue(np.all(processed[:, :40] == 1))
+        self.assertTrue(np.all(processed[:, 40:90] == 2))
+        self.assertTrue(np.all(processed[:5, 90:] == 3))
+        self.assertTrue(np.all(processed[5:8, 90:] == 0))
+
+    def test_multiple_thresholds_exits_cleanly(self):
+        """测试多阈值分割（默认及线程池路径）完成后解释器能正常退出"""
+        import subprocess
+        
+        script = (
+            "import sys; sys.path.insert(0, {root!r})\n"
+            "import numpy as np\n"
+            "from core.mst_segmentation import MSTSegmentation\n"
+            "image = np.random.default_rng(0).integers(0, 255, (40, 40, 3)).astype(np.uint8)\n"
+            "mst = MSTSegmentation()\n"
+            "for max_workers in (None, 2):\n"
+            "    result = mst.segment_with_multiple_thresholds(image, [5, 10, 20, 40], max_workers=max_workers)\n"
+            "    assert list(result['results']) == [5, 10, 20, 40]\n"
+        ).format(root=str(project_root))
+        completed = subprocess.run([sys.executable, '-c', script], timeout=120,
+                                   capture_output=True, text=True)
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+    
     def test_invalid_parameters(self):
         """测试无效参数"""
         with self.assertRaises((ParameterError, ValueError)):
@@ -131,6 +263,699 @@ class TestAlgorithms(unittest.TestCase):
             self.mst_algorithm.segment(empty_image)
 
 
+class TestKMeansSegmentation(unittest.TestCase):
+    """K-Means/GMM聚类分割测试"""
+    
+    def setUp(self):
+        """测试前准备：四个分离良好的颜色簇"""
+        rng = np.random.default_rng(0)
+        self.means = np.array([[30, 30, 200], [200, 40, 40], [40, 200, 40], [220, 220, 220]])
+        self.true_labels = rng.integers(0, 4, (60, 80))
+        noise = rng.normal(0, 12, (60, 80, 3))
+        self.image = np.clip(self.means[self.true_labels] + noise, 0, 255).astype(np.uint8)
+        self.kmeans = KMeansSegmentation()
+    
+    @unittest.skipUnless(KMEANS_NUMBA_AVAILABLE, "需要Numba")
+    def test_quantized_matches_float_clustering(self):
+        """测试uint8整数聚类与cv2.kmeans浮点聚类的中心、标签和惯性在容差内一致"""
+        pixels = self.image.reshape(-1, 3)
+        features = self.kmeans._prepare_features(self.kmeans._preprocess_image(self.image, 'RGB'), 0)
+        float_labels, float_centers = self.kmeans._perform_clustering(features, 4, 100, 42)
+        quantized_labels, quantized_centers = self.kmeans._perform_quantized_clustering(pixels, 4, 100, 42)
+        
+        # 按最近中心对齐两组聚类编号，中心取整误差不超过1个灰度级
+        distances = np.linalg.norm(quantized_centers[:, None] - float_centers[None], axis=2)
+        mapping = distances.argmin(axis=1)
+        self.assertEqual(sorted(mapping), [0, 1, 2, 3])
+        self.assertLess(distances.min(axis=1).max(), 1.0 / 255 * np.sqrt(3))
+        self.assertGreater(np.mean(mapping[quantized_labels] == float_labels), 0.99)
+        
+        normalized = pixels / 255.0
+        float_inertia = np.sum((normalized - float_centers[float_labels]) ** 2)
+        quantized_inertia = np.sum((normalized - quantized_centers[quantized_labels]) ** 2)
+        self.assertLess(abs(quantized_inertia - float_inertia), 0.01 * float_inertia)
+    
+    def test_diagonal_em_matches_sklearn(self):
+        """测试对角/球形协方差的EM实现与sklearn的GaussianMixture得到相同的标签和均值"""
+        from sklearn.mixture import GaussianMixture
+        
+        gmm = GMMSegmentation()
+        features = gmm._preprocess_image(self.image, 'RGB').reshape(-1, 3)
+        for covariance_type in ('diag', 'spherical'):
+            with self.subTest(covariance_type):
+                labels, means = gmm._perform_diagonal_em(features, 4, covariance_type, 100, 42)
+                reference = GaussianMixture(4, covariance_type=covariance_type,
+                                            max_iter=100, random_state=42).fit(features)
+                
+                distances = np.linalg.norm(means[:, None] - reference.means_[None], axis=2)
+                mapping = distances.argmin(axis=1)
+                self.assertEqual(sorted(mapping), [0, 1, 2, 3])
+                self.assertLess(distances.min(axis=1).max(), 1e-3)
+                np.testing.assert_array_equal(mapping[labels], reference.predict(features))
+
+
+class TestGraphBuilder(unittest.TestCase):
+    """像素图构建测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_image = np.random.randint(0, 255, (6, 7, 3), dtype=np.uint8)
+    
+    def test_graph_arrays(self):
+        """测试图结构的数组格式"""
+        for connectivity, expected_edges in [(4, 2 * 6 * 7 - 6 - 7), (8, 4 * 6 * 7 - 3 * (6 + 7) + 2)]:
+            graph = PixelGraphBuilder(connectivity).build_graph(self.test_image)
+            self.assertEqual(graph['edges'].shape, (expected_edges, 2))
+            self.assertEqual(graph['edges'].dtype, np.int32)
+            self.assertEqual(graph['weights'].dtype, np.float32)
+            self.assertEqual(graph['num_nodes'], 6 * 7)
+            self.assertTrue(np.all(graph['edges_src'] < graph['edges_dst']))
+            
+            # CSR邻接矩阵对称，且每条边存储两次
+            csr = graph['csr']
+            self.assertEqual(csr.shape, (6 * 7, 6 * 7))
+            self.assertEqual(csr.nnz, 2 * expected_edges)
+            self.assertEqual(csr.indptr.dtype, np.int32)
+            self.assertEqual(csr.indices.dtype, np.int32)
+            self.assertEqual((csr != csr.T).nnz, 0)
+    
+    def test_weights_match_pairwise(self):
+        """测试批量权重与逐像素权重一致"""
+        calculator = EdgeWeightCalculator(alpha=1.0, beta=0.1)
+        graph = PixelGraphBuilder(8, calculator).build_graph(self.test_image)
+        
+        for (node1, node2), weight in zip(graph['edges'].tolist(), graph['weights']):
+            expected = calculator.calculate_weight(divmod(node1, 7), divmod(node2, 7), self.test_image)
+            self.assertAlmostEqual(float(weight), expected, places=3)
+    
+    def test_adaptive_weights_batch(self):
+        """测试批量自适应权重与逐边计算一致"""
+        calculator = AdaptiveWeightCalculator(alpha=1.0, beta=0.1)
+        local_variance = np.random.rand(6, 7).astype(np.float32) * 100
+        calculator.prepare(self.test_image, local_variance)
+        
+        graph = PixelGraphBuilder(8, calculator).build_graph(self.test_image)
+        weights = calculator.calculate_adaptive_weights_batch(graph['edges_src'], graph['edges_dst'])
+        
+        for (node1, node2), weight in zip(graph['edges'].tolist(), weights):
+            expected = calculator.calculate_adaptive_weight(
+                divmod(node1, 7), divmod(node2, 7), self.test_image, local_variance
+            )
+            self.assertAlmostEqual(float(weight), expected, places=2)
+    
+    def test_gray_weights_match_rgb(self):
+        """测试灰度图像按单通道计算的权重与复制成RGB后一致"""
+        gray = self.test_image[:, :, 0]
+        for color_space in ('RGB', 'HSV', 'LAB'):
+            builder = PixelGraphBuilder(8, EdgeWeightCalculator(color_space=color_space))
+            gray_weights = builder.build_graph(gray)['weights']
+            rgb_weights = builder.build_graph(np.stack([gray] * 3, axis=-1))['weights']
+            np.testing.assert_allclose(gray_weights, rgb_weights, rtol=1e-5, atol=1e-4)
+
+
+
+class TestUnionFind(unittest.TestCase):
+    """并查集测试"""
+    
+    def test_find_long_chain(self):
+        """测试长链上的查找不受递归深度限制并压缩路径"""
+        n = 100000
+        uf = UnionFind(n)
+        uf.parent[:-1] = np.arange(1, n)  # 0 -> 1 -> ... -> n-1
+        
+        self.assertEqual(uf.find(0), n - 1)
+        self.assertEqual(uf.parent[0], n - 1)
+    
+    def test_union_batch_matches_sequential(self):
+        """测试批量合并与逐条合并的结果和合并记录一致"""
+        rng = np.random.default_rng(0)
+        xs, ys, weights = rng.integers(0, 200, 300), rng.integers(0, 200, 300), rng.random(300)
+        
+        batch = SegmentationUnionFind(10, 20)
+        merged = batch.union_batch(xs, ys, weights)
+        sequential = SegmentationUnionFind(10, 20)
+        for x, y, weight in zip(xs.tolist(), ys.tolist(), weights.tolist()):
+            sequential.union_with_weight(x, y, weight)
+        
+        self.assertEqual(merged, len(sequential.merge_history))
+        self.assertEqual(batch.merge_history, sequential.merge_history)
+        self.assertEqual(batch.edge_weights, sequential.edge_weights)
+        self.assertEqual(batch.num_components, sequential.num_components)
+        self.assertEqual(len(batch.merge_records), merged)
+        self.assertAlmostEqual(batch.get_merge_threshold(),
+                               np.median([info['weight'] for info in sequential.merge_history]))
+        np.testing.assert_array_equal(batch.get_segmentation_map(), sequential.get_segmentation_map())
+
+    def test_invalid_indices(self):
+        """测试越界索引在进入编译内核前抛出IndexError"""
+        uf = UnionFind(5)
+        with self.assertRaises(IndexError):
+            uf.find(100000000)
+        with self.assertRaises(IndexError):
+            uf.union(1, 7)
+        with self.assertRaises(IndexError):
+            uf.find(-1)
+        
+        suf = SegmentationUnionFind(2, 3)
+        with self.assertRaises(IndexError):
+            suf.union_with_weight(0, 6, 1.0)
+        with self.assertRaises(IndexError):
+            suf.union_batch(np.array([0, 1]), np.array([2, 6]), np.ones(2))
+        with self.assertRaises(IndexError):
+            suf.union_pixels((0, 3), (0, 0), 1.0)
+        with self.assertRaises(IndexError):
+            suf.union_pixels_batch([0], [3], [0], [0], [1.0])
+        
+        # 失败的调用不修改状态
+        self.assertEqual(uf.num_components, 5)
+        self.assertEqual(suf.num_components, 6)
+        self.assertEqual(suf.merge_history, [])
+    
+    def test_get_components(self):
+        """测试连通分量按首个元素的出现顺序返回，且路径被完全压缩"""
+        uf = UnionFind(6)
+        uf.union(5, 0)
+        uf.union(4, 1)
+        uf.union(1, 5)
+
+        components = uf.get_components()
+        self.assertEqual(list(components.values()), [[0, 1, 4, 5], [2], [3]])
+        self.assertEqual(set(components), uf.get_component_roots())
+        np.testing.assert_array_equal(uf.parent, [uf.find(i) for i in range(6)])
+
+    def test_components_indexed_and_filter(self):
+        """测试分量索引视图及按大小过滤小区域"""
+        uf = SegmentationUnionFind(2, 3)
+        uf.union(5, 0)
+        uf.union(4, 1)
+        uf.union(1, 5)
+
+        starts, order = uf.get_components_indexed()
+        np.testing.assert_array_equal(starts, [0, 4, 5, 6])
+        np.testing.assert_array_equal(order, [0, 1, 4, 5, 2, 3])
+
+        result = uf.filter_small_segments(2)
+        self.assertEqual(list(result['filtered_components'].values()), [[0, 1, 4, 5]])
+        self.assertEqual(result['small_segments'], [2, 3])
+        self.assertEqual(uf.get_segment_statistics()['num_segments'], 3)
+
+    def test_merge_small_segments(self):
+        """测试小区域依次并入相邻的大区域（邻接表字典与CSR矩阵结果一致）"""
+        import scipy.sparse as sp
+
+        adjacency = {0: [1], 1: [0, 2], 2: [1, 3], 3: [2, 4], 4: [3]}
+        rows = [node for node, neighbors in adjacency.items() for _ in neighbors]
+        cols = [neighbor for neighbors in adjacency.values() for neighbor in neighbors]
+        csr = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(5, 5))
+
+        for adjacency_info in (adjacency, csr):
+            uf = SegmentationUnionFind(1, 5)
+            uf.union(0, 1)
+            uf.union(1, 2)
+            uf.merge_small_segments(3, adjacency_info)
+            # 3先并入大区域后，4的邻居也属于大区域
+            self.assertEqual(uf.num_components, 1)
+            np.testing.assert_array_equal(uf.get_segmentation_map(), [[0, 0, 0, 0, 0]])
+
+    def test_segmentation_map_label_order(self):
+        """测试分割图按分量首个像素的出现顺序编号"""
+        uf = SegmentationUnionFind(2, 3)
+        uf.union(5, 0)
+        uf.union(4, 1)
+
+        expected = np.array([[0, 1, 2], [3, 1, 0]], dtype=np.int32)
+        label_map = uf.get_segmentation_map()
+        self.assertEqual(label_map.dtype, np.int32)
+        np.testing.assert_array_equal(label_map, expected)
+
+
+class TestPixelGraph(unittest.TestCase):
+    """像素关系图测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_image = np.random.randint(0, 255, (6, 7, 3), dtype=np.uint8)
+    
+    def test_add_edge(self):
+        """测试逐条添加边及重复边的权重覆盖"""
+        graph = PixelGraph(5, 5, connectivity=4)
+        graph.add_edge((0, 0), (0, 1), 1.0)
+        graph.add_edge((0, 1), (1, 1), 1.5)
+        graph.add_edge((1, 1), (0, 1), 2.5)
+        
+        self.assertEqual(sorted(graph.get_neighbors((0, 1))), [(0, 0), (1, 1)])
+        self.assertEqual(graph.get_degree((0, 1)), 2)
+        self.assertEqual(graph.get_edge_weight((0, 1), (1, 1)), 2.5)
+        self.assertIsNone(graph.get_edge_weight((0, 0), (4, 4)))
+        self.assertEqual(graph.edge_weights, {(0, 1): 1.0, (1, 6): 2.5})
+    
+    def test_connected_components(self):
+        """测试连通分量按首个像素的顺序返回"""
+        graph = PixelGraph(2, 3, connectivity=4)
+        graph.add_edge((0, 1), (1, 1), 1.0)
+        graph.add_edge((1, 1), (1, 2), 1.0)
+        
+        components = graph.get_connected_components()
+        self.assertEqual(components, [{(0, 0)}, {(0, 1), (1, 1), (1, 2)}, {(0, 2)}, {(1, 0)}])
+    
+    def test_build_grid_from_weights(self):
+        """测试由权重图构建的网格图与逐边权重一致"""
+        calculator = EdgeWeightCalculator()
+        offsets = [(0, 1), (1, 0), (1, 1), (1, -1)]
+        graph = PixelGraph(6, 7, connectivity=8).build_grid_from_weights(
+            *calculator.calculate_weights_batch(self.test_image, offsets)
+        )
+        
+        self.assertEqual(graph.get_graph_statistics()['num_edges'], 4 * 6 * 7 - 3 * (6 + 7) + 2)
+        for row in range(5):
+            for col in range(1, 6):
+                for dr, dc in offsets:
+                    expected = calculator.calculate_weight((row, col), (row + dr, col + dc), self.test_image)
+                    self.assertAlmostEqual(graph.get_edge_weight((row, col), (row + dr, col + dc)),
+                                           expected, places=3)
+
+    def test_node_features(self):
+        """测试节点特征的逐个设置、批量设置与保存加载"""
+        graph = PixelGraph(2, 3)
+        self.assertIsNone(graph.get_node_feature((0, 1)))
+        graph.set_node_feature((0, 1), np.array([1.0, 2.0]))
+        np.testing.assert_array_equal(graph.get_node_feature((0, 1)), [1.0, 2.0])
+        self.assertIsNone(graph.get_node_feature((1, 1)))
+        with self.assertRaises(ValueError):
+            graph.set_node_feature((1, 1), np.zeros(3))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'graph.npz')
+            graph.save_to_file(filename)
+            loaded = PixelGraph.load_from_file(filename)
+        np.testing.assert_array_equal(loaded.get_node_feature((0, 1)), [1.0, 2.0])
+        self.assertIsNone(loaded.get_node_feature((1, 1)))
+
+        graph.set_all_features(self.test_image[:2, :3])
+        self.assertEqual(graph.node_features.shape, (6, 3))
+        np.testing.assert_array_equal(graph.get_node_feature((1, 2)), self.test_image[1, 2])
+
+    def test_invalid_coordinates(self):
+        """测试超出图像范围的像素坐标抛出IndexError，而不是映射到其他像素"""
+        graph = PixelGraph(3, 3)
+        graph.add_edge((0, 0), (0, 1), 0.5)
+        graph.build_sparse_matrices()
+
+        for pixel in ((0, 3), (3, 0), (-1, 0), (0, -1)):
+            with self.subTest(pixel=pixel):
+                with self.assertRaises(IndexError):
+                    graph.add_edge((0, 0), pixel, 1.0)
+                with self.assertRaises(IndexError):
+                    graph.get_edge_weight((0, 0), pixel)
+                with self.assertRaises(IndexError):
+                    graph.get_neighbors(pixel)
+                with self.assertRaises(IndexError):
+                    graph.get_degree(pixel)
+                with self.assertRaises(IndexError):
+                    graph.get_node_feature(pixel)
+        self.assertEqual(graph.get_degree((1, 0)), 0)
+        self.assertEqual(graph.get_degree((0, 1)), 1)
+
+    def test_load_legacy_pickle_requires_opt_in(self):
+        """测试非npz文件默认拒绝加载，显式允许时才按旧版pickle格式读取"""
+        import pickle
+
+        graph_data = {
+            'height': 2, 'width': 3, 'connectivity': 4,
+            'adjacency_list': {}, 'edge_weights': {(0, 1): 0.5},
+            'node_features': {1: np.array([1.0, 2.0])},
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'graph.pkl')
+            with open(filename, 'wb') as f:
+                pickle.dump(graph_data, f)
+            
+            with self.assertRaises(ValueError):
+                PixelGraph.load_from_file(filename)
+            loaded = PixelGraph.load_from_file(filename, allow_pickle=True)
+
+        self.assertEqual(loaded.get_edge_weight((0, 0), (0, 1)), 0.5)
+        np.testing.assert_array_equal(loaded.get_node_feature((0, 1)), [1.0, 2.0])
+
+    def test_filter_edges_by_weight(self):
+        """测试按阈值过滤边后的边集合与邻接关系"""
+        graph = PixelGraph(2, 3)
+        graph.add_edge((0, 0), (0, 1), 0.2)
+        graph.add_edge((0, 1), (0, 2), 0.7)
+        graph.add_edge((0, 1), (1, 1), 0.5)
+        graph.build_sparse_matrices()
+
+        filtered = graph.filter_edges_by_weight(0.5)
+        self.assertEqual(sorted(filtered.edge_weights), [(0, 1), (1, 4)])
+        self.assertEqual(sorted(filtered.get_neighbors((0, 1))), [(0, 0), (1, 1)])
+        self.assertIsNone(filtered.get_edge_weight((0, 1), (0, 2)))
+        self.assertEqual(graph.get_degree((0, 1)), 3)
+
+    def test_laplacian_matrix(self):
+        """测试拉普拉斯矩阵的对角元为度数且包含新添加的边"""
+        graph = PixelGraph(3, 3, connectivity=4)
+        graph.add_edge((0, 0), (0, 1), 1.0)
+        graph.build_sparse_matrices()
+        graph.add_edge((0, 1), (1, 1), 2.0)
+
+        laplacian = graph.compute_laplacian_matrix().toarray()
+        np.testing.assert_array_equal(laplacian.diagonal(), [1, 2, 0, 0, 1, 0, 0, 0, 0])
+        np.testing.assert_allclose(laplacian.sum(axis=1), 0)
+        self.assertEqual(laplacian[1, 4], -1)
+
+        normed = graph.compute_laplacian_matrix(normed=True).toarray()
+        np.testing.assert_allclose(normed.diagonal(), [1, 1, 0, 0, 1, 0, 0, 0, 0])
+
+
+
+class TestSegmentationResult(unittest.TestCase):
+    """分割结果测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.label_map = np.zeros((4, 4), dtype=np.int32)
+        self.label_map[:, 2:] = 1
+        self.image = np.zeros((4, 4, 3), dtype=np.uint8)
+        self.image[:, 2:] = [30, 40, 0]
+    
+    def test_inter_region_contrast(self):
+        """测试区域间对比度为边界像素对颜色差异的均值"""
+        result = SegmentationResult(self.label_map, self.image)
+        self.assertAlmostEqual(result._compute_inter_region_contrast(), 50.0, places=4)
+        
+        uniform = SegmentationResult(np.zeros((4, 4), dtype=np.int32), self.image)
+        self.assertEqual(uniform._compute_inter_region_contrast(), 0.0)
+    
+    def test_inter_region_contrast_matches_pixel_loop(self):
+        """测试向量化的区域间对比度与逐边界像素的循环实现一致"""
+        import cv2
+        
+        def pixel_loop_contrast(label_map, image):
+            grad_x = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 1, 0, ksize=3)
+            grad_y = cv2.Sobel(label_map.astype(np.float32), cv2.CV_32F, 0, 1, ksize=3)
+            boundaries = (np.abs(grad_x) + np.abs(grad_y)) > 0
+            total, count = 0.0, 0
+            for row, col in zip(*np.where(boundaries)):
+                for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                    nr, nc = row + dr, col + dc
+                    if (0 <= nr < label_map.shape[0] and 0 <= nc < label_map.shape[1]
+                            and label_map[row, col] != label_map[nr, nc]):
+                        total += np.linalg.norm(image[row, col].astype(float) -
+                                                image[nr, nc].astype(float))
+                        count += 1
+            return total / count if count > 0 else 0.0
+        
+        rng = np.random.default_rng(0)
+        for i in range(4):
+            with self.subTest(i=i):
+                label_map = np.kron(rng.integers(0, 5, (6, 8)), np.ones((5, 5), dtype=int))
+                image = rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)
+                if i % 2:
+                    image = image[:, :, 0]
+                result = SegmentationResult(label_map, image)
+                self.assertAlmostEqual(result._compute_inter_region_contrast(),
+                                       pixel_loop_contrast(label_map, image), places=9)
+    
+    def test_segment_geometry(self):
+        """测试由标签索引得到的边界框、质心和小区域过滤"""
+        label_map = np.full((6, 8), 5)
+        label_map[1:3, 2:6] = -1
+        label_map[5, 7] = 9
+        result = SegmentationResult(label_map, np.zeros((6, 8, 3), dtype=np.uint8))
+        
+        self.assertEqual(result.get_segment_bounding_box(-1), (1, 2, 2, 5))
+        self.assertEqual(result.get_segment_centroid(-1), (1.5, 3.5))
+        self.assertEqual(result.get_segment_bounding_box(3), (0, 0, 0, 0))
+        self.assertEqual(result.compute_segment_features(9)['area'], 1)
+        self.assertEqual(result.compute_segment_features(-1)['perimeter'], 8)
+        self.assertEqual(result.compute_segment_features(5)['perimeter'], 19)
+        np.testing.assert_array_equal(result.get_segment_pixels(-1),
+                                      np.argwhere(label_map == -1))
+        self.assertEqual(result.get_segment_pixels(3).shape, (0, 2))
+        self.assertEqual(result.get_segment_pixels_tuples(9), [(5, 7)])
+        
+        filtered = result.filter_small_segments(2)
+        # 小区域并入标签0后重新编号：-1 -> 0, 0 -> 1, 5 -> 2
+        expected = np.where(label_map == 5, 2, np.where(label_map == -1, 0, 1))
+        np.testing.assert_array_equal(filtered.label_map, expected)
+    
+    def test_segment_cache(self):
+        """测试按标签缓存的特征与掩码在缓存命中、淘汰和标签图替换后保持正确"""
+        result = SegmentationResult(self.label_map, self.image)
+        result.SEGMENT_CACHE_SIZE = 1
+
+        features = result.compute_segment_features(1)
+        features['area'] = -1  # 修改返回值不影响缓存
+        self.assertEqual(result.compute_segment_features(1)['area'], 8)
+        np.testing.assert_array_equal(result.get_segment_mask(0), self.label_map == 0)
+        np.testing.assert_array_equal(result.get_segment_mask(1), self.label_map == 1)
+        self.assertEqual(len(result._window_cache), 1)
+
+        result.label_map = np.zeros((4, 4), dtype=np.int32)
+        self.assertEqual(result.compute_segment_features(0)['area'], 16)
+        self.assertEqual(result.compute_segment_features(1)['area'], 0)
+
+    def test_label_map_edits_invalidate_cache(self):
+        """测试替换标签图或原地修改后调用invalidate_cache，缓存的索引和特征随之更新"""
+        result = SegmentationResult(self.label_map.copy(), self.image)
+        self.assertEqual(result.compute_segment_features(1)['area'], 8)
+        self.assertEqual(result._label_perimeters().tolist(), [4, 4])
+        
+        result.label_map[0, 0] = 2
+        result.invalidate_cache()
+        self.assertEqual(result.compute_segment_features(0)['area'], 7)
+        self.assertEqual(result.compute_segment_features(2)['area'], 1)
+        np.testing.assert_array_equal(result.get_segment_mask(2), result.label_map == 2)
+        self.assertEqual(len(result._label_perimeters()), 3)
+        
+        result.label_map = np.ones((4, 4), dtype=np.int32)
+        self.assertEqual(result.compute_segment_features(1)['area'], 16)
+        self.assertEqual(result.compute_segment_features(0)['area'], 0)
+    
+    def test_region_variance_and_consistency(self):
+        """测试按标签批量统计的区域方差和一致性与逐区域计算一致"""
+        image = np.random.randint(0, 255, (20, 30, 3), dtype=np.uint8)
+        label_map = np.random.randint(0, 5, (20, 30))
+        label_map[0, 0] = 9  # 单像素区域不参与统计
+        result = SegmentationResult(label_map, image)
+        
+        regions = [image[label_map == label] for label in np.unique(label_map)]
+        regions = [region for region in regions if len(region) > 1]
+        sizes = np.array([len(region) for region in regions])
+        expected_variance = np.sum([np.var(region) for region in regions] * sizes) / sizes.sum()
+        expected_consistency = np.sum(
+            [1.0 / (1.0 + np.mean(np.std(region, axis=0))) for region in regions] * sizes
+        ) / label_map.size
+        
+        self.assertAlmostEqual(result._compute_intra_region_variance(), expected_variance, places=6)
+        self.assertAlmostEqual(result._compute_segmentation_consistency(), expected_consistency, places=9)
+    
+    def test_region_statistics_with_label_gaps(self):
+        """测试标签不连续时区域方差和一致性不产生RuntimeWarning"""
+        import warnings
+        
+        image = np.random.randint(0, 255, (20, 30, 3), dtype=np.uint8)
+        label_map = np.random.randint(0, 3, (20, 30)) * 50 + 7
+        result = SegmentationResult(label_map, image)
+        
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            variance = result._compute_intra_region_variance()
+            consistency = result._compute_segmentation_consistency()
+        self.assertTrue(np.isfinite(variance) and np.isfinite(consistency))
+
+
+class TestSegmentationMetrics(unittest.TestCase):
+    """分割评估指标测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.metrics = SegmentationMetrics()
+        rng = np.random.default_rng(0)
+        self.predicted = rng.integers(0, 6, (40, 50))
+        self.ground_truth = rng.integers(0, 8, (40, 50))
+    
+    def _label_pairs(self):
+        """覆盖各种特殊情况的 (预测标签图, 真实标签图) 组合"""
+        return {
+            'random': (self.predicted, self.ground_truth),
+            'identical': (self.ground_truth, self.ground_truth.copy()),
+            'single_predicted': (np.zeros_like(self.ground_truth), self.ground_truth),
+            'single_ground_truth': (self.predicted, np.full_like(self.predicted, 3)),
+            'both_single': (np.zeros((40, 50), dtype=int), np.ones((40, 50), dtype=int)),
+            'all_unique': (np.arange(2000).reshape(40, 50), self.ground_truth),
+            'negative_offset': (self.predicted - 1000, self.ground_truth * -3 + 7),
+            'sparse_values': (self.predicted * 1000003, self.ground_truth),
+        }
+    
+    @unittest.skipUnless(SKLEARN_AVAILABLE, "需要scikit-learn")
+    def test_ari_nmi_match_sklearn(self):
+        """测试由混淆矩阵计算的ARI和NMI与sklearn一致"""
+        for name, (predicted, ground_truth) in self._label_pairs().items():
+            with self.subTest(name):
+                confusion = self.metrics._confusion(predicted, ground_truth)
+                self.assertAlmostEqual(
+                    self.metrics._adjusted_rand_from_confusion(confusion),
+                    sklearn_metrics.adjusted_rand_score(ground_truth.ravel(), predicted.ravel()),
+                    places=10
+                )
+                self.assertAlmostEqual(
+                    self.metrics._normalized_mutual_info_from_confusion(confusion),
+                    sklearn_metrics.normalized_mutual_info_score(ground_truth.ravel(), predicted.ravel()),
+                    places=10
+                )
+
+    
+    def test_overlap_metrics_match_per_label(self):
+        """测试混淆矩阵及由其计算的IoU、F1和Dice与逐标签构造掩码的定义一致"""
+        pairs = self._label_pairs()
+        predicted = self.predicted.copy()
+        predicted[:5] = 9       # 只出现在预测中的标签
+        ground_truth = self.ground_truth.copy()
+        ground_truth[-5:] = -4  # 只出现在真实标签中的标签
+        pairs['disjoint_labels'] = (predicted, ground_truth)
+        
+        for name, (predicted, ground_truth) in pairs.items():
+            with self.subTest(name):
+                labels, inverse = np.unique(np.concatenate([predicted.ravel(), ground_truth.ravel()]),
+                                            return_inverse=True)
+                expected_confusion = np.zeros((labels.size, labels.size), dtype=np.int64)
+                np.add.at(expected_confusion, (inverse[:predicted.size], inverse[predicted.size:]), 1)
+                confusion = self.metrics._confusion(predicted, ground_truth)
+                np.testing.assert_array_equal(confusion.toarray(), expected_confusion)
+                
+                ious, f1_scores, dice_scores = [], [], []
+                for label in labels:
+                    pred_mask, gt_mask = predicted == label, ground_truth == label
+                    intersection = np.sum(pred_mask & gt_mask)
+                    ious.append(intersection / np.sum(pred_mask | gt_mask))
+                    if not gt_mask.any():
+                        continue
+                    dice_scores.append(2.0 * intersection / (pred_mask.sum() + gt_mask.sum()))
+                    precision = intersection / pred_mask.sum() if pred_mask.any() else 0
+                    recall = intersection / gt_mask.sum()
+                    if precision + recall > 0:
+                        f1_scores.append(2 * precision * recall / (precision + recall))
+                
+                self.assertAlmostEqual(self.metrics._mean_iou_from_confusion(confusion),
+                                       np.mean(ious), places=12)
+                self.assertAlmostEqual(self.metrics._f1_from_confusion(confusion),
+                                       np.mean(f1_scores) if f1_scores else 0.0, places=12)
+                self.assertAlmostEqual(self.metrics._dice_from_confusion(confusion),
+                                       np.mean(dice_scores), places=12)
+
+    
+    def test_boundary_recall_matches_sobel(self):
+        """测试按8邻域比较标签得到的边界召回率与旧版Sobel边界检测一致"""
+        import cv2
+        
+        rng = np.random.default_rng(0)
+        for i in range(5):
+            with self.subTest(i=i):
+                label_map = np.kron(rng.integers(0, 5, (12, 16)), np.ones((5, 5), dtype=int))
+                blocks = np.kron(rng.integers(0, 256, (12, 16, 3)), np.ones((5, 5, 1)))
+                image = np.clip(blocks + rng.normal(0, 20, blocks.shape), 0, 255).astype(np.uint8)
+                
+                label_float = label_map.astype(np.float32)
+                grad_x = cv2.Sobel(label_float, cv2.CV_32F, 1, 0, ksize=3)
+                grad_y = cv2.Sobel(label_float, cv2.CV_32F, 0, 1, ksize=3)
+                sobel_boundaries = np.sqrt(grad_x ** 2 + grad_y ** 2) > 0
+                with patch.object(self.metrics, '_find_boundaries', return_value=sobel_boundaries):
+                    expected = self.metrics.compute_boundary_recall(image, label_map)
+                
+                self.assertEqual(self.metrics.compute_boundary_recall(image, label_map), expected)
+    
+    @unittest.skipUnless(_metrics_numba.NUMBA_AVAILABLE, "需要Numba")
+    def test_region_sums_match_fallback(self):
+        """测试Numba内核得到的方差、一致性和紧凑性与bincount/_find_boundaries回退路径一致"""
+        rng = np.random.default_rng(1)
+        color = rng.integers(0, 256, (37, 23, 3), dtype=np.uint8)
+        gray = rng.integers(0, 256, (37, 23), dtype=np.uint8)
+        blocks = np.kron(rng.integers(0, 6, (8, 5)), np.ones((5, 5), dtype=int))[:37, :23]
+        many = rng.integers(0, 300, (37, 23))
+        num_many = np.unique(many).size
+        
+        # (图像, 标签图, 线程数, 分块累加的区域上限, 期望分块数)
+        cases = {
+            'color_chunks': (color, blocks, 4, _metrics_numba._MAX_PARTIAL_REGIONS, 4),
+            'gray_chunks': (gray, blocks * 7 - 3, 3, _metrics_numba._MAX_PARTIAL_REGIONS, 3),
+            'capped_chunks': (color, many, 4, 2 * num_many, 2),
+            'capped_single': (gray, many, 4, num_many - 1, 1),
+        }
+        keys = ('intra_region_variance', 'segmentation_consistency', 'region_compactness')
+        for name, (image, label_map, threads, cap, expected_chunks) in cases.items():
+            with self.subTest(name):
+                kernel = Mock(wraps=_metrics_numba._region_sums)
+                with patch.object(_metrics_numba, 'get_num_threads', return_value=threads), \
+                        patch.object(_metrics_numba, '_MAX_PARTIAL_REGIONS', cap), \
+                        patch.object(_metrics_numba, '_region_sums', kernel):
+                    fast = SegmentationMetrics().compute_unsupervised_metrics(image, label_map)
+                self.assertEqual(kernel.call_args[0][3], expected_chunks)
+                
+                with patch('evaluation.metrics.NUMBA_AVAILABLE', False):
+                    slow = SegmentationMetrics().compute_unsupervised_metrics(image, label_map)
+                for key in keys:
+                    self.assertAlmostEqual(fast[key], slow[key], delta=1e-9 * max(1.0, abs(slow[key])))
+
+
+class TestAlgorithmComparator(unittest.TestCase):
+    """算法对比器测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        rng = np.random.default_rng(0)
+        self.test_image = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+        self.algorithms = [
+            {'name': 'Threshold', 'func': threshold_algorithm, 'params': {'threshold': 100}},
+            {'name': 'Grid', 'func': grid_algorithm, 'params': {'block': 10}},
+            {'name': 'Lambda', 'func': lambda image: {'label_map': np.zeros(image.shape[:2], dtype=int)}},
+        ]
+    
+    def test_parallel_profiling_matches_serial(self):
+        """测试进程池并行分析的结果与串行一致，无法序列化的算法被记录并回退，共享内存被释放"""
+        segments = {}
+        shm_names = []
+        real_shared_memory = comparison_tools.shared_memory.SharedMemory
+        
+        def track_shared_memory(*args, **kwargs):
+            shm = real_shared_memory(*args, **kwargs)
+            shm_names.append(shm.name)
+            return shm
+        
+        for max_workers in (1, 2):
+            with patch.object(comparison_tools.shared_memory, 'SharedMemory',
+                              side_effect=track_shared_memory), \
+                    patch.object(comparison_tools, 'get_global_logger') as get_logger_mock:
+                result = comparison_tools.AlgorithmComparator().compare_algorithms(
+                    self.algorithms, self.test_image, save_results=False, max_workers=max_workers
+                )
+            segments[max_workers] = result['algorithm_results']
+        
+        # 只有并行运行时创建共享内存，且结束后已unlink
+        self.assertEqual(len(shm_names), 1)
+        with self.assertRaises(FileNotFoundError):
+            real_shared_memory(name=shm_names[0])
+        
+        # 无法序列化的lambda被记录为警告
+        warnings = [call[0][0] for call in get_logger_mock.return_value.warning.call_args_list]
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('Lambda', warnings[0])
+        
+        for name in ('Threshold', 'Grid', 'Lambda'):
+            serial, parallel = segments[1][name], segments[2][name]
+            self.assertTrue(serial['success'] and parallel['success'])
+            np.testing.assert_array_equal(serial['label_map'], parallel['label_map'])
+            self.assertEqual(serial['metrics'], parallel['metrics'])
+    
+    def test_save_results_releases_figure(self):
+        """测试保存结果后关闭的比较图不留在图形缓存中"""
+        comparator = comparison_tools.AlgorithmComparator()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            comparator.compare_algorithms(self.algorithms[:2], self.test_image,
+                                          save_results=True, output_dir=temp_dir)
+            self.assertTrue(list(Path(temp_dir).glob('comparison_*.png')))
+        self.assertEqual(comparator._figure_cache, {})
+
 class TestConfigManager(unittest.TestCase):
     """配置管理器测试"""
     
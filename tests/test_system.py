@@ -121,7 +121,7 @@ def test_data_structures():
     uf.union_pixels((0, 1), (1, 1), 1.5)
     
     # 检查连通性
-    assert uf.connected(uf.pixel_to_idx[(0, 0)], uf.pixel_to_idx[(1, 1)])
+    assert uf.connected(0 * uf.width + 0, 1 * uf.width + 1)
     
     # 获取分割图
     label_map = uf.get_segmentation_map()